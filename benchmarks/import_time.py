@@ -0,0 +1,85 @@
+"""
+Import-time benchmark of the CLI, based on python -X importtime.
+
+Runs the light commands of bloodhound-automation.py several times, sums the time spent importing
+the modules loaded by the script itself (interpreter startup excluded) and fails when the median
+exceeds the budget or when a heavy module is imported by a command that does not need it.
+
+usage: python3 benchmarks/import_time.py [--runs 5] [--budget-ms 60] [--json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "bloodhound-automation.py"
+
+# Commands measured, with the modules they must not import
+SCENARIOS = {
+    "--help": ["--help"],
+    "list": ["list"],
+    "start --help": ["start", "--help"],
+    "data --help": ["data", "--help"],
+}
+FORBIDDEN_MODULES = ["requests", "urllib3", "subprocess", "zipfile", "concurrent.futures", "src.project"]
+
+
+def measure(argv: list) -> tuple:
+    """
+    Run the CLI once, return the cumulative import time in ms and the modules imported by the script
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", str(SCRIPT), *argv],
+                            cwd=SCRIPT.parent, capture_output=True, text=True)
+    total_us, modules, after_site = 0, [], False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        top_level = not name[1:].startswith(" ")
+        name = name.strip()
+        if top_level and name == "site":
+            after_site = True
+            continue
+        if after_site:
+            modules.append(name)
+            if top_level:
+                total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time benchmark of the CLI")
+    parser.add_argument('--runs', type=int, default=5, help="Number of runs per command (default: 5)")
+    parser.add_argument('--budget-ms', type=float, default=60, help="Maximum median import time per command in ms (default: 60)")
+    parser.add_argument('--json', action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for scenario, argv in SCENARIOS.items():
+        timings, modules = [], []
+        for _ in range(args.runs):
+            elapsed, modules = measure(argv)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        forbidden = [module for module in FORBIDDEN_MODULES if module in modules]
+        over_budget = median > args.budget_ms
+        failed |= over_budget or bool(forbidden)
+        results[scenario] = {"median_ms": round(median, 2), "min_ms": round(min(timings), 2),
+                             "budget_ms": args.budget_ms, "forbidden_imports": forbidden,
+                             "ok": not over_budget and not forbidden}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for scenario, result in results.items():
+            status = "OK" if result["ok"] else "FAIL"
+            print(f"[{status}] {scenario:<14} median {result['median_ms']:7.2f} ms  min {result['min_ms']:7.2f} ms  "
+                  f"(budget {args.budget_ms} ms){'  forbidden: ' + ', '.join(result['forbidden_imports']) if result['forbidden_imports'] else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
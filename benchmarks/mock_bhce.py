@@ -0,0 +1,261 @@
+"""
+Local stand-in for the BloodHound CE API, used by the benchmarks instead of docker.
+
+Implements the endpoints called by the script (login, self, version, password reset, feature toggle,
+file uploads and their jobs, clear-database, Prometheus metrics) with a configurable latency per request, a bandwidth
+limit on the upload bodies and an ingestion delay once a batch is ended.
+
+usage: python3 benchmarks/mock_bhce.py [--port 8080] [--latency 0] [--bandwidth 0] [--ingest-delay 1]
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+READ_SIZE = 64 * 1024
+
+# Upload job statuses, as returned by BloodHound
+JOB_RUNNING = 0
+JOB_COMPLETE = 2
+JOB_INGESTING = 6
+
+
+class MockBloodHound(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0, bandwidth: int = 0, ingest_delay: float = 1, ingest_rate: int = 0):
+        """
+        Mock BloodHound server. latency is added to every response (seconds), bandwidth limits the upload bodies
+        (bytes per second and per connection, 0 for unlimited), an ended batch is ingested after ingest_delay seconds
+        plus its size divided by ingest_rate (bytes per second, 0 for instant)
+        """
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ingest_delay = ingest_delay
+        self.ingest_rate = ingest_rate
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # Set once a batch was ingested, until the database is cleared
+        self.holds_data = False
+        self.requests = 0
+        self.bytes_received = 0
+
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+    def start(self) -> "MockBloodHound":
+        """
+        Serve in a background thread
+        """
+        threading.Thread(target=self.serve_forever, name="mock-bhce", daemon=True).start()
+        return self
+
+
+    def newJob(self) -> dict:
+        with self.lock:
+            job_id = len(self.jobs) + 1
+            self.jobs[job_id] = {"id": job_id, "status": JOB_RUNNING, "status_message": "Running",
+                                 "bytes": 0, "files": 0, "ended_at": None, "completed_at": None}
+            return self.jobs[job_id]
+
+
+    def refreshJobs(self) -> None:
+        """
+        Complete the jobs whose ingestion time has passed
+        """
+        now = time.time()
+        with self.lock:
+            for job in self.jobs.values():
+                if job["status"] == JOB_INGESTING and now >= job["completed_at"]:
+                    job["status"], job["status_message"] = JOB_COMPLETE, "Complete"
+                    self.holds_data = self.holds_data or job["files"] > 0
+
+
+    def job(self, job_id: int) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+    def readChunks(self):
+        """
+        Yield the request body as it is received, throttled to the bandwidth of the server
+        """
+        start, received = time.monotonic(), 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                while size:
+                    data = self.rfile.read(min(size, READ_SIZE))
+                    size -= len(data)
+                    received += len(data)
+                    self.throttle(start, received)
+                    yield data
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining:
+                data = self.rfile.read(min(remaining, READ_SIZE))
+                if not data:
+                    break
+                remaining -= len(data)
+                received += len(data)
+                self.throttle(start, received)
+                yield data
+
+
+    def throttle(self, start: float, received: int) -> None:
+        if self.server.bandwidth:
+            delay = received / self.server.bandwidth - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+    def readBody(self) -> bytes:
+        return b"".join(self.readChunks())
+
+
+    def reply(self, code: int, data=None) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = json.dumps({"data": data}).encode() if data is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        self.server.refreshJobs()
+        path, _, query = self.path.partition("?")
+        if path == "/api/version":
+            return self.reply(200, {"server_version": "v0.0.0-mock", "API": {"current_version": "v2"}})
+        if path == "/metrics":
+            return self.metrics()
+        if path == "/api/v2/self":
+            return self.reply(200, {"id": "00000000-0000-0000-0000-000000000001"})
+        if path == "/api/v2/file-upload":
+            jobs = sorted(self.server.jobs.values(), key=lambda job: -job["id"])
+            if query.startswith("id=eq:"):
+                jobs = [job for job in jobs if str(job["id"]) == query[len("id=eq:"):].split("&")[0]]
+            return self.reply(200, [{"id": job["id"], "status": job["status"], "status_message": job["status_message"]} for job in jobs])
+        self.reply(404)
+
+
+    def metrics(self) -> None:
+        """
+        Serve a few counters in the Prometheus text format, like the metrics port of BloodHound
+        """
+        with self.server.lock:
+            ingesting = sum(1 for job in self.server.jobs.values() if job["status"] == JOB_INGESTING)
+            ingested = sum(job["bytes"] for job in self.server.jobs.values() if job["status"] == JOB_COMPLETE)
+        body = (f"# TYPE mock_requests_total counter\nmock_requests_total {self.server.requests}\n"
+                f"mock_received_bytes_total {self.server.bytes_received}\n"
+                f"mock_ingested_bytes_total {ingested}\n"
+                f"mock_jobs_ingesting {ingesting}\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_POST(self) -> None:
+        self.server.requests += 1
+        path = self.path.partition("?")[0]
+        if path == "/api/v2/login":
+            self.readBody()
+            return self.reply(200, {"session_token": "mock.eyJleHAiOjQxMDI0NDQ4MDB9.token", "user_id": "00000000-0000-0000-0000-000000000001"})
+        if path == "/api/v2/clear-database":
+            self.readBody()
+            self.server.holds_data = False
+            return self.reply(204)
+        if path == "/api/v2/graphs/cypher":
+            self.readBody()
+            self.server.refreshJobs()
+            # Like BloodHound, a query without any result is answered with a 404
+            if not self.server.holds_data:
+                return self.reply(404)
+            return self.reply(200, {"nodes": {"1": {"kind": "User", "objectId": "S-1-5-21-1-2-3-1001"}}, "edges": []})
+        if path == "/api/v2/file-upload/start":
+            self.readBody()
+            return self.reply(201, {k: v for k, v in self.server.newJob().items() if k in ("id", "status", "status_message")})
+        if path.startswith("/api/v2/file-upload/"):
+            parts = path.split("/")
+            job = self.server.job(int(parts[4])) if parts[4].isdigit() else None
+            if job is None:
+                self.readBody()
+                return self.reply(404)
+            if len(parts) > 5 and parts[5] == "end":
+                self.readBody()
+                with self.server.lock:
+                    job["ended_at"] = time.time()
+                    ingest = self.server.ingest_delay + (job["bytes"] / self.server.ingest_rate if self.server.ingest_rate else 0)
+                    job["completed_at"] = job["ended_at"] + ingest
+                    job["status"], job["status_message"] = JOB_INGESTING, "Ingesting"
+                return self.reply(200)
+            return self.upload(job)
+        self.readBody()
+        self.reply(404)
+
+
+    def upload(self, job: dict) -> None:
+        """
+        Receive a json file, only counting its decompressed size
+        """
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.headers.get("Content-Encoding") == "gzip" else None
+        size = 0
+        for data in self.readChunks():
+            self.server.bytes_received += len(data)
+            size += len(decompressor.decompress(data)) if decompressor is not None else len(data)
+        with self.server.lock:
+            job["bytes"] += size
+            job["files"] += 1
+        self.reply(202)
+
+
+    def do_PUT(self) -> None:
+        self.server.requests += 1
+        self.readBody()
+        self.reply(200, {})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock BloodHound CE server")
+    parser.add_argument('--port', type=int, default=8080, help="Listening port (default: 8080)")
+    parser.add_argument('--latency', type=float, default=0, help="Latency added to every response in seconds (default: 0)")
+    parser.add_argument('--bandwidth', type=int, default=0, help="Upload bandwidth per connection in bytes per second, 0 for unlimited (default: 0)")
+    parser.add_argument('--ingest-delay', type=float, default=1, help="Seconds taken by the ingestion of an ended batch (default: 1)")
+    parser.add_argument('--ingest-rate', type=int, default=0, help="Ingested bytes per second on top of the delay, 0 for instant (default: 0)")
+    args = parser.parse_args()
+
+    server = MockBloodHound(args.port, args.latency, args.bandwidth, args.ingest_delay, args.ingest_rate)
+    print(f"Mock BloodHound listening on http://127.0.0.1:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
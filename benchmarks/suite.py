@@ -0,0 +1,177 @@
+"""
+Benchmark suite of the upload, the ingestion tracking and the startup handshake, against the mock BloodHound
+server of mock_bhce.py. Neither docker nor the network is needed.
+
+A synthetic SharpHound zip is generated (or given with --zip), then each scenario runs in its own process
+so that its peak RSS is measured alone:
+  * upload : Project.uploadJSON of the whole zip, for each number of workers and compression mode.
+             Reports the throughput, the peak RSS and the delay between the end of the ingestion on the
+             server and its detection by the script
+  * start  : the handshake of Project.start once the containers are up (temporary password, login,
+             password reset, version and feature toggle)
+
+The results are printed (or written with --out) as JSON, to be compared across commits.
+
+usage: python3 benchmarks/suite.py [--objects 20000] [--workers 1 4] [--compress none gzip] [--repeat 3]
+                                   [--latency 0.002] [--bandwidth 0] [--ingest-delay 1] [--out results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from mock_bhce import MockBloodHound
+from synthetic_zip import generateZip
+
+ROOT = Path(__file__).resolve().parent.parent
+# Metrics whose median is reported for every scenario
+METRICS = ["seconds", "upload_bytes_per_second", "wire_bytes_per_second", "objects_per_second", "ingest_detect_seconds", "peak_rss_bytes"]
+
+
+def peakRSS() -> int:
+    """
+    Return the peak resident memory of the process in bytes, 0 where it cannot be read
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def runScenario(params: dict) -> dict:
+    """
+    Run one scenario in the current process, the output of the script being discarded
+    """
+    sys.path.insert(0, str(ROOT))
+    from src.project import Project
+
+    workdir = Path(tempfile.mkdtemp(prefix="bh-bench-"))
+    (workdir / "bench").mkdir()
+    project = Project(name="bench", source_directory=workdir, ports={"bolt": 7687, "neo4j": 7474, "web": params["port"]},
+                      password="Bench-Password-0!", timeout=60, no_gds=True)
+    # Same host as the mock, avoids trying ::1 first
+    project.base_url = f"http://127.0.0.1:{params['port']}"
+
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            start = time.monotonic()
+            if params["scenario"] == "upload":
+                encodings = [params["compress"]] + (["none"] if params["compress"] != "none" else [])
+                jsons = project.splitJSON(project.extractZip(params["zip"]), None, None)
+                summary = project.uploadJSON(jsons, workers=params["workers"], ingest_timeout=600, force=True, encodings=encodings)
+                result = {"seconds": time.monotonic() - start, "detected_at": time.time(), **summary}
+            else:
+                from src.readiness import Deadline, LogTail
+
+                log_path = workdir / "bench" / "logs.txt"
+                with open(log_path, "w") as log_file:
+                    log_file.write('{"level":"info","message":"# Initial Password Set To:    Temporary-Password-0!    #"}\n')
+                project.initialize(LogTail(log_path), Deadline(60), None)
+                result = {"seconds": time.monotonic() - start}
+        finally:
+            sys.stdout = stdout
+            shutil.rmtree(workdir, ignore_errors=True)
+    result["peak_rss_bytes"] = peakRSS()
+    return result
+
+
+def runChild(params: dict, server: MockBloodHound) -> dict:
+    """
+    Run a scenario in a new process and complete its result with what the server observed
+    """
+    output = subprocess.run([sys.executable, __file__, "--child", json.dumps(params)], capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"scenario {params['scenario']} failed:\n{output.stderr}")
+    result = json.loads(output.stdout.splitlines()[-1])
+    job = server.job(result.get("upload_id") or 0)
+    if job is not None and job["completed_at"]:
+        result["ingest_detect_seconds"] = max(result.pop("detected_at") - job["completed_at"], 0)
+    result.pop("detected_at", None)
+    return result
+
+
+def gitCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark suite against a mock BloodHound server")
+    parser.add_argument('--objects', type=int, default=20000, help="Number of objects of the synthetic zip (default: 20000)")
+    parser.add_argument('--zip', type=str, default=None, help="Benchmark this SharpHound zip instead of a synthetic one")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="Upload workers to benchmark (default: 1 4)")
+    parser.add_argument('--compress', choices=["none", "gzip", "zip"], nargs='+', default=["none", "gzip"], help="Compression modes to benchmark (default: none gzip)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario, the median is reported (default: 3)")
+    parser.add_argument('--latency', type=float, default=0.002, help="Latency of the mock server in seconds (default: 0.002)")
+    parser.add_argument('--bandwidth', type=int, default=0, help="Upload bandwidth of the mock server in bytes per second, 0 for unlimited (default: 0)")
+    parser.add_argument('--ingest-delay', type=float, default=1, help="Ingestion time of a batch on the mock server in seconds (default: 1)")
+    parser.add_argument('--skip-start', action="store_true", help="Do not benchmark the startup handshake")
+    parser.add_argument('--out', type=str, default=None, help="Write the JSON results to this file instead of stdout")
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(runScenario(json.loads(args.child))))
+        return 0
+
+    server = MockBloodHound(latency=args.latency, bandwidth=args.bandwidth, ingest_delay=args.ingest_delay).start()
+    with tempfile.TemporaryDirectory(prefix="bh-bench-zip-") as tmp_dir:
+        zip_path = args.zip
+        generated = None
+        if zip_path is None:
+            zip_path = str(Path(tmp_dir) / "synthetic.zip")
+            start = time.monotonic()
+            counts = generateZip(Path(zip_path), args.objects)
+            generated = {"objects": sum(counts.values()), "seconds": round(time.monotonic() - start, 3),
+                         "zip_bytes": os.path.getsize(zip_path)}
+            print(f"Generated {generated['objects']} objects in {generated['seconds']}s", file=sys.stderr)
+
+        scenarios = [{"scenario": "upload", "workers": workers, "compress": compress}
+                     for workers in args.workers for compress in args.compress]
+        if not args.skip_start:
+            scenarios.append({"scenario": "start"})
+
+        results = []
+        for scenario in scenarios:
+            runs = [runChild({**scenario, "zip": zip_path, "port": server.port}, server) for _ in range(args.repeat)]
+            median = {metric: round(statistics.median(run[metric] for run in runs), 3)
+                      for metric in METRICS if all(metric in run for run in runs)}
+            results.append({**scenario, "median": median, "runs": runs})
+            print(f"{json.dumps(scenario)} {json.dumps(median)}", file=sys.stderr)
+
+    report = {
+        "commit": gitCommit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"objects": args.objects, "zip": args.zip, "latency": args.latency, "bandwidth": args.bandwidth,
+                   "ingest_delay": args.ingest_delay, "repeat": args.repeat},
+        "synthetic_zip": generated,
+        "scenarios": results,
+    }
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(report, out_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Synthetic SharpHound zip generator.
+
+Writes a zip holding users, computers, groups, OUs, GPOs and domains json files in the SharpHound v5
+format. The objects are streamed into the archive, so millions of them need no more memory than a few.
+
+usage: python3 benchmarks/synthetic_zip.py --objects 1000000 --out big.zip
+"""
+import argparse
+import json
+import zipfile
+
+from pathlib import Path
+
+DOMAIN = "BENCH.LOCAL"
+DOMAIN_SID = "S-1-5-21-1004336348-1177238915-682003330"
+COMPRESS_LEVEL = 3
+
+# Share of the objects of each type
+TYPE_SHARES = {
+    "users": 0.45,
+    "computers": 0.30,
+    "groups": 0.20,
+    "ous": 0.03,
+    "gpos": 0.02,
+}
+
+
+def sid(rid: int) -> str:
+    return f"{DOMAIN_SID}-{rid}"
+
+
+def userObject(rid: int) -> dict:
+    name = f"USER{rid}@{DOMAIN}"
+    return {
+        "Properties": {"domain": DOMAIN, "name": name, "distinguishedname": f"CN=USER{rid},CN=USERS,DC=BENCH,DC=LOCAL",
+                       "domainsid": DOMAIN_SID, "enabled": rid % 10 != 0, "pwdlastset": 1700000000 + rid,
+                       "lastlogon": 1700000000 + rid * 7, "hasspn": rid % 50 == 0, "admincount": rid % 200 == 0,
+                       "description": None, "samaccountname": f"user{rid}"},
+        "AllowedToDelegate": [], "PrimaryGroupSID": sid(513), "HasSIDHistory": [], "SPNTargets": [],
+        "Aces": [{"RightName": "GenericAll", "IsInherited": False, "PrincipalSID": sid(512), "PrincipalType": "Group"}],
+        "ObjectIdentifier": sid(rid), "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def computerObject(rid: int) -> dict:
+    name = f"HOST{rid}.{DOMAIN}"
+    return {
+        "Properties": {"domain": DOMAIN, "name": name, "distinguishedname": f"CN=HOST{rid},CN=COMPUTERS,DC=BENCH,DC=LOCAL",
+                       "domainsid": DOMAIN_SID, "enabled": True, "operatingsystem": "Windows Server 2019 Standard",
+                       "unconstraineddelegation": rid % 500 == 0, "samaccountname": f"HOST{rid}$"},
+        "PrimaryGroupSID": sid(515), "AllowedToDelegate": [], "AllowedToAct": [], "HasSIDHistory": [],
+        "Sessions": {"Results": [{"UserSID": sid(rid - 1), "ComputerSID": sid(rid)}], "Collected": True, "FailureReason": None},
+        "LocalAdmins": {"Results": [{"ObjectIdentifier": sid(512), "ObjectType": "Group"}], "Collected": True, "FailureReason": None},
+        "Aces": [], "ObjectIdentifier": sid(rid), "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def groupObject(rid: int, user_rids: range) -> dict:
+    # Each group holds a slice of the users, so that the graph has edges to ingest
+    members = [{"ObjectIdentifier": sid(user_rids.start + (rid * 7 + i) % max(len(user_rids), 1)), "ObjectType": "User"}
+               for i in range(min(10, len(user_rids)))]
+    return {
+        "Properties": {"domain": DOMAIN, "name": f"GROUP{rid}@{DOMAIN}", "domainsid": DOMAIN_SID,
+                       "distinguishedname": f"CN=GROUP{rid},CN=USERS,DC=BENCH,DC=LOCAL", "admincount": False},
+        "Members": members, "Aces": [], "ObjectIdentifier": sid(rid), "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def ouObject(rid: int) -> dict:
+    return {
+        "Properties": {"domain": DOMAIN, "name": f"OU{rid}@{DOMAIN}", "domainsid": DOMAIN_SID,
+                       "distinguishedname": f"OU=OU{rid},DC=BENCH,DC=LOCAL", "blocksinheritance": False},
+        "Links": [], "ChildObjects": [], "GPOChanges": {"LocalAdmins": [], "RemoteDesktopUsers": [], "DcomUsers": [],
+                                                        "PSRemoteUsers": [], "AffectedComputers": []},
+        "Aces": [], "ObjectIdentifier": f"{rid:08X}-0000-0000-0000-000000000000", "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def gpoObject(rid: int) -> dict:
+    return {
+        "Properties": {"domain": DOMAIN, "name": f"GPO{rid}@{DOMAIN}", "domainsid": DOMAIN_SID,
+                       "distinguishedname": f"CN={{{rid:08X}}},CN=POLICIES,CN=SYSTEM,DC=BENCH,DC=LOCAL",
+                       "gpcpath": f"\\\\BENCH.LOCAL\\SYSVOL\\BENCH.LOCAL\\POLICIES\\{{{rid:08X}}}"},
+        "Aces": [], "ObjectIdentifier": f"{rid:08X}-1111-1111-1111-111111111111", "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def domainObject() -> dict:
+    return {
+        "Properties": {"domain": DOMAIN, "name": DOMAIN, "domainsid": DOMAIN_SID, "functionallevel": "2016",
+                       "distinguishedname": "DC=BENCH,DC=LOCAL"},
+        "Trusts": [], "Links": [], "ChildObjects": [], "GPOChanges": {"LocalAdmins": [], "RemoteDesktopUsers": [], "DcomUsers": [],
+                                                                      "PSRemoteUsers": [], "AffectedComputers": []},
+        "Aces": [], "ObjectIdentifier": DOMAIN_SID, "IsDeleted": False, "IsACLProtected": False,
+    }
+
+
+def writeFile(zip_ref: zipfile.ZipFile, name: str, data_type: str, objects) -> int:
+    """
+    Stream the objects into a json member of the zip, followed by its meta block. Return the number of objects
+    """
+    count = 0
+    with zip_ref.open(name, "w", force_zip64=True) as member:
+        member.write(b'{"data":[')
+        for obj in objects:
+            if count:
+                member.write(b",")
+            member.write(json.dumps(obj, separators=(",", ":")).encode())
+            count += 1
+        meta = {"methods": 521215, "type": data_type, "count": count, "version": 5}
+        member.write(b'],"meta":' + json.dumps(meta, separators=(",", ":")).encode() + b"}")
+    return count
+
+
+def generateZip(path: Path, objects: int, prefix: str = "20240101000000") -> dict:
+    """
+    Write a synthetic SharpHound zip of about the given number of objects, return the count per type
+    """
+    counts = {data_type: max(1, int(objects * share)) for data_type, share in TYPE_SHARES.items()}
+    rid = 1000
+    ranges = {}
+    for data_type, count in counts.items():
+        ranges[data_type] = range(rid, rid + count)
+        rid += count
+
+    generators = {
+        "users": lambda: (userObject(r) for r in ranges["users"]),
+        "computers": lambda: (computerObject(r) for r in ranges["computers"]),
+        "groups": lambda: (groupObject(r, ranges["users"]) for r in ranges["groups"]),
+        "ous": lambda: (ouObject(r) for r in ranges["ous"]),
+        "gpos": lambda: (gpoObject(r) for r in ranges["gpos"]),
+        "domains": lambda: iter([domainObject()]),
+    }
+    written = {}
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zip_ref:
+        for data_type, generator in generators.items():
+            written[data_type] = writeFile(zip_ref, f"{prefix}_{data_type}.json", data_type, generator())
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic SharpHound zip generator")
+    parser.add_argument('--objects', type=int, default=10000, help="Approximate number of objects (default: 10000)")
+    parser.add_argument('--out', type=str, required=True, help="Path of the zip to write")
+    args = parser.parse_args()
+
+    written = generateZip(Path(args.out), args.objects)
+    print(json.dumps({"path": args.out, "objects": sum(written.values()), "types": written}))
+
+
+if __name__ == "__main__":
+    main()
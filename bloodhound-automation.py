@@ -1,128 +1,662 @@
 import argparse
-import pickle
-import os
 import sys
 
 from pathlib import Path
-from colorama import Fore, Back, Style
+from typing import Optional
 
-from src.project import Project
-    
+# Only argparse is loaded up front: every command imports the modules it needs, so that
+# list or --help do not pay for the HTTP and docker layers
+PROJECT_DIR = Path(__file__).parent / "projects"
 
-if __name__=="__main__":
+# Body encodings tried for each --compress mode, in order of preference
+COMPRESSION_ENCODINGS = {
+    "auto": ["zip", "gzip", "none"],
+    "zip": ["zip", "none"],
+    "gzip": ["gzip", "none"],
+    "none": ["none"],
+}
+
+
+def byteSize(value: str) -> int:
+    """
+    Parse a size argument such as 512M
+    """
+    from src.utils import parseSize
+    return parseSize(value)
+
+
+def commaList(value: str) -> list:
+    """
+    Parse a comma separated argument such as users,groups
+    """
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def addSelectionArguments(parser: argparse.ArgumentParser, description: str) -> None:
+    """
+    Add the options selecting the SharpHound types and domains of a zip
+    """
+    parser_selection = parser.add_argument_group("selection", description)
+    parser_types = parser_selection.add_mutually_exclusive_group()
+    parser_types.add_argument('--types', type=commaList, required=False, default=None, help="Only ingest the json files of these SharpHound types (e.g. users,groups,computers)")
+    parser_types.add_argument('--exclude-types', type=commaList, required=False, default=None, help="Ingest every json file but the ones of these SharpHound types")
+    parser_domains = parser_selection.add_mutually_exclusive_group()
+    parser_domains.add_argument('--domains', type=commaList, required=False, default=None, help="Only ingest the objects of these domains, given by name or SID (e.g. CORP.LOCAL)")
+    parser_domains.add_argument('--exclude-domains', type=commaList, required=False, default=None, help="Ingest the objects of every domain but these ones")
+
+
+def buildParser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser
+    """
     parser = argparse.ArgumentParser(description="Automatically deploy a bloodhound instance and populate it with the SharpHound data")
     subparsers = parser.add_subparsers(dest='subparser', help="Action to run")
 
     # List
     parser_list = subparsers.add_parser('list', help="List existing projects")
+    parser_list.add_argument('--running', action="store_true", help="Only list the running projects")
+    parser_list.add_argument('--stopped', action="store_true", help="Only list the stopped projects")
 
     # Start
-    parser_start = subparsers.add_parser('start', help="Create a new project or start an existing one")
-    parser_start.add_argument('project', type=str, help="The project name")
+    parser_start = subparsers.add_parser('start', help="Create new projects or start existing ones")
+    parser_start.add_argument('project', type=str, nargs='+', help="The project name, several projects are started in parallel with automatically allocated ports")
     parser_start.add_argument('-bp', '--bolt-port', type=int, required=False, default=7687, help="The custom port for the bolt connection (default: 7687)")
     parser_start.add_argument('-np', '--neo4j-port', type=int, required=False, default=7474, help="The custom port for the neo4j connection (default: 7474)")
     parser_start.add_argument('-wp', '--web-port', type=int, required=False, default=8080, help="The custom port for the web app (default: 8080)")
+    parser_start.add_argument('-ap', '--auto-ports', action="store_true", help="Pick free ports, starting from the given ones, instead of using them as is (always on with several projects)")
+    parser_start.add_argument('--metrics-port', type=int, required=False, default=None, help="Publish the Prometheus endpoint of BloodHound on this port, sampled by data --metrics-out during the ingestion")
     parser_start.add_argument('-p', '--password', type=str, required=False, default="Chien2Sang<3", help="Custom password for the web interface (12 chars min. & all types of characters)")
     parser_start.add_argument('-t', '--timeout', type=int, required=False, default=180, help="The timeout delay while loading the container. Increase in case of low bandwidth (default: 180)")
     parser_start.add_argument('--no-gds', action="store_true", help="Create neo4j container without GDS plugin")
+    parser_start_memory = parser_start.add_mutually_exclusive_group()
+    parser_start_memory.add_argument('--profile', choices=["small", "large", "auto"], required=False, default=None, help="Size the neo4j heap, page cache and container memory: small (2G), large (16G) or auto, sharing the host memory with the other projects (default: neo4j defaults)")
+    parser_start_memory.add_argument('-m', '--memory', type=byteSize, required=False, default=None, help="Explicit memory budget of the neo4j container (e.g. 6G), instead of a profile")
+    parser_start.add_argument('--metrics-out', type=str, required=False, default=None, help="Write the duration of every phase of the startup to this JSON file")
+    parser_start.add_argument('-g', '--from-golden', action="store_true", help="Clone new projects from the golden template of the BHCE and Neo4j versions, built on first use, instead of initializing them")
+    parser_start.add_argument('--rebuild-golden', action="store_true", help="Build the golden template again before cloning it (implies --from-golden)")
     
     # Data
     parser_data = subparsers.add_parser('data', help="Feed data into the existing project")
     parser_data.add_argument('project', type=str, help="The project name")
     parser_data.add_argument('-z', '--zip', type=str, required=True, help="The zip file from SharpHound containing the json extracts")
+    parser_data.add_argument('-w', '--upload-workers', type=int, required=False, default=4, help="The number of json files uploaded in parallel (default: 4)")
+    parser_data.add_argument('-it', '--ingest-timeout', type=int, required=False, default=3600, help="The maximum time to wait for BloodHound to ingest the data, 0 to wait forever (default: 3600)")
+    parser_data.add_argument('-c', '--compress', choices=["auto", "zip", "gzip", "none"], required=False, default="none", help="Compress the uploads as zip archives or gzip bodies, auto picks the first one the server accepts. Falls back to plain json when refused (default: none)")
+    parser_data.add_argument('-f', '--force', action="store_true", help="Upload every json file, even the ones whose content was already ingested into the project")
+    parser_data.add_argument('--json', action="store_true", help="Print a JSON summary of the upload and ingestion metrics on stdout, the progress going to stderr")
+    parser_data.add_argument('--dry-run', action="store_true", help="Only scan the zip: validate every json file, count the objects per type and estimate the upload and ingestion durations, without uploading anything")
+    parser_data.add_argument('--check', action="store_true", help="Scan the zip like --dry-run before uploading it, and upload nothing if a json file would be rejected")
+    parser_data.add_argument('--max-chunk-objects', type=int, required=False, default=None, help="Split the json files holding more objects than this into several uploads")
+    parser_data.add_argument('--max-chunk-bytes', type=byteSize, required=False, default=None, help="Split the json files bigger than this size (e.g. 512M) into several uploads")
+    addSelectionArguments(parser_data, "Only ingest a part of the zip")
+    parser_data.add_argument('--ingest-slots', type=int, required=False, default=2, help="Ingestions run at once on this host, across every project and invocation, the others wait in a queue. 0 to bypass the queue (default: 2)")
+    parser_data.add_argument('--ingest-memory', type=byteSize, required=False, default=None, help="Only run ingestions at once while the memory budgets of their neo4j containers fit in this size (e.g. 24G)")
+    parser_data.add_argument('--priority', type=int, required=False, default=0, help="Priority of the ingestion in the host-wide queue, higher goes first (default: 0)")
+    parser_data.add_argument('--metrics-out', type=str, required=False, default=None, help="Write the duration of every phase (extraction, upload of each file, ingestion) and the samples of the BloodHound metrics to this JSON file")
+    parser_data.add_argument('--use-cache', action="store_true", help="Restore the dataset from the cache when this zip was already ingested, otherwise ingest it and save it into the cache")
+    parser_data.add_argument('--cache-max-size', type=byteSize, required=False, default="20G", help="Evict the least recently used datasets when the cache exceeds this size (default: 20G)")
+    parser_data.add_argument('--cache-max-age', type=int, required=False, default=30, help="Evict the datasets unused for this number of days (default: 30)")
+
+    # Watch
+    parser_watch = subparsers.add_parser('watch', help="Feed the SharpHound zips dropped into a directory to the project, as they arrive")
+    parser_watch.add_argument('project', type=str, help="The project name")
+    parser_watch.add_argument('directory', type=str, help="The directory where the zips are dropped")
+    parser_watch.add_argument('-w', '--upload-workers', type=int, required=False, default=4, help="The number of json files uploaded in parallel (default: 4)")
+    parser_watch.add_argument('-it', '--ingest-timeout', type=int, required=False, default=3600, help="The maximum time to wait for BloodHound to ingest a zip, 0 to wait forever (default: 3600)")
+    parser_watch.add_argument('-c', '--compress', choices=["auto", "zip", "gzip", "none"], required=False, default="none", help="Compress the uploads, see data --compress (default: none)")
+    parser_watch.add_argument('--max-chunk-objects', type=int, required=False, default=None, help="Split the json files holding more objects than this into several uploads")
+    parser_watch.add_argument('--max-chunk-bytes', type=byteSize, required=False, default=None, help="Split the json files bigger than this size (e.g. 512M) into several uploads")
+    parser_watch.add_argument('--ingest-slots', type=int, required=False, default=2, help="Ingestions run at once on this host, across every project and invocation, the others wait in a queue. 0 to bypass the queue (default: 2)")
+    parser_watch.add_argument('--ingest-memory', type=byteSize, required=False, default=None, help="Only run ingestions at once while the memory budgets of their neo4j containers fit in this size (e.g. 24G)")
+    parser_watch.add_argument('--priority', type=int, required=False, default=0, help="Priority of the ingestion in the host-wide queue, higher goes first (default: 0)")
+    parser_watch.add_argument('--interval', type=float, required=False, default=5, help="Seconds between two scans of the directory (default: 5)")
+    parser_watch.add_argument('--settle', type=float, required=False, default=10, help="Seconds a zip must be left unmodified before it is processed (default: 10)")
+    parser_watch.add_argument('--once', action="store_true", help="Process the zips already in the directory, then exit")
+    parser_watch.add_argument('--retry-failed', action="store_true", help="Process again the zips which failed on a previous run")
+
+    # Inspect
+    parser_inspect = subparsers.add_parser('inspect', help="Validate a SharpHound zip and report what it holds, without uploading it")
+    parser_inspect.add_argument('project', type=str, nargs='?', default=None, help="The project whose past runs estimate the upload and ingestion durations, and whose already ingested files are flagged")
+    parser_inspect.add_argument('-z', '--zip', type=str, required=True, help="The zip file from SharpHound containing the json extracts")
+    parser_inspect.add_argument('--json', action="store_true", help="Print a JSON report of every json file on stdout, the progress going to stderr")
+
+    # Restore
+    parser_restore = subparsers.add_parser('restore', help="Load a cached dataset into the project, without upload nor ingestion")
+    parser_restore.add_argument('project', type=str, help="The project name")
+    parser_restore_source = parser_restore.add_mutually_exclusive_group(required=True)
+    parser_restore_source.add_argument('-z', '--zip', type=str, help="The zip file of the cached dataset")
+    parser_restore_source.add_argument('-k', '--key', type=str, help="The key (or key prefix) of the cached dataset, as shown by the cache command")
+    parser_restore.add_argument('-f', '--force', action="store_true", help="Restore the dataset even if the project already holds data, which is replaced")
+    addSelectionArguments(parser_restore, "With --zip, the selection the dataset was cached with by data --use-cache")
+
+    # Cache
+    parser_cache = subparsers.add_parser('cache', help="List or evict the cached datasets")
+    parser_cache.add_argument('action', choices=["list", "evict", "clear"], nargs='?', default="list", help="List the cached datasets, evict the old ones or delete them all (default: list)")
+    parser_cache.add_argument('--max-size', type=byteSize, required=False, default="20G", help="Cache size kept by evict (default: 20G)")
+    parser_cache.add_argument('--max-age', type=int, required=False, default=30, help="Number of days an unused dataset is kept by evict (default: 30)")
+
+    # Query
+    parser_query = subparsers.add_parser('query', help="Run Cypher queries on the project's neo4j database over bolt")
+    parser_query.add_argument('project', type=str, help="The project name")
+    parser_query.add_argument('queries', type=str, nargs='+', help="The .cypher files to run, or directories holding them")
+    parser_query.add_argument('-o', '--out-dir', type=str, required=False, default="query-results", help="Directory where the results of each query are written (default: query-results)")
+    parser_query.add_argument('-f', '--format', choices=["jsonl", "csv"], required=False, default="jsonl", help="Format of the results (default: jsonl)")
+    parser_query.add_argument('-j', '--jobs', type=int, required=False, default=4, help="The number of queries run in parallel (default: 4)")
+    parser_query.add_argument('--no-cache', action="store_true", help="Run every query again, even when its results on the current data are cached")
+    parser_query.add_argument('--json', action="store_true", help="Print a JSON report of the queries on stdout, the progress going to stderr")
+    parser_query.add_argument('--metrics-out', type=str, required=False, default=None, help="Write the duration of every query to this JSON file")
 
     # Clear
     parser_clear = subparsers.add_parser('clear', help="Clear the project's data")
     parser_clear.add_argument('project', type=str, help="The project name")
 
     # Stop
-    parser_stop = subparsers.add_parser('stop', help="Stop the containers of the project")
-    parser_stop.add_argument('project', type=str, help="The project name")
+    parser_stop = subparsers.add_parser('stop', help="Stop the containers of projects")
+    parser_stop.add_argument('project', type=str, nargs='*', help="The project name, several projects are stopped in parallel")
+    parser_stop.add_argument('--all', action="store_true", help="Stop every running project")
 
     # Delete
-    parser_delete = subparsers.add_parser('delete', help="Delete the project and its containers")
-    parser_delete.add_argument('project', type=str, help="The project name")
+    parser_delete = subparsers.add_parser('delete', help="Delete projects, their containers and volumes")
+    parser_delete.add_argument('project', type=str, nargs='*', help="The project name, several projects are deleted in parallel")
+    parser_delete.add_argument('--all', action="store_true", help="Delete every project")
 
-    # No arguments
-    parser.parse_args(args=None if sys.argv[1:] else ['--help'])
-
-    args = parser.parse_args()
-
-    PROJECT_DIR = Path(__file__).parent / "projects"
-
-    if args.subparser == "list":
-        # List existing projects
-        projects = []
-        for root, dirs, files in os.walk(PROJECT_DIR):
-            if 'project.pkl' in files:
-                with open(root + "/project.pkl", "rb") as pkl_file:
-                    projects.append(pickle.load(pkl_file))
-        # Print project details
-        if len(projects) == 0:
-            print(Fore.YELLOW + "[*] No project yet" + Style.RESET_ALL)
-        c = 1
-        for project in projects:
-            print(Fore.GREEN + f"[{c}] {project.name}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * Name: {project.name}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * BHCE version: {project.bhce_version}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * Bolt port: {project.ports['bolt']}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * Neo4j port: {project.ports['neo4j']}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * Web port: {project.ports['web']}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * Password: {project.password}" + Style.RESET_ALL)
-            print(Fore.YELLOW + f"   * GDS plugin: {'False' if project.no_gds else 'True'}" + Style.RESET_ALL)
-            c += 1
-        
-
-    elif args.subparser == "start":
-        project = Project(name = args.project,
-                          source_directory = PROJECT_DIR,
-                          ports = {"neo4j": args.neo4j_port, "bolt": args.bolt_port, "web": args.web_port},
-                          password = args.password,
-                          timeout = args.timeout,
-                          no_gds = args.no_gds)
-        project.start()
-
-
-    elif args.subparser == "data":
+    return parser
+
+
+def ingestScheduler(args: argparse.Namespace):
+    """
+    Return the host-wide ingestion queue configured by the arguments, or None when it is bypassed
+    """
+    from src.scheduler import IngestScheduler
+
+    if args.ingest_slots < 1:
+        return None
+    return IngestScheduler(PROJECT_DIR, args.ingest_slots, args.ingest_memory, args.priority)
+
+
+def preflight(zip_file: str, project=None, ingest_filter=None, manifest=None) -> dict:
+    """
+    Scan a zip before any upload and print what it holds, with the estimated durations of its upload and ingestion into the project
+    """
+    import zipfile
+    from colorama import Fore, Style
+    from src.history import HISTORY_FILE, IngestHistory
+    from src.metrics import span
+    from src.preflight import inspectZip, printMember, printReport
+
+    print(Fore.YELLOW + f"[*] Scanning {zip_file}..." + Style.RESET_ALL)
+    try:
+        with span("preflight", zip=zip_file) as attributes:
+            report = inspectZip(zip_file, ingest_filter, manifest, printMember)
+            attributes.update({"files": len(report["files"]), "objects": report["objects"], "errors": report["errors"]})
+    except (OSError, zipfile.BadZipFile) as e:
+        print(Fore.RED + f"[-] Could not read the zip file {zip_file}: {e}" + Style.RESET_ALL)
+        exit(1)
+
+    report["estimate"] = None
+    if project is not None:
+        report["estimate"] = IngestHistory(PROJECT_DIR / project.name / HISTORY_FILE).estimate(report["upload_bytes"], report["upload_objects"])
+    printReport(report, report["estimate"])
+    if project is not None and report["estimate"] is None:
+        print(Fore.YELLOW + f"[*] No past run of {project.name} to estimate the upload and ingestion durations from" + Style.RESET_ALL)
+
+    report["valid"] = len(report["files"]) > 0 and report["errors"] == 0
+    if len(report["files"]) == 0:
+        print(Fore.RED + f"[-] There is no json file in {zip_file}" + Style.RESET_ALL)
+    elif report["errors"]:
+        rejected = sum(1 for file in report["files"] if file["errors"])
+        print(Fore.RED + f"[-] {rejected} json file(s) would be rejected by BloodHound" + Style.RESET_ALL)
+    else:
+        print(Fore.GREEN + f"[+] Every json file is valid" + Style.RESET_ALL)
+    return report
+
+
+def loadProject(name: str):
+    """
+    Load a registered project, or exit if it does not exist
+    """
+    from colorama import Fore, Style
+    from src.registry import Registry
+
+    entry = Registry(PROJECT_DIR).get(name)
+    if entry is None:
+        print(Fore.RED + f"The project {name} does not exist.")
+        print(Style.RESET_ALL + 'Exiting...')
+        exit(1)
+    return entry.load()
+
+
+def listCommand(args: argparse.Namespace) -> None:
+    """
+    List the registered projects
+    """
+    from colorama import Fore, Style
+    from src.registry import Registry
+
+    registry = Registry(PROJECT_DIR)
+    # List existing projects from the registry, without unpickling them
+    running = True if args.running else False if args.stopped else None
+    projects = registry.list(running=running)
+    # Print project details
+    if len(projects) == 0 and running is not None and registry.list():
+        print(Fore.YELLOW + "[*] No matching project" + Style.RESET_ALL)
+    elif len(projects) == 0:
+        print(Fore.YELLOW + "[*] No project yet" + Style.RESET_ALL)
+    c = 1
+    for project in projects:
+        print(Fore.GREEN + f"[{c}] {project.name}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Name: {project.name}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * BHCE version: {project.bhce_version}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Bolt port: {project.ports['bolt']}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Neo4j port: {project.ports['neo4j']}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Web port: {project.ports['web']}" + Style.RESET_ALL)
+        if project.ports.get("metrics"):
+            print(Fore.YELLOW + f"   * Metrics port: {project.ports['metrics']}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Password: {project.password}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * GDS plugin: {'False' if project.no_gds else 'True'}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"   * Running: {project.running}" + Style.RESET_ALL)
+        c += 1
+
+
+def startCommand(args: argparse.Namespace) -> None:
+    """
+    Start one project, or several in parallel
+    """
+    from colorama import Fore, Style
+    from src.parallel import runProjects
+    from src.metrics import span
+    from src.ports import DEFAULT_PORTS, allocatePorts, registeredPorts
+    from src.project import Project
+    from src.registry import Registry
+
+    names = list(dict.fromkeys(args.project))
+    base_ports = {"neo4j": args.neo4j_port, "bolt": args.bolt_port, "web": args.web_port}
+    if args.metrics_port:
+        base_ports["metrics"] = args.metrics_port
+    if len(names) == 1 and not args.auto_ports:
+        ports = [base_ports]
+    else:
         try:
-            with open(PROJECT_DIR / args.project / "project.pkl", "rb") as pkl_file:
-                project = pickle.load(pkl_file)
-        except FileNotFoundError:
-            print(Fore.RED + f"The project {args.project} does not exist.")
-            print(Style.RESET_ALL + 'Exiting...')
+            ports = allocatePorts(len(names), registeredPorts(PROJECT_DIR, exclude=names), base_ports)
+        except RuntimeError as e:
+            print(Fore.RED + f"[-] Could not allocate the ports: {e}" + Style.RESET_ALL)
             exit(1)
-        jsons = project.extractZip(args.zip)
-        project.uploadJSON(jsons)
-    
-    elif args.subparser == "clear":
-        try:
-            with open(PROJECT_DIR / args.project / "project.pkl", "rb") as pkl_file:
-                project = pickle.load(pkl_file)
-        except FileNotFoundError:
-            print(Fore.RED + f"The project {args.project} does not exist.")
-            print(Style.RESET_ALL + 'Exiting...')
+    memory = args.memory
+    if args.profile:
+        from src.profiles import formatSize, profileBudget
+
+        # The projects started now share the host with the other registered ones
+        others = [entry for entry in Registry(PROJECT_DIR).list() if entry.name not in names]
+        memory = profileBudget(args.profile, len(others) + len(names))
+        print(Fore.YELLOW + f"[*] Memory budget of neo4j with the {args.profile} profile : {formatSize(memory)}" + Style.RESET_ALL)
+    projects = [Project(name = name,
+                        source_directory = PROJECT_DIR,
+                        ports = project_ports,
+                        password = args.password,
+                        timeout = args.timeout,
+                        no_gds = args.no_gds,
+                        memory = memory)
+                for name, project_ports in zip(names, ports)]
+
+    golden = None
+    if args.from_golden or args.rebuild_golden:
+        from src.golden import GoldenTemplate
+
+        # Built once before the projects are started, so that they all clone the same template
+        golden = GoldenTemplate(PROJECT_DIR, args.no_gds)
+        if args.rebuild_golden or not golden.exists():
+            used = registeredPorts(PROJECT_DIR) | {port for project_ports in ports for port in project_ports.values()}
+            try:
+                with span("golden build", template=golden.key):
+                    golden.build(allocatePorts(1, used, DEFAULT_PORTS)[0], args.timeout, rebuild=args.rebuild_golden)
+            except RuntimeError as e:
+                print(Fore.RED + f"[-] Could not build the golden template {golden.key}: {e}" + Style.RESET_ALL)
+                exit(1)
+
+    if len(projects) == 1:
+        projects[0].start(golden)
+    else:
+        for project in projects:
+            print(Fore.YELLOW + f"[*] {project.name} : bolt {project.ports['bolt']}, neo4j {project.ports['neo4j']}, web {project.ports['web']}" + Style.RESET_ALL)
+        results = runProjects(projects, lambda project: project.start(golden))
+        for name, success in results.items():
+            if success:
+                print(Fore.GREEN + f"[+] {name} started successfully" + Style.RESET_ALL)
+            else:
+                print(Fore.RED + f"[-] {name} failed to start" + Style.RESET_ALL)
+        if not all(results.values()):
             exit(1)
-        project.clear()
 
-    elif args.subparser == "stop":
+
+def dataCommand(args: argparse.Namespace) -> None:
+    """
+    Upload a SharpHound zip into a project
+    """
+    from colorama import Fore, Style
+    from src.ingest import IngestFilter
+    from src.metrics import TIMELINE
+
+    project = loadProject(args.project)
+    if args.upload_workers < 1:
+        print(Fore.RED + "[-] The number of upload workers must be at least 1" + Style.RESET_ALL)
+        exit(1)
+    ingest_filter = IngestFilter(args.types, args.exclude_types, args.domains, args.exclude_domains)
+
+    if args.dry_run or args.check:
+        from src.manifest import MANIFEST_FILE, IngestManifest
+
+        manifest = None
+        # Chunks and filtered files do not have the content of the files of the zip, nor their hash
+        if not (args.force or args.max_chunk_objects or args.max_chunk_bytes or ingest_filter.filtersObjects()):
+            manifest = IngestManifest(PROJECT_DIR / project.name / MANIFEST_FILE)
+        report = preflight(args.zip, project, ingest_filter, manifest)
+        if args.dry_run:
+            if args.json:
+                printJSON(args, report)
+            if not report["valid"]:
+                exit(1)
+            return
+        if not report["valid"]:
+            print(Fore.RED + "[-] Nothing was uploaded" + Style.RESET_ALL)
+            exit(1)
+
+    if args.use_cache:
+        from src.cache import DatasetCache, datasetKey
+        from src.tracker import UploadStats
+
+        cache = DatasetCache(PROJECT_DIR)
         try:
-            with open(PROJECT_DIR / args.project / "project.pkl", "rb") as pkl_file:
-                project = pickle.load(pkl_file)
-        except FileNotFoundError:
-            print(Fore.RED + f"The project {args.project} does not exist.")
-            print(Style.RESET_ALL + 'Exiting...')
+            # A selection of the data is cached apart from the whole zip
+            key = datasetKey(args.zip, ingest_filter.key())
+        except OSError as e:
+            print(Fore.RED + f"[-] Could not read the zip file {args.zip}: {e}" + Style.RESET_ALL)
             exit(1)
-        project.stop()
+        # The snapshots hold the whole graph of the project, so they only match the zip when it was loaded into an empty project
+        holds_data = project.holdsData()
+        entry = cache.lookup(key, project.bhce_version)
+        if holds_data is None:
+            print(Fore.YELLOW + f"[*] Could not check if the project already holds data, the zip is uploaded and not cached" + Style.RESET_ALL)
+        elif entry is not None and holds_data:
+            print(Fore.YELLOW + f"[*] The project already holds data that restoring the cached dataset would replace, the zip is uploaded instead" + Style.RESET_ALL)
+        elif entry is not None:
+            project.restoreDataset(cache, entry)
+            summary = UploadStats().summary(None, "Restored", True, complete=True)
+            summary.update({"cache_key": key, "objects": entry.get("objects", 0)})
+            TIMELINE.attributes["summary"] = summary
+            if args.json:
+                printJSON(args, summary)
+            return
+
+    jsons = project.extractZip(args.zip)
+    jsons = project.filterJSON(jsons, ingest_filter)
+    jsons = project.splitJSON(jsons, args.max_chunk_objects, args.max_chunk_bytes)
+    summary = project.uploadJSON(jsons, workers=args.upload_workers, ingest_timeout=args.ingest_timeout, force=args.force,
+                                 encodings=COMPRESSION_ENCODINGS[args.compress], scrape_metrics=args.metrics_out is not None,
+                                 scheduler=ingestScheduler(args))
+    TIMELINE.attributes["summary"] = summary
+    if args.use_cache and summary["complete"] and holds_data:
+        print(Fore.YELLOW + f"[*] The dataset is not cached, the project held other data before this zip (clear it first to cache the zip)" + Style.RESET_ALL)
+    elif args.use_cache and summary["complete"] and holds_data is False:
+        # Only a complete ingestion is worth replaying
+        if project.snapshotDataset(cache, key, args.zip, summary):
+            summary["cache_key"] = key
+            for evicted in cache.evict(args.cache_max_size, args.cache_max_age, keep=key):
+                print(Fore.YELLOW + f"[*] Evicted the cached dataset {evicted['key'][:12]} ({evicted.get('zip_name', '')})" + Style.RESET_ALL)
+    if args.json:
+        printJSON(args, summary)
+    if not summary["ingested"]:
+        exit(1)
+
+
+def watchCommand(args: argparse.Namespace) -> None:
+    """
+    Watch a directory and feed its zips to a project
+    """
+    from colorama import Fore, Style
+    from src.watch import ZipWatcher
+
+    project = loadProject(args.project)
+    if not Path(args.directory).is_dir():
+        print(Fore.RED + f"[-] The directory {args.directory} does not exist" + Style.RESET_ALL)
+        exit(1)
+    if args.upload_workers < 1:
+        print(Fore.RED + "[-] The number of upload workers must be at least 1" + Style.RESET_ALL)
+        exit(1)
+    watcher = ZipWatcher(project, Path(args.directory), args.upload_workers, args.ingest_timeout, COMPRESSION_ENCODINGS[args.compress],
+                         args.max_chunk_objects, args.max_chunk_bytes, interval=args.interval, settle=args.settle, retry_failed=args.retry_failed,
+                         scheduler=ingestScheduler(args))
+    watcher.run(once=args.once)
+
+
+def inspectCommand(args: argparse.Namespace) -> None:
+    """
+    Validate a SharpHound zip without uploading it
+    """
+    from src.manifest import MANIFEST_FILE, IngestManifest
+
+    project, manifest = None, None
+    if args.project is not None:
+        project = loadProject(args.project)
+        manifest = IngestManifest(PROJECT_DIR / project.name / MANIFEST_FILE)
+    report = preflight(args.zip, project, manifest=manifest)
+    if args.json:
+        printJSON(args, report)
+    if not report["valid"]:
+        exit(1)
+
+
+def restoreCommand(args: argparse.Namespace) -> None:
+    """
+    Load a cached dataset into a project
+    """
+    from colorama import Fore, Style
+    from src.cache import DatasetCache, datasetKey
+    from src.ingest import IngestFilter
 
-    elif args.subparser == "delete":
+    project = loadProject(args.project)
+    cache = DatasetCache(PROJECT_DIR)
+    key = args.key
+    if args.zip:
+        ingest_filter = IngestFilter(args.types, args.exclude_types, args.domains, args.exclude_domains)
         try:
-            with open(PROJECT_DIR / args.project / "project.pkl", "rb") as pkl_file:
-                project = pickle.load(pkl_file)
-        except FileNotFoundError:
-            print(Fore.RED + f"The project {args.project} does not exist.")
-            print(Style.RESET_ALL + 'Exiting...')
+            # Same key as data --use-cache with the same selection
+            key = datasetKey(args.zip, ingest_filter.key())
+        except OSError as e:
+            print(Fore.RED + f"[-] Could not read the zip file {args.zip}: {e}" + Style.RESET_ALL)
             exit(1)
-        project.delete()
+    entry = cache.get(key)
+    if entry is None:
+        print(Fore.RED + "[-] This dataset is not in the cache, ingest it with data --use-cache first" + Style.RESET_ALL)
+        exit(1)
+    if entry.get("bhce_version") != project.bhce_version:
+        print(Fore.RED + f"[-] The dataset was cached with BHCE {entry.get('bhce_version')}, the project runs BHCE {project.bhce_version}" + Style.RESET_ALL)
+        exit(1)
+    if not args.force:
+        holds_data = project.holdsData()
+        if holds_data is None:
+            print(Fore.RED + f"[-] Could not check if the project {project.name} already holds data, which the dataset would replace. Use --force to restore it anyway" + Style.RESET_ALL)
+            exit(1)
+        if holds_data:
+            print(Fore.RED + f"[-] The project {project.name} already holds data, which the dataset would replace. Clear it first, or use --force" + Style.RESET_ALL)
+            exit(1)
+    project.restoreDataset(cache, entry)
+
 
+def cacheCommand(args: argparse.Namespace) -> None:
+    """
+    List, evict or delete the cached datasets
+    """
+    import time
+    from colorama import Fore, Style
+    from src.cache import DatasetCache
+
+    cache = DatasetCache(PROJECT_DIR)
+    if args.action == "evict":
+        evicted = cache.evict(args.max_size, args.max_age)
+    elif args.action == "clear":
+        evicted = cache.evict(max_size=0, max_age=None)
     else:
-        pass
\ No newline at end of file
+        entries = cache.entries()
+        if len(entries) == 0:
+            print(Fore.YELLOW + "[*] No cached dataset yet" + Style.RESET_ALL)
+        for entry in reversed(entries):
+            print(Fore.GREEN + f"[{entry['key'][:12]}] {entry.get('zip_name', '')}" + Style.RESET_ALL)
+            print(Fore.YELLOW + f"   * Size: {entry.get('size', 0) / 1024 ** 2:.1f} MB, {entry.get('objects', 0)} object(s)" + Style.RESET_ALL)
+            print(Fore.YELLOW + f"   * BHCE version: {entry.get('bhce_version', '')}, from project {entry.get('project', '')}" + Style.RESET_ALL)
+            print(Fore.YELLOW + f"   * Last used: {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.get('last_used_at', 0)))}" + Style.RESET_ALL)
+        print(Fore.YELLOW + f"[*] Total: {sum(entry.get('size', 0) for entry in entries) / 1024 ** 2:.1f} MB" + Style.RESET_ALL)
+        return
+    for entry in evicted:
+        print(Fore.YELLOW + f"[*] Evicted the cached dataset {entry['key'][:12]} ({entry.get('zip_name', '')})" + Style.RESET_ALL)
+    print(Fore.GREEN + f"[+] {len(evicted)} dataset(s) evicted" + Style.RESET_ALL)
+
+
+def queryCommand(args: argparse.Namespace) -> None:
+    """
+    Run Cypher queries on a project
+    """
+    import importlib.util
+    import time
+    from colorama import Fore, Style
+    from src.query import QueryRunner, listQueries
+
+    project = loadProject(args.project)
+    if importlib.util.find_spec("neo4j") is None:
+        print(Fore.RED + "[-] The query command needs the neo4j python driver: pip3 install neo4j" + Style.RESET_ALL)
+        exit(1)
+    if args.jobs < 1:
+        print(Fore.RED + "[-] The number of jobs must be at least 1" + Style.RESET_ALL)
+        exit(1)
+    query_files = listQueries(args.queries)
+    if len(query_files) == 0:
+        print(Fore.RED + "[-] No .cypher file found" + Style.RESET_ALL)
+        exit(1)
+
+    print(Fore.YELLOW + f"[*] Running {len(query_files)} quer{'y' if len(query_files) == 1 else 'ies'} on {project.name}..." + Style.RESET_ALL)
+    start = time.monotonic()
+    runner = QueryRunner(PROJECT_DIR / project.name, project.ports["bolt"], args.jobs, args.format, use_cache=not args.no_cache)
+    reports = runner.runAll(query_files, Path(args.out_dir))
+    failed = [report for report in reports if "error" in report]
+    cached = sum(1 for report in reports if report.get("cached"))
+    print(Fore.YELLOW + f"[*] {len(reports) - len(failed)} quer{'y' if len(reports) - len(failed) == 1 else 'ies'} done in {time.monotonic() - start:.2f}s "
+          f"({cached} from the cache), results written in {args.out_dir}" + Style.RESET_ALL)
+    if args.json:
+        printJSON(args, reports)
+    if failed:
+        print(Fore.RED + f"[-] {len(failed)} quer{'y' if len(failed) == 1 else 'ies'} failed" + Style.RESET_ALL)
+        exit(1)
+
+
+def clearCommand(args: argparse.Namespace) -> None:
+    """
+    Clear the data of a project
+    """
+    loadProject(args.project).clear()
+
+
+def runOnProjects(args: argparse.Namespace, action: str, running: Optional[bool] = None) -> None:
+    """
+    Run a project method on the projects given, or on every registered project with --all, in parallel when there are several
+    """
+    from colorama import Fore, Style
+    from src.parallel import runProjects
+    from src.registry import Registry
+
+    if args.all:
+        names = [entry.name for entry in Registry(PROJECT_DIR).list(running=running)]
+        if len(names) == 0:
+            print(Fore.YELLOW + "[*] No project to " + action + Style.RESET_ALL)
+            return
+    elif args.project:
+        names = list(dict.fromkeys(args.project))
+    else:
+        print(Fore.RED + "[-] Give the name of a project, or --all" + Style.RESET_ALL)
+        exit(1)
+    projects = [loadProject(name) for name in names]
+    if len(projects) == 1:
+        getattr(projects[0], action)()
+        return
+    results = runProjects(projects, lambda project: getattr(project, action)())
+    failed = [name for name, success in results.items() if not success]
+    if failed:
+        print(Fore.RED + f"[-] Could not {action} : {', '.join(failed)}" + Style.RESET_ALL)
+        exit(1)
+    print(Fore.GREEN + f"[+] Done for {len(projects)} projects" + Style.RESET_ALL)
+
+
+def stopCommand(args: argparse.Namespace) -> None:
+    """
+    Stop the containers of projects
+    """
+    runOnProjects(args, "stop", running=True)
+
+
+def deleteCommand(args: argparse.Namespace) -> None:
+    """
+    Delete projects, their containers and volumes
+    """
+    runOnProjects(args, "delete")
+
+
+def printJSON(args: argparse.Namespace, report) -> None:
+    """
+    Print the JSON report of a command on the standard output, which only holds this report with --json
+    """
+    import json
+
+    print(json.dumps(report), file=getattr(args, "report_output", sys.stdout), flush=True)
+
+
+def runCommand(args: argparse.Namespace) -> None:
+    """
+    Run the command, timing its phases when a metrics file is requested. With --json, the progress is written
+    to stderr, so that the report can be piped (e.g. into jq)
+    """
+    if getattr(args, "json", False):
+        import contextlib
+
+        args.report_output = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            timeCommand(args)
+    else:
+        timeCommand(args)
+
+
+def timeCommand(args: argparse.Namespace) -> None:
+    """
+    Run the command, timing its phases when a metrics file is requested
+    """
+    if not getattr(args, "metrics_out", None):
+        COMMANDS[args.subparser](args)
+        return
+
+    from src.metrics import TIMELINE
+
+    try:
+        with TIMELINE.span(args.subparser):
+            COMMANDS[args.subparser](args)
+    finally:
+        TIMELINE.save(args.metrics_out, command=args.subparser, argv=sys.argv[1:])
+        print(f"The phase timings are written in the {args.metrics_out} file")
+
+
+COMMANDS = {
+    "list": listCommand,
+    "start": startCommand,
+    "data": dataCommand,
+    "watch": watchCommand,
+    "inspect": inspectCommand,
+    "restore": restoreCommand,
+    "cache": cacheCommand,
+    "query": queryCommand,
+    "clear": clearCommand,
+    "stop": stopCommand,
+    "delete": deleteCommand,
+}
+
+
+if __name__=="__main__":
+    parser = buildParser()
+    # No arguments
+    args = parser.parse_args(args=None if sys.argv[1:] else ['--help'])
+    runCommand(args)
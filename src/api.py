@@ -0,0 +1,138 @@
+import base64
+import json
+import threading
+import time
+
+from typing import Callable, Optional
+
+import requests
+
+USER_AGENT = "bh-automation"
+# Attempts of a request failing with a connection error or a 5xx status, the delay doubling between two attempts
+API_RETRIES = 3
+API_RETRY_DELAY = 1
+RETRY_STATUSES = {500, 502, 503, 504}
+POOL_SIZE = 10
+# Lifetime assumed for the tokens whose expiry cannot be read, BloodHound sessions last 8 hours by default
+DEFAULT_TOKEN_LIFETIME = 8 * 3600
+# Tokens this close to their expiry are renewed before being used
+TOKEN_MARGIN = 60
+
+
+def tokenExpiry(token: str) -> float:
+    """
+    Return the expiry time of a JWT from its exp claim, or an estimate when it cannot be decoded
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + DEFAULT_TOKEN_LIFETIME
+
+
+class APIError(Exception):
+    def __init__(self, message: str, response: Optional[requests.Response] = None):
+        super().__init__(message)
+        self.response = response
+
+
+class BloodHoundAPI:
+    def __init__(self, base_url: str, secret: str, token: str = "", token_expiry: float = 0,
+                 on_login: Optional[Callable[[str, float], None]] = None):
+        """
+        Client of the BloodHound CE API, sharing its keep-alive connections and its session token between calls.
+        The admin logs in again with the secret only when the token expires or is rejected, on_login being told of the new token
+        """
+        self.base_url = base_url
+        self.secret = secret
+        self.token = token
+        self.token_expiry = token_expiry
+        self.on_login = on_login
+        self.lock = threading.Lock()
+        self.pool_size = 0
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        self.setPoolSize(POOL_SIZE)
+
+
+    def setPoolSize(self, size: int) -> None:
+        """
+        Keep up to size connections open, so that as many threads can send requests at once
+        """
+        if size > self.pool_size:
+            self.pool_size = size
+            self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=size))
+            self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=size))
+
+
+    def login(self, secret: Optional[str] = None) -> str:
+        """
+        Log in as admin and return the new session token. The secret given replaces the one used for the next logins
+        """
+        if secret is not None:
+            self.secret = secret
+        response = self.send("POST", "/api/v2/login", json={"login_method": "secret", "secret": self.secret, "username": "admin"})
+        if response.status_code != 200:
+            raise APIError(f"Login request was not successful. Status code : {response.status_code}\n{response.text}", response)
+        self.token = response.json()["data"]["session_token"]
+        self.token_expiry = tokenExpiry(self.token)
+        if self.on_login is not None:
+            self.on_login(self.token, self.token_expiry)
+        return self.token
+
+
+    def authorization(self, rejected: Optional[str] = None) -> dict:
+        """
+        Return the authorization header, logging in first when there is no valid token.
+        A rejected token is only renewed once, by the first thread noticing it
+        """
+        with self.lock:
+            if not self.token or self.token == rejected or time.time() > self.token_expiry - TOKEN_MARGIN:
+                self.login()
+            return {"Authorization": f"Bearer {self.token}"}
+
+
+    def send(self, method: str, path: str, retries: int = API_RETRIES, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying on connection errors and 5xx statuses with an exponential backoff
+        """
+        attempt = 1
+        while True:
+            try:
+                response = self.session.request(method, self.base_url + path, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+            except requests.exceptions.ConnectionError:
+                if attempt >= retries:
+                    raise
+            time.sleep(API_RETRY_DELAY * 2 ** (attempt - 1))
+            attempt += 1
+
+
+    def request(self, method: str, path: str, headers: Optional[dict] = None, retries: int = API_RETRIES, **kwargs) -> requests.Response:
+        """
+        Send an authenticated request. When the token is rejected, the request is sent again with a new one,
+        unless its body is a stream that was already consumed: the 401 response is then returned to the caller
+        """
+        authorization = self.authorization()
+        response = self.send(method, path, retries, headers={**(headers or {}), **authorization}, **kwargs)
+        if response.status_code != 401:
+            return response
+        rejected = authorization["Authorization"][len("Bearer "):]
+        authorization = self.authorization(rejected)
+        if not isinstance(kwargs.get("data"), (type(None), bytes, str, dict)):
+            return response
+        return self.send(method, path, retries, headers={**(headers or {}), **authorization}, **kwargs)
+
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
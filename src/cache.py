@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from pathlib import Path
+from typing import ContextManager, List, Optional
+
+from src.utils import fileLock
+
+CACHE_DIR = ".cache"
+LOCK_FILE = ".lock"
+ENTRY_FILE = "entry.json"
+GRAPH_DUMP = "neo4j.dump"
+APP_DB_DUMP = "app-db.dump"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Eviction defaults, the dumps of a large collection weigh several GB
+DEFAULT_MAX_SIZE = 20 * 1024 ** 3
+DEFAULT_MAX_AGE = 30
+
+
+def zipDigest(zip_file: str) -> str:
+    """
+    Return the SHA-256 of the zip file, which identifies a dataset
+    """
+    digest = hashlib.sha256()
+    with open(zip_file, "rb") as zip_ref:
+        for chunk in iter(lambda: zip_ref.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def datasetKey(zip_file: str, selection: str = "") -> str:
+    """
+    Return the key of the dataset ingested from a zip file, restricted to a selection of its data when one is given
+    """
+    key = zipDigest(zip_file)
+    return hashlib.sha256(f"{key}:{selection}".encode()).hexdigest() if selection else key
+
+
+class DatasetCache:
+    def __init__(self, source_directory: Path):
+        """
+        Snapshots of the graph and application database of ingested datasets, keyed by the hash of their zip file
+        and shared by every project
+        """
+        self.path = Path(source_directory) / CACHE_DIR
+
+
+    def locked(self) -> ContextManager[None]:
+        """
+        Hold the cache lock while entries are added, used or evicted
+        """
+        return fileLock(self.path / LOCK_FILE)
+
+
+    def entries(self) -> List[dict]:
+        """
+        Return the metadata of the cached datasets, least recently used first
+        """
+        entries = []
+        for entry_path in self.path.glob(f"*/{ENTRY_FILE}"):
+            try:
+                with open(entry_path, "r") as entry_file:
+                    entry = json.load(entry_file)
+            except (OSError, ValueError):
+                continue
+            entry["path"] = str(entry_path.parent)
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: entry.get("last_used_at", 0))
+
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Return a cached dataset from its key or an unambiguous prefix of it
+        """
+        matches = [entry for entry in self.entries() if entry["key"].startswith(key)]
+        exact = [entry for entry in matches if entry["key"] == key]
+        if exact:
+            return exact[0]
+        return matches[0] if len(matches) == 1 else None
+
+
+    def lookup(self, key: str, bhce_version: str) -> Optional[dict]:
+        """
+        Return the cached dataset usable by a project, whose dumps must come from the same BHCE version
+        """
+        entry = self.get(key)
+        if entry is None or entry["key"] != key or entry.get("bhce_version") != bhce_version:
+            return None
+        return entry
+
+
+    def reserve(self, key: str) -> Path:
+        """
+        Return an empty temporary directory in which the dumps of a dataset are written
+        """
+        import tempfile
+
+        os.makedirs(self.path, exist_ok=True)
+        directory = Path(tempfile.mkdtemp(dir=self.path, prefix=f".{key[:12]}-"))
+        # The dumps are written by the database users of the containers
+        os.chmod(directory, 0o777)
+        return directory
+
+
+    def store(self, key: str, directory: Path, metadata: dict) -> dict:
+        """
+        Turn a reserved directory holding the dumps into the cache entry of the dataset, replacing any previous one
+        """
+        now = int(time.time())
+        size = sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+        entry = {"key": key, **metadata, "size": size, "created_at": now, "last_used_at": now}
+        with open(directory / ENTRY_FILE, "w") as entry_file:
+            json.dump(entry, entry_file, indent=2)
+        os.chmod(directory, 0o755)
+        with self.locked():
+            shutil.rmtree(self.path / key, ignore_errors=True)
+            os.replace(directory, self.path / key)
+        entry["path"] = str(self.path / key)
+        return entry
+
+
+    def touch(self, entry: dict) -> None:
+        """
+        Record that a cached dataset was used, so that it is evicted last
+        """
+        with self.locked():
+            entry["last_used_at"] = int(time.time())
+            stored = {field: value for field, value in entry.items() if field != "path"}
+            try:
+                with open(Path(entry["path"]) / ENTRY_FILE, "w") as entry_file:
+                    json.dump(stored, entry_file, indent=2)
+            except FileNotFoundError:
+                pass
+
+
+    def remove(self, entry: dict) -> None:
+        """
+        Delete a cached dataset
+        """
+        with self.locked():
+            shutil.rmtree(entry["path"], ignore_errors=True)
+
+
+    def evict(self, max_size: Optional[int] = DEFAULT_MAX_SIZE, max_age: Optional[int] = DEFAULT_MAX_AGE, keep: Optional[str] = None) -> List[dict]:
+        """
+        Delete the datasets unused for more than max_age days, then the least recently used ones until the cache
+        fits in max_size bytes. The dataset to keep is never evicted. Return the evicted datasets
+        """
+        evicted = []
+        with self.locked():
+            entries = self.entries()
+            total = sum(entry.get("size", 0) for entry in entries)
+            for entry in entries:
+                if entry["key"] == keep:
+                    continue
+                expired = max_age is not None and time.time() - entry.get("last_used_at", 0) > max_age * 86400
+                oversized = max_size is not None and total > max_size
+                if expired or oversized:
+                    shutil.rmtree(entry["path"], ignore_errors=True)
+                    total -= entry.get("size", 0)
+                    evicted.append(entry)
+            # Leftovers of interrupted snapshots
+            for leftover in self.path.glob(".*-*"):
+                if leftover.is_dir() and time.time() - leftover.stat().st_mtime > 86400:
+                    shutil.rmtree(leftover, ignore_errors=True)
+        return evicted
@@ -0,0 +1,118 @@
+import queue
+import threading
+import zipfile
+import zlib
+
+from typing import Callable, Iterable, Iterator
+
+ENCODING_NONE = "none"
+ENCODING_GZIP = "gzip"
+ENCODING_ZIP = "zip"
+
+COMPRESS_LEVEL = 3
+# Compressed chunks buffered ahead of the network
+QUEUE_SIZE = 8
+
+# Headers sent with each kind of body
+ENCODING_HEADERS = {
+    ENCODING_NONE: {"Content-Type": "application/json"},
+    ENCODING_GZIP: {"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    ENCODING_ZIP: {"Content-Type": "application/zip"},
+}
+
+
+class Pipe:
+    def __init__(self, put: Callable[[bytes], None]):
+        """
+        Write-only file object forwarding everything written to a callback, used as the output of zipfile
+        """
+        self.put = put
+
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self.put(bytes(data))
+        return len(data)
+
+
+    def flush(self) -> None:
+        pass
+
+
+def gzipChunks(chunks: Iterable[bytes], put: Callable[[bytes], None]) -> None:
+    """
+    Compress the chunks into a gzip stream
+    """
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            put(data)
+    put(compressor.flush())
+
+
+def zipChunks(name: str, size: int, chunks: Iterable[bytes], put: Callable[[bytes], None]) -> None:
+    """
+    Pack the chunks as the single member of a zip archive, written sequentially
+    """
+    with zipfile.ZipFile(Pipe(put), "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zip_ref:
+        with zip_ref.open(name, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+            for chunk in chunks:
+                member.write(chunk)
+
+
+class CompressedStream:
+    def __init__(self, chunks: Iterable[bytes], encoding: str, name: str, size: int):
+        """
+        Compresses a file in a background thread while the previous compressed chunks are being sent
+        """
+        self.chunks = chunks
+        self.encoding = encoding
+        self.name = name
+        self.source_size = size
+        self.size = 0
+
+
+    def __iter__(self) -> Iterator[bytes]:
+        chunks = queue.Queue(QUEUE_SIZE)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> None:
+            # Give up when the upload was abandoned, instead of blocking on a queue nobody reads anymore
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            raise InterruptedError("upload abandoned")
+
+        def compress() -> None:
+            try:
+                if self.encoding == ENCODING_ZIP:
+                    zipChunks(self.name, self.source_size, self.chunks, put)
+                else:
+                    gzipChunks(self.chunks, put)
+                put(done)
+            except InterruptedError:
+                pass
+            except Exception as e:
+                try:
+                    put(e)
+                except InterruptedError:
+                    pass
+
+        thread = threading.Thread(target=compress, name=f"compress-{self.name}", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                self.size += len(item)
+                yield item
+        finally:
+            stop.set()
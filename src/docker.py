@@ -0,0 +1,94 @@
+import re
+import subprocess
+
+from pathlib import Path
+from typing import IO, Optional
+
+DOCKER_COMPOSE_BIN = ["docker", "compose"]
+
+
+def loadCompose(path: Path) -> dict:
+    """
+    Parse a docker-compose file
+    """
+    import yaml
+
+    with open(path, "r") as compose_file:
+        return yaml.safe_load(compose_file)
+
+
+def writeCompose(path: Path, definition: dict, header: str = "") -> None:
+    """
+    Write a docker-compose file, keeping the order of the keys
+    """
+    import yaml
+
+    with open(path, "w") as compose_file:
+        compose_file.write(header)
+        yaml.safe_dump(definition, compose_file, sort_keys=False, default_flow_style=False)
+
+
+def setEnvironment(service: dict, variables: dict) -> None:
+    """
+    Set (or remove, with a None value) environment variables of a service, in list or mapping form
+    """
+    environment = service.get("environment") or []
+    if isinstance(environment, dict):
+        environment = [f"{name}={value}" for name, value in environment.items()]
+    environment = [line for line in environment if line.split("=", 1)[0] not in variables]
+    environment += [f"{name}={value}" for name, value in variables.items() if value is not None]
+    service["environment"] = environment
+
+
+def composeProjectName(project_dir: Path) -> str:
+    """
+    Return the name docker compose derives from the project directory, which prefixes its volumes and containers
+    """
+    return re.sub(r"[^a-z0-9_-]", "", project_dir.name.lower())
+
+
+def volumeName(project_dir: Path, volume: str) -> str:
+    """
+    Return the name of a volume of the project's docker-compose.yml once created by docker compose
+    """
+    return f"{composeProjectName(project_dir)}_{volume}"
+
+
+def volumeExists(name: str) -> bool:
+    """
+    Check if a docker volume exists
+    """
+    return subprocess.run(["docker", "volume", "inspect", name],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
+def compose(project_dir: Path, *args: str, log: Optional[IO] = None,
+            stdin: Optional[IO] = None, stdout: Optional[IO] = None) -> subprocess.CompletedProcess:
+    """
+    Run a docker compose command in the project directory and wait for it to finish.
+    Its output goes to the log unless another file is given for stdout
+    """
+    output = log if log is not None else subprocess.DEVNULL
+    return subprocess.run([*DOCKER_COMPOSE_BIN, *args], cwd=project_dir,
+                          stdin=stdin if stdin is not None else subprocess.DEVNULL,
+                          stdout=stdout if stdout is not None else output, stderr=output)
+
+
+def composeBackground(project_dir: Path, *args: str, log: Optional[IO] = None) -> subprocess.Popen:
+    """
+    Start a docker compose command in the project directory without waiting for it, its output going to the log
+    """
+    output = log if log is not None else subprocess.DEVNULL
+    return subprocess.Popen([*DOCKER_COMPOSE_BIN, *args], cwd=project_dir, text=True,
+                            stdin=subprocess.DEVNULL, stdout=output, stderr=output)
+
+
+def runTar(image: str, volume: str, directory: Path, *args: str, log: Optional[IO] = None) -> subprocess.CompletedProcess:
+    """
+    Run tar in a throwaway container of the image, with the volume mounted on /volume and the host directory on /snapshot
+    """
+    output = log if log is not None else subprocess.DEVNULL
+    return subprocess.run(["docker", "run", "--rm", "--entrypoint", "tar",
+                           "-v", f"{volume}:/volume", "-v", f"{Path(directory).resolve()}:/snapshot",
+                           image, "--numeric-owner", *args],
+                          text=True, stdout=output, stderr=output)
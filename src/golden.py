@@ -0,0 +1,188 @@
+import json
+import os
+import re
+import shutil
+import time
+
+from pathlib import Path
+from typing import Optional
+
+from colorama import Fore, Style
+
+from src.docker import compose, loadCompose, runTar, setEnvironment, volumeExists, volumeName, writeCompose
+from src.utils import fileLock
+
+GOLDEN_DIR = ".golden"
+GOLDEN_FILE = "golden.json"
+OVERRIDE_FILE = "docker-compose.override.yml"
+# Admin password of the templates, replaced by the project's password when a template is cloned
+GOLDEN_PASSWORD = "Golden-Template-0!"
+# Volumes holding the whole state of an initialized BloodHound instance
+VOLUMES = ["neo4j-data", "postgres-data", "neo4j-plugins"]
+# Service whose image runs tar on the volumes, it is pulled for every project anyway
+TAR_SERVICE = "app-db"
+
+OVERRIDE_HEADER = "# Generated by bloodhound-automation: the state of BloodHound is kept in volumes,\n# initialized from the golden template {key}\n"
+
+# The plugins are restored with the volumes, so that neo4j does not download them again
+CLONE_GDS_ENVIRONMENT = {
+    "NEO4J_PLUGINS": "[]",
+    "NEO4J_dbms_security_procedures_unrestricted": "gds.*",
+}
+
+
+def templateImages(template: str = "./templates/docker-compose.yml") -> dict:
+    """
+    Return the image of each service of a docker-compose file, with the variables resolved as docker compose would
+    """
+    return {service: re.sub(r"\$\{(\w+):-([^}]*)\}", lambda match: os.environ.get(match.group(1)) or match.group(2), definition.get("image", ""))
+            for service, definition in loadCompose(template)["services"].items()}
+
+
+class GoldenTemplate:
+    def __init__(self, source_directory: Path, no_gds: bool):
+        """
+        Snapshot of the volumes of a fully initialized BloodHound instance (admin password set, plugins installed, features enabled),
+        one per BHCE and Neo4j version, cloned into the new projects
+        """
+        self.source_directory = Path(source_directory)
+        self.no_gds = no_gds
+        self.images = templateImages()
+        bhce_tag = self.images["bloodhound"].rpartition(":")[2]
+        neo4j_tag = self.images["graph-db"].rpartition(":")[2]
+        self.key = re.sub(r"[^a-z0-9_-]", "-", f"bhce-{bhce_tag}_neo4j-{neo4j_tag}_{'nogds' if no_gds else 'gds'}".lower())
+        self.path = self.source_directory / GOLDEN_DIR / self.key
+
+
+    def load(self) -> Optional[dict]:
+        """
+        Return the metadata of the template, or None if it was not built
+        """
+        try:
+            with open(self.path / GOLDEN_FILE, "r") as golden_file:
+                return json.load(golden_file)
+        except (OSError, ValueError):
+            return None
+
+
+    def exists(self) -> bool:
+        """
+        Check if the template was built completely, and is not stale
+        """
+        metadata = self.load()
+        return metadata is not None and not metadata.get("stale") and all((self.path / f"{volume}.tar").exists() for volume in VOLUMES)
+
+
+    def checkVersion(self, bhce_version: str) -> None:
+        """
+        Compare the BHCE version of a clone with the one the template was built from. The image tags (e.g. latest) do not
+        change with the versions they point to, so a template built from an older image is marked stale, to be built again
+        by the next start from the golden template
+        """
+        metadata = self.load()
+        if metadata is None or not bhce_version or metadata.get("bhce_version") == bhce_version:
+            return
+        print(Fore.YELLOW + f"[*] The golden template {self.key} was built with BHCE {metadata.get('bhce_version')} but BHCE {bhce_version} is running, "
+              "it will be built again by the next start --from-golden" + Style.RESET_ALL)
+        with fileLock(self.path.parent / f"{self.key}.lock"):
+            metadata = self.load()
+            if metadata is None:
+                return
+            metadata.update({"stale": True, "running_version": bhce_version})
+            tmp_path = self.path / f".{GOLDEN_FILE}.tmp"
+            with open(tmp_path, "w") as golden_file:
+                json.dump(metadata, golden_file, indent=2)
+            os.replace(tmp_path, self.path / GOLDEN_FILE)
+
+
+    @property
+    def password(self) -> str:
+        return (self.load() or {}).get("password", GOLDEN_PASSWORD)
+
+
+    def writeOverride(self, project_dir: Path, clone: bool) -> None:
+        """
+        Keep the whole state of the project in volumes, through a docker compose override file
+        """
+        graph_db = {"volumes": ["neo4j-plugins:/plugins"]}
+        if clone and not self.no_gds:
+            setEnvironment(graph_db, CLONE_GDS_ENVIRONMENT)
+        override = {
+            "services": {
+                "app-db": {"volumes": ["postgres-data:/var/lib/postgresql/data"]},
+                "graph-db": graph_db,
+            },
+            "volumes": {"neo4j-plugins": None},
+        }
+        writeCompose(project_dir / OVERRIDE_FILE, override, OVERRIDE_HEADER.format(key=self.key))
+
+
+    def build(self, ports: dict, timeout: int, rebuild: bool = False) -> None:
+        """
+        Initialize a throwaway project and snapshot its volumes once it is stopped
+        """
+        from src.project import Project
+
+        with fileLock(self.path.parent / f"{self.key}.lock"):
+            # Another invocation may have built it while we were waiting for the lock
+            if self.exists() and not rebuild:
+                return
+            print(Fore.YELLOW + f"[*] Building the golden template {self.key}, this is only done once per BHCE and Neo4j version" + Style.RESET_ALL)
+            if self.path.exists():
+                if (self.path / "docker-compose.yml").exists():
+                    compose(self.path, "down", "-v")
+                shutil.rmtree(self.path)
+
+            builder = Project(name = self.key,
+                              source_directory = self.path.parent,
+                              ports = ports,
+                              password = GOLDEN_PASSWORD,
+                              timeout = timeout,
+                              no_gds = self.no_gds)
+            builder.createProject()
+            builder.dockerSetup()
+            self.writeOverride(self.path, clone=False)
+            try:
+                docker_process, log, deadline = builder.launch()
+                builder.initialize(log, deadline, docker_process)
+                with open(self.path / "logs.txt", "a") as output_log:
+                    # The volumes are only consistent once the databases are stopped
+                    if compose(self.path, "stop", log=output_log).returncode != 0:
+                        raise RuntimeError("could not stop the containers of the template")
+                    docker_process.wait()
+                    for volume in VOLUMES:
+                        result = runTar(self.images[TAR_SERVICE], volumeName(self.path, volume), self.path,
+                                        "-C", "/volume", "-cf", f"/snapshot/{volume}.tar", ".", log=output_log)
+                        if result.returncode != 0:
+                            raise RuntimeError(f"could not snapshot the {volume} volume")
+            except BaseException:
+                compose(self.path, "down", "-v")
+                raise
+            compose(self.path, "down", "-v")
+
+            with open(self.path / GOLDEN_FILE, "w") as golden_file:
+                json.dump({"key": self.key, "bhce_version": builder.bhce_version, "images": self.images,
+                           "no_gds": self.no_gds, "password": GOLDEN_PASSWORD, "created_at": int(time.time())}, golden_file, indent=2)
+            print(Fore.GREEN + f"[+] Golden template {self.key} built (BHCE {builder.bhce_version})" + Style.RESET_ALL)
+
+
+    def restore(self, project_dir: Path) -> bool:
+        """
+        Create the volumes of a new project from the snapshot. Return False if the project already has its volumes
+        """
+        volumes = {volume: volumeName(project_dir, volume) for volume in VOLUMES}
+        if volumeExists(volumes["postgres-data"]):
+            return False
+        if volumeExists(volumes["neo4j-data"]):
+            raise RuntimeError("the project already has a neo4j database, golden templates can only be used for new projects")
+
+        with open(project_dir / "logs.txt", "a") as output_log:
+            # Let docker compose create the volumes, so that they belong to the project
+            if compose(project_dir, "create", log=output_log).returncode != 0:
+                raise RuntimeError("could not create the containers of the project")
+            for volume, name in volumes.items():
+                result = runTar(self.images[TAR_SERVICE], name, self.path, "-C", "/volume", "-xf", f"/snapshot/{volume}.tar", log=output_log)
+                if result.returncode != 0:
+                    raise RuntimeError(f"could not restore the {volume} volume")
+        print(Fore.GREEN + f"[+] Restored the volumes of the golden template {self.key}" + Style.RESET_ALL)
+        return True
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+
+from pathlib import Path
+from typing import List, Optional
+
+HISTORY_FILE = "history.json"
+HISTORY_VERSION = 1
+# Runs kept per project, the oldest ones are forgotten
+HISTORY_SIZE = 20
+
+
+class IngestHistory:
+    def __init__(self, path: Path):
+        """
+        Metrics of the past uploads and ingestions of a project, used to estimate the duration of the next ones,
+        along with the clears and restores of its data
+        """
+        self.path = path
+        self.runs = []
+        self.load()
+
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as history_file:
+                history = json.load(history_file)
+            if history.get("version") == HISTORY_VERSION:
+                self.runs = history["runs"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+
+    def record(self, summary: dict) -> None:
+        """
+        Add the summary of a batch submitted for ingestion
+        """
+        self.append({"upload_id": summary["upload_id"], "status": summary["status"], "ingested": summary["ingested"], "files": summary["files"],
+                     "bytes": summary["bytes"], "wire_bytes": summary["wire_bytes"], "objects": summary["objects"],
+                     "upload_seconds": summary["upload_seconds"], "ingest_seconds": summary["ingest_seconds"]})
+
+
+    def recordEvent(self, event: str) -> None:
+        """
+        Add a change of the data which is not an ingestion, such as a clear or a restore
+        """
+        self.append({"event": event})
+
+
+    def append(self, run: dict) -> None:
+        """
+        Add an entry and save the history. The file is read again first, other invocations may have recorded runs in the meantime
+        """
+        import tempfile
+
+        self.load()
+        self.runs.append(dict(run, recorded_at=int(time.time())))
+        self.runs = self.runs[-HISTORY_SIZE:]
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".history-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump({"version": HISTORY_VERSION, "runs": self.runs}, tmp_file, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+    def measured(self) -> List[dict]:
+        """
+        Return the batches whose ingestion ended, the only ones measuring the rates
+        """
+        return [run for run in self.runs if "event" not in run and run.get("ingested", True)]
+
+
+    def dataLoaded(self) -> bool:
+        """
+        Check if data was submitted or restored since the history started or the last clear
+        """
+        return bool(self.runs) and self.runs[-1].get("event") != "clear"
+
+
+    def rate(self, amount: str, seconds: str) -> Optional[float]:
+        """
+        Return the overall rate of the past runs, amount per second, or None without any measure
+        """
+        runs = [run for run in self.measured() if run[amount] > 0 and run[seconds] > 0]
+        if not runs:
+            return None
+        return sum(run[amount] for run in runs) / sum(run[seconds] for run in runs)
+
+
+    def uploadRate(self) -> Optional[float]:
+        """
+        Return the upload rate of the past runs, in bytes of json per second
+        """
+        return self.rate("bytes", "upload_seconds")
+
+
+    def ingestRate(self) -> Optional[float]:
+        """
+        Return the ingest rate of the past runs, in objects per second
+        """
+        return self.rate("objects", "ingest_seconds")
+
+
+    def estimate(self, size: int, objects: int) -> Optional[dict]:
+        """
+        Return the estimated upload and ingest seconds of size bytes of json holding objects objects, or None without past runs
+        """
+        upload_rate, ingest_rate = self.uploadRate(), self.ingestRate()
+        if upload_rate is None or ingest_rate is None:
+            return None
+        return {"upload_seconds": round(size / upload_rate, 1), "ingest_seconds": round(objects / ingest_rate, 1), "runs": len(self.measured())}
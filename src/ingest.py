@@ -0,0 +1,452 @@
+import codecs
+import hashlib
+import json
+import re
+import zipfile
+
+from pathlib import PurePosixPath
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+CHUNK_SIZE = 1024 * 1024
+# Size of the end of a member scanned for the "meta" block, which SharpHound writes last
+META_TAIL_SIZE = 64 * 1024
+# Upper bound of a single object of the "data" array, past which the file is considered corrupt
+MAX_OBJECT_SIZE = 256 * 1024 * 1024
+META_KEY = re.compile(r'"meta"\s*:\s*')
+
+
+class SharpHoundError(ValueError):
+    """
+    Raised when a SharpHound JSON file is malformed
+    """
+
+
+class ZipMember:
+    def __init__(self, zip_file: str, name: str, size: int, compressed_size: Optional[int] = None, crc: Optional[int] = None):
+        """
+        Represents a JSON file stored inside a SharpHound zip, read lazily
+        """
+        self.zip_file = zip_file
+        self.member = name
+        self.name = PurePosixPath(name).name
+        self.size = size
+        self.compressed_size = size if compressed_size is None else compressed_size
+        self.crc = crc
+
+
+    def stream(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Yield the content of the member in chunks, without the UTF-8 BOM
+        """
+        with zipfile.ZipFile(self.zip_file, "r") as zip_ref:
+            with zip_ref.open(self.member, "r") as member:
+                head = member.read(len(codecs.BOM_UTF8))
+                if head and head != codecs.BOM_UTF8:
+                    yield head
+                while True:
+                    chunk = member.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+
+    def digest(self) -> str:
+        """
+        Return the SHA-256 of the content, as uploaded
+        """
+        sha256 = hashlib.sha256()
+        for chunk in self.stream():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+
+    def signature(self) -> Optional[str]:
+        """
+        Return the CRC-32 and the size of the member, read from the central directory of the zip without inflating it
+        """
+        return None if self.crc is None else f"{self.crc:08x}:{self.size}"
+
+
+    def tail(self, size: int) -> bytes:
+        """
+        Return the last bytes of the member. Skipping to them still inflates the whole member, but nothing is kept in memory
+        """
+        with zipfile.ZipFile(self.zip_file, "r") as zip_ref:
+            with zip_ref.open(self.member, "r") as member:
+                member.seek(max(self.size - size, 0))
+                return member.read()
+
+
+class JSONChunk:
+    def __init__(self, name: str, content: bytes, count: int):
+        """
+        Represents a SharpHound document held in memory, holding part of the objects of a bigger file
+        """
+        self.name = name
+        self.content = content
+        self.size = len(content)
+        self.count = count
+
+
+    def stream(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Yield the content of the chunk
+        """
+        yield self.content
+
+
+    def digest(self) -> str:
+        """
+        Return the SHA-256 of the content
+        """
+        return hashlib.sha256(self.content).hexdigest()
+
+
+    def signature(self) -> Optional[str]:
+        return None
+
+
+class IngestFilter:
+    def __init__(self, types: Optional[List[str]] = None, exclude_types: Optional[List[str]] = None,
+                 domains: Optional[List[str]] = None, exclude_domains: Optional[List[str]] = None):
+        """
+        Selection of the SharpHound files by type (meta.type) and of their objects by domain, given by name or SID
+        """
+        self.types = {data_type.lower() for data_type in types or []}
+        self.exclude_types = {data_type.lower() for data_type in exclude_types or []}
+        self.domains = {domain.upper() for domain in domains or []}
+        self.exclude_domains = {domain.upper() for domain in exclude_domains or []}
+
+
+    def active(self) -> bool:
+        return bool(self.types or self.exclude_types or self.domains or self.exclude_domains)
+
+
+    def key(self) -> str:
+        """
+        Return a canonical description of the selection, empty when everything is selected
+        """
+        parts = {"types": self.types, "exclude_types": self.exclude_types, "domains": self.domains, "exclude_domains": self.exclude_domains}
+        return ";".join(f"{name}={','.join(sorted(values))}" for name, values in parts.items() if values)
+
+
+    def selectsType(self, data_type: str) -> bool:
+        data_type = (data_type or "").lower()
+        return (not self.types or data_type in self.types) and data_type not in self.exclude_types
+
+
+    def filtersTypes(self) -> bool:
+        return bool(self.types or self.exclude_types)
+
+
+    def filtersObjects(self) -> bool:
+        return bool(self.domains or self.exclude_domains)
+
+
+    def selectsObject(self, obj) -> bool:
+        """
+        Check if an object belongs to the selected domains. Objects without any domain are only kept when no domain is required
+        """
+        if not isinstance(obj, dict):
+            return not self.domains
+        properties = obj.get("Properties") or {}
+        identities = {str(value).upper() for value in (properties.get("domain"), properties.get("domainsid")) if value}
+        identifier = str(obj.get("ObjectIdentifier") or "").upper()
+        if identifier.startswith("S-1-5-21-"):
+            # Domain SID of the principal, or the SID of the domain object itself
+            identities.add("-".join(identifier.split("-")[:7]))
+        if identities & self.exclude_domains:
+            return False
+        return not self.domains or bool(identities & self.domains)
+
+
+class FilteredMember:
+    def __init__(self, member: ZipMember, meta: Optional[dict], ingest_filter: IngestFilter):
+        """
+        Represents a SharpHound file rewritten on the fly with only the objects selected by the filter, its meta count updated.
+        The meta block of the original file is only known beforehand when its type had to be checked
+        """
+        self.member = member
+        self.meta = meta
+        self.filter = ingest_filter
+        self.name = member.name
+        # Upper bound, the filtered document is never bigger than the original one
+        self.size = member.size
+        # Hash of the content once streamed entirely, as recorded in the manifest
+        self.upload_digest = None
+
+
+    def stream(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Yield the filtered document in chunks of about chunk_size bytes, hashing the original one on the way
+        """
+        self.upload_digest = None
+        sha256 = hashlib.sha256()
+
+        def chunks() -> Iterator[bytes]:
+            for chunk in self.member.stream(chunk_size):
+                sha256.update(chunk)
+                yield chunk
+
+        parser = SharpHoundParser(chunks())
+        pending, pending_size, count = [b'{"data":['], 0, 0
+        for obj, raw in parser.entries():
+            if not self.filter.selectsObject(obj):
+                continue
+            data = (b"," if count else b"") + raw.encode("utf-8")
+            pending.append(data)
+            pending_size += len(data)
+            count += 1
+            if pending_size >= chunk_size:
+                yield b"".join(pending)
+                pending, pending_size = [], 0
+        meta = parser.meta or self.meta
+        if meta is None:
+            raise SharpHoundError(f"{self.name} has no meta block")
+        pending.append(b'],"meta":' + json.dumps(dict(meta, count=count)).encode("utf-8") + b"}")
+        self.upload_digest = self.selectionDigest(sha256.hexdigest())
+        yield b"".join(pending)
+
+
+    def selectionDigest(self, member_digest: str) -> str:
+        return hashlib.sha256(f"{member_digest}:{self.filter.key()}".encode()).hexdigest()
+
+
+    def digest(self) -> str:
+        """
+        Return the hash of the original content along with the filter, which identifies the filtered content
+        without parsing the file
+        """
+        return self.selectionDigest(self.member.digest())
+
+
+    def signature(self) -> Optional[str]:
+        signature = self.member.signature()
+        return None if signature is None else f"{signature}:{self.filter.key()}"
+
+
+    def tail(self, size: int) -> bytes:
+        """
+        Return the last bytes of the original member, whose meta block bounds the filtered one
+        """
+        return self.member.tail(size)
+
+
+JSONSource = Union[ZipMember, JSONChunk, FilteredMember]
+
+
+def filterMembers(members: Iterable[ZipMember], ingest_filter: IngestFilter, on_skip: Optional[Callable[[ZipMember, str], None]] = None) -> Iterator[JSONSource]:
+    """
+    Only yield the files of the selected types, rewritten with the objects of the selected domains.
+    on_skip is called with the files left out and their type
+    """
+    for member in members:
+        if not ingest_filter.filtersTypes():
+            # Only the objects are filtered, the type of the file does not need to be read beforehand
+            yield FilteredMember(member, None, ingest_filter)
+            continue
+        meta = readMeta(member)
+        if meta is None:
+            raise SharpHoundError(f"{member.name} has no meta block")
+        if not ingest_filter.selectsType(meta.get("type")):
+            if on_skip is not None:
+                on_skip(member, meta.get("type"))
+            continue
+        yield FilteredMember(member, meta, ingest_filter) if ingest_filter.filtersObjects() else member
+
+
+class SharpHoundParser:
+    def __init__(self, chunks: Iterable[bytes]):
+        """
+        Incremental parser of a SharpHound document, reading the "data" array one object at a time
+        """
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.meta = None
+
+
+    def fill(self) -> bool:
+        """
+        Append the next chunk of the stream to the buffer, return False once the stream is exhausted
+        """
+        if self.eof:
+            return False
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.buffer += self.decoder.decode(b"", final=True)
+            self.eof = True
+            return False
+        try:
+            self.buffer += self.decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise SharpHoundError(f"invalid UTF-8 content: {e}")
+        return True
+
+
+    def peek(self) -> str:
+        """
+        Skip the whitespaces and return the next character, or an empty string at the end of the stream
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+
+    def expect(self, chars: str) -> str:
+        """
+        Consume the next character, which must be one of chars
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise SharpHoundError(f"expected one of {chars!r} but found {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+
+    def value(self) -> tuple:
+        """
+        Decode the next JSON value, return it along with its raw text
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A value ending with the buffer may be a truncated number or literal
+                if end < len(self.buffer) or self.eof:
+                    raw = self.buffer[self.pos:end]
+                    self.pos = end
+                    return value, raw
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise SharpHoundError(f"invalid JSON: {e}")
+                if len(self.buffer) - self.pos > MAX_OBJECT_SIZE:
+                    raise SharpHoundError(f"object larger than {MAX_OBJECT_SIZE} bytes, the file is probably corrupt: {e}")
+            self.fill()
+
+
+    def objects(self) -> Iterator[str]:
+        """
+        Yield the raw JSON text of every object of the "data" array. The "meta" block is available once exhausted
+        """
+        for _, raw in self.entries():
+            yield raw
+
+
+    def entries(self) -> Iterator[tuple]:
+        """
+        Yield every object of the "data" array decoded, along with its raw JSON text
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key, _ = self.value()
+            self.expect(":")
+            if key == "data":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                value, _ = self.value()
+                if key == "meta":
+                    self.meta = value
+            if self.expect(",}") == "}":
+                break
+        if self.peek():
+            raise SharpHoundError("unexpected content after the end of the document")
+
+
+def metaFromText(text: str) -> Optional[dict]:
+    """
+    Find and decode the "meta" block in an excerpt of a SharpHound file
+    """
+    for key in reversed(list(META_KEY.finditer(text))):
+        try:
+            meta, _ = json.JSONDecoder().raw_decode(text, key.end())
+            if isinstance(meta, dict):
+                return meta
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def readMeta(member: ZipMember) -> Optional[dict]:
+    """
+    Read the "meta" block of a SharpHound file, from its last bytes when possible or else with a full parse
+    """
+    meta = metaFromText(member.tail(META_TAIL_SIZE).decode("utf-8", errors="replace"))
+    if meta is not None:
+        return meta
+    parser = SharpHoundParser(member.stream())
+    for _ in parser.objects():
+        if parser.meta is not None:
+            break
+    return parser.meta
+
+
+def splitMember(member: JSONSource, meta: dict, max_objects: Optional[int], max_bytes: Optional[int]) -> Iterator[JSONChunk]:
+    """
+    Split a SharpHound file into valid documents of at most max_objects objects and roughly max_bytes bytes
+    """
+    stem = member.name[:-len(".json")]
+    parser = SharpHoundParser(member.stream())
+    objects, size, index = [], 0, 0
+
+    def chunk() -> JSONChunk:
+        chunk_meta = json.dumps(dict(meta, count=len(objects))).encode("utf-8")
+        content = b'{"data":[' + b",".join(objects) + b'],"meta":' + chunk_meta + b"}"
+        return JSONChunk(f"{stem}_part{index:04d}.json", content, len(objects))
+
+    for raw in parser.objects():
+        data = raw.encode("utf-8")
+        if objects and ((max_objects and len(objects) >= max_objects) or (max_bytes and size + len(data) > max_bytes)):
+            index += 1
+            yield chunk()
+            objects, size = [], 0
+        objects.append(data)
+        size += len(data) + 1
+    if objects or index == 0:
+        index += 1
+        yield chunk()
+
+
+def splitMembers(members: Iterable[JSONSource], max_objects: Optional[int], max_bytes: Optional[int]) -> Iterator[JSONSource]:
+    """
+    Replace the files exceeding the limits by bounded chunks, the other files are yielded untouched
+    """
+    for member in members:
+        if not max_objects and not (max_bytes and member.size > max_bytes):
+            yield member
+            continue
+        meta = getattr(member, "meta", None) or readMeta(member)
+        if meta is None:
+            raise SharpHoundError(f"{member.name} has no meta block")
+        if (not max_bytes or member.size <= max_bytes) and meta.get("count", 0) <= max_objects:
+            yield member
+            continue
+        yield from splitMember(member, meta, max_objects, max_bytes)
+
+
+def listJSONMembers(zip_file: str) -> List[ZipMember]:
+    """
+    List the json files of a zip archive without extracting them
+    """
+    with zipfile.ZipFile(zip_file, "r") as zip_ref:
+        return [ZipMember(zip_file, info.filename, info.file_size, info.compress_size, info.CRC)
+                for info in zip_ref.infolist()
+                if not info.is_dir() and info.filename.endswith(".json")]
@@ -0,0 +1,79 @@
+import json
+import os
+import time
+
+from pathlib import Path
+from typing import Optional
+
+MANIFEST_FILE = "ingested.json"
+MANIFEST_VERSION = 1
+
+
+class IngestManifest:
+    def __init__(self, path: Path):
+        """
+        Content hashes of the json files (or chunks) already ingested successfully into a project,
+        along with the signature of the zip members they were read from
+        """
+        self.path = path
+        self.entries = {}
+        try:
+            with open(self.path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self.signatures = {entry["signature"] for entry in self.entries.values() if entry.get("signature")}
+        # Entries recorded before the signatures were, which can only be matched by their hash
+        self.legacy = any("signature" not in entry for entry in self.entries.values())
+
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.entries
+
+
+    def mayContain(self, signature: Optional[str]) -> bool:
+        """
+        Check if a file may have been ingested from the signature of its zip member, so that the content of the new
+        members is not hashed before their upload. The files without a signature always need their hash checked
+        """
+        return signature is None or self.legacy or signature in self.signatures
+
+
+    def add(self, digest: str, name: str, size: int, signature: Optional[str] = None) -> None:
+        """
+        Record a file ingested successfully
+        """
+        self.entries[digest] = {"name": name, "size": size, "signature": signature, "ingested_at": int(time.time())}
+        if signature:
+            self.signatures.add(signature)
+
+
+    def save(self) -> None:
+        """
+        Atomically write the manifest next to the project's pickle
+        """
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".ingested-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump({"version": MANIFEST_VERSION, "files": self.entries}, tmp_file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+    def reset(self) -> None:
+        """
+        Forget every ingested file, once the graph was cleared
+        """
+        self.entries = {}
+        self.signatures = set()
+        self.legacy = False
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,173 @@
+import json
+import os
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Interval between two scrapes of the BloodHound Prometheus endpoint, in seconds
+SCRAPE_INTERVAL = 2
+SCRAPE_TIMEOUT = 2
+# Histogram buckets are left out of the samples, their sums and counts are enough to follow the rates
+SKIPPED_SERIES = re.compile(r"_bucket\{")
+
+
+class Timeline:
+    def __init__(self):
+        """
+        Timed spans of the phases of a run, and the samples of the server metrics taken meanwhile
+        """
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.start_clock = time.monotonic()
+        self.spans = []
+        self.samples = []
+        # Results of the run saved along the spans, such as the upload summary
+        self.attributes = {}
+
+
+    def record(self, name: str, start: float, end: float, **attributes) -> None:
+        """
+        Add a span from monotonic clock times
+        """
+        with self.lock:
+            self.spans.append({"name": name,
+                               "start": round(start - self.start_clock, 6),
+                               "end": round(end - self.start_clock, 6),
+                               "duration": round(end - start, 6),
+                               "thread": threading.current_thread().name,
+                               "attributes": attributes})
+
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        """
+        Time the enclosed block. The attributes yielded can be completed inside the block, failures are recorded too
+        """
+        start = time.monotonic()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, start, time.monotonic(), **attributes)
+
+
+    def untilOutput(self, name: str, process, path: Path, **attributes) -> None:
+        """
+        Record a span ending when the background process writes past the current end of its log, or exits
+        """
+        start = time.monotonic()
+        offset = path.stat().st_size
+
+        def wait() -> None:
+            while path.stat().st_size <= offset and process.poll() is None:
+                time.sleep(0.05)
+            attributes["returncode"] = process.poll()
+            self.record(name, start, time.monotonic(), **attributes)
+
+        threading.Thread(target=wait, name=f"watch-{name}", daemon=True).start()
+
+
+    def sample(self, source: str, values: dict) -> None:
+        with self.lock:
+            self.samples.append({"time": round(time.monotonic() - self.start_clock, 6), "source": source, "values": values})
+
+
+    def toDict(self) -> dict:
+        with self.lock:
+            return {**self.attributes,
+                    "started_at": self.start_time,
+                    "spans": sorted(self.spans, key=lambda span: span["start"]),
+                    "samples": list(self.samples)}
+
+
+    def save(self, path: Path, **extra) -> None:
+        """
+        Write the spans and samples as JSON, spans being relative to the start of the run in seconds
+        """
+        report = {**extra, **self.toDict()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as metrics_file:
+            json.dump(report, metrics_file, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+
+# Timeline of the current invocation
+TIMELINE = Timeline()
+
+
+def span(name: str, **attributes):
+    """
+    Time a phase of the current invocation
+    """
+    return TIMELINE.span(name, **attributes)
+
+
+def parsePrometheus(text: str) -> dict:
+    """
+    Parse the Prometheus text format into a dict of series and values
+    """
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#") or SKIPPED_SERIES.search(line):
+            continue
+        if "}" in line:
+            series, _, rest = line.rpartition("}")
+            series += "}"
+        else:
+            series, _, rest = line.partition(" ")
+        try:
+            values[series.strip()] = float(rest.split()[0])
+        except (IndexError, ValueError):
+            continue
+    return values
+
+
+class PrometheusSampler:
+    def __init__(self, url: str, interval: float = SCRAPE_INTERVAL, timeline: Optional[Timeline] = None):
+        """
+        Scrapes a Prometheus endpoint in the background into the timeline
+        """
+        self.url = url
+        self.interval = interval
+        self.timeline = timeline or TIMELINE
+        self.stopped = threading.Event()
+        self.thread = None
+        self.errors = 0
+
+
+    def scrape(self) -> None:
+        import requests
+
+        try:
+            response = requests.get(self.url, timeout=SCRAPE_TIMEOUT)
+            if response.status_code == 200:
+                self.timeline.sample(self.url, parsePrometheus(response.text))
+                return
+        except requests.exceptions.RequestException:
+            pass
+        self.errors += 1
+
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.scrape()
+            self.stopped.wait(self.interval)
+
+
+    def __enter__(self) -> "PrometheusSampler":
+        self.thread = threading.Thread(target=self.run, name="prometheus-sampler", daemon=True)
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.stopped.set()
+        self.thread.join()
+        # A last sample, to get the counters at the end of the ingestion
+        self.scrape()
@@ -0,0 +1,35 @@
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from colorama import Fore, Style
+
+from src.utils import PrefixedOutput
+
+
+def runProjects(projects: List, action: Callable) -> Dict[str, bool]:
+    """
+    Run an action on several projects at once, prefixing each line of output with the project's name
+    """
+    if not isinstance(sys.stdout, PrefixedOutput):
+        sys.stdout = PrefixedOutput(sys.stdout)
+    width = max(len(project.name) for project in projects)
+
+    def run(project) -> bool:
+        sys.stdout.setPrefix(f"[{project.name}]{' ' * (width - len(project.name))} ")
+        try:
+            action(project)
+            return True
+        except SystemExit as e:
+            # The project methods exit on errors, which must only stop this project
+            return not e.code
+        except Exception as e:
+            print(Fore.RED + f"[-] Unexpected error: {e}" + Style.RESET_ALL)
+            return False
+        finally:
+            sys.stdout.setPrefix("")
+
+    with ThreadPoolExecutor(max_workers=len(projects)) as executor:
+        results = list(executor.map(run, projects))
+    return {project.name: result for project, result in zip(projects, results)}
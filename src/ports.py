@@ -0,0 +1,50 @@
+import socket
+
+from pathlib import Path
+from typing import List, Optional, Set
+
+from src.registry import Registry
+
+DEFAULT_PORTS = {"bolt": 7687, "neo4j": 7474, "web": 8080}
+MAX_PORT = 65535
+
+
+def isPortFree(port: int) -> bool:
+    """
+    Check that nothing listens on the port by trying to bind it
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("0.0.0.0", port))
+            return True
+        except OSError:
+            return False
+
+
+def registeredPorts(source_directory: Path, exclude: Optional[List[str]] = None) -> Set[int]:
+    """
+    Return the ports reserved by the existing projects, even stopped ones, but the excluded projects
+    """
+    excluded = set(exclude or [])
+    return {port
+            for entry in Registry(source_directory).list() if entry.name not in excluded
+            for port in entry.ports.values()}
+
+
+def allocatePorts(count: int, used: Set[int], base: dict = DEFAULT_PORTS) -> List[dict]:
+    """
+    Pick count non-colliding triples of free ports, searching upwards from the base ports
+    """
+    used = set(used)
+    allocations = []
+    for _ in range(count):
+        ports = {}
+        for kind, port in base.items():
+            while port in used or not isPortFree(port):
+                port += 1
+                if port > MAX_PORT:
+                    raise RuntimeError(f"no free port left for {kind}")
+            used.add(port)
+            ports[kind] = port
+        allocations.append(ports)
+    return allocations
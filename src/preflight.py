@@ -0,0 +1,168 @@
+import hashlib
+import time
+import zipfile
+import zlib
+
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from colorama import Fore, Style
+
+from src.ingest import META_TAIL_SIZE, IngestFilter, SharpHoundError, SharpHoundParser, ZipMember, listJSONMembers, metaFromText
+
+if TYPE_CHECKING:
+    from src.manifest import IngestManifest
+
+# Oldest format version of the SharpHound and AzureHound files accepted by BloodHound CE, and the latest one known
+MIN_VERSION = 5
+LATEST_VERSION = 6
+KNOWN_TYPES = {"users", "groups", "computers", "domains", "gpos", "ous", "containers", "aiacas", "rootcas", "enterprisecas",
+               "ntauthstores", "certtemplates", "issuancepolicies", "azure"}
+
+
+def formatDuration(seconds: float) -> str:
+    """
+    Format a duration such as 1h02m, 3m20s or 12s
+    """
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def scanMember(member: ZipMember, ingest_filter: Optional[IngestFilter] = None) -> dict:
+    """
+    Read a json file of a zip once, as a stream, and check what BloodHound checks at ingestion:
+    the JSON structure, the meta block and its count against the objects of the data array
+    """
+    report = {"name": member.name, "bytes": member.size, "compressed_bytes": member.compressed_size, "type": None,
+              "version": None, "count": None, "objects": 0, "errors": [], "warnings": []}
+    sha256 = hashlib.sha256()
+    filter_objects = ingest_filter is not None and ingest_filter.filtersObjects()
+    selected, selected_bytes = 0, 0
+
+    def chunks() -> Iterator[bytes]:
+        for chunk in member.stream():
+            sha256.update(chunk)
+            yield chunk
+
+    parser = SharpHoundParser(chunks())
+    try:
+        for obj, raw in parser.entries():
+            report["objects"] += 1
+            if filter_objects and ingest_filter.selectsObject(obj):
+                selected += 1
+                selected_bytes += len(raw) + 1
+    except SharpHoundError as e:
+        report["errors"].append(f"{e} (after {report['objects']} object(s))")
+    except (zipfile.BadZipFile, EOFError, OSError, zlib.error) as e:
+        report["errors"].append(f"corrupt zip member: {e}")
+    report["sha256"] = sha256.hexdigest()
+
+    meta = parser.meta
+    if not report["errors"] and not isinstance(meta, dict):
+        report["errors"].append("no meta block")
+    elif not report["errors"]:
+        report.update({"type": meta.get("type"), "version": meta.get("version"), "count": meta.get("count")})
+        if not report["type"]:
+            report["errors"].append("meta.type is missing")
+        elif str(report["type"]).lower() not in KNOWN_TYPES:
+            report["warnings"].append(f"unknown type {report['type']}")
+        if not isinstance(report["version"], int):
+            report["errors"].append("meta.version is missing")
+        elif report["version"] < MIN_VERSION:
+            report["errors"].append(f"version {report['version']} is not supported by BloodHound CE, collect again with SharpHound CE")
+        elif report["version"] > LATEST_VERSION:
+            report["warnings"].append(f"version {report['version']} is newer than the ones known, it may need a recent BloodHound")
+        if report["count"] is None:
+            report["warnings"].append("meta.count is missing")
+        elif report["count"] != report["objects"]:
+            report["errors"].append(f"meta.count is {report['count']} but the file holds {report['objects']} object(s)")
+
+    if ingest_filter is not None and ingest_filter.active():
+        data_type = report["type"]
+        if data_type is None and report["errors"]:
+            # The meta block, written last, can still be found at the end of a file broken earlier, as the upload does
+            try:
+                data_type = (metaFromText(member.tail(META_TAIL_SIZE).decode("utf-8", errors="replace")) or {}).get("type")
+            except (zipfile.BadZipFile, EOFError, OSError, zlib.error):
+                pass
+        report["skipped"] = data_type is not None and not ingest_filter.selectsType(data_type)
+        if report["skipped"]:
+            selected, selected_bytes = 0, 0
+            # The file is left out of the upload, so its errors would not make it fail
+            report["warnings"] = [f"{error}, the file is not uploaded" for error in report["errors"]] + report["warnings"]
+            report["errors"] = []
+        elif not ingest_filter.filtersObjects():
+            selected, selected_bytes = report["objects"], report["bytes"]
+        report.update({"selected": selected, "selected_bytes": selected_bytes})
+    return report
+
+
+def inspectZip(zip_file: str, ingest_filter: Optional[IngestFilter] = None, manifest: Optional["IngestManifest"] = None,
+               on_member: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Scan every json file of a SharpHound zip and return the report of each file with the totals per type.
+    The files found in the manifest are flagged as already ingested. on_member is called with the report of each file
+    """
+    start = time.monotonic()
+    filtered = ingest_filter is not None and ingest_filter.active()
+    files, types = [], {}
+    for member in listJSONMembers(zip_file):
+        report = scanMember(member, ingest_filter)
+        report["ingested"] = manifest is not None and report["sha256"] in manifest
+        files.append(report)
+        data_type = types.setdefault(str(report["type"] or "unknown").lower(), {"files": 0, "objects": 0, "bytes": 0, "compressed_bytes": 0})
+        for key, value in (("files", 1), ("objects", report["objects"]), ("bytes", report["bytes"]), ("compressed_bytes", report["compressed_bytes"])):
+            data_type[key] += value
+        if on_member is not None:
+            on_member(report)
+
+    # What an upload of the zip would send: the selected data, without the files already ingested
+    pending = [report for report in files if not report["ingested"]]
+    return {
+        "zip": zip_file,
+        "files": files,
+        "types": types,
+        "objects": sum(report["objects"] for report in files),
+        "bytes": sum(report["bytes"] for report in files),
+        "compressed_bytes": sum(report["compressed_bytes"] for report in files),
+        "upload_objects": sum(report["selected"] if filtered else report["objects"] for report in pending),
+        "upload_bytes": sum(report["selected_bytes"] if filtered else report["bytes"] for report in pending),
+        "errors": sum(len(report["errors"]) for report in files),
+        "scan_seconds": round(time.monotonic() - start, 3),
+    }
+
+
+def printMember(report: dict) -> None:
+    """
+    Print the result of the scan of a json file
+    """
+    description = f"{report['type'] or 'unknown'} v{report['version']}, {report['objects']} object(s), {report['bytes'] / 1024 ** 2:.1f} MB"
+    if "selected" in report and not report.get("skipped"):
+        description += f", {report['selected']} selected"
+    if report["errors"]:
+        print(Fore.RED + f"   [-] {report['name']} : {'; '.join(report['errors'])}" + Style.RESET_ALL)
+    elif report.get("skipped"):
+        print(Fore.YELLOW + f"   [*] {report['name']} : {description}, not selected" + Style.RESET_ALL)
+    elif report["ingested"]:
+        print(Fore.YELLOW + f"   [*] {report['name']} : {description}, already ingested" + Style.RESET_ALL)
+    else:
+        print(Fore.GREEN + f"   [+] {report['name']} : {description}" + Style.RESET_ALL)
+    for warning in report["warnings"]:
+        print(Fore.YELLOW + f"   [*] {report['name']} : {warning}" + Style.RESET_ALL)
+
+
+def printReport(report: dict, estimate: Optional[dict] = None) -> None:
+    """
+    Print the totals of a scanned zip, per type, and the estimated duration of its upload and ingestion
+    """
+    print(Fore.YELLOW + f"[*] {len(report['files'])} file(s), {report['objects']} object(s), {report['bytes'] / 1024 ** 2:.1f} MB "
+          f"({report['compressed_bytes'] / 1024 ** 2:.1f} MB compressed), scanned in {report['scan_seconds']}s" + Style.RESET_ALL)
+    for name, data_type in sorted(report["types"].items(), key=lambda item: -item[1]["objects"]):
+        print(Fore.YELLOW + f"   * {name} : {data_type['objects']} object(s) in {data_type['files']} file(s), "
+              f"{data_type['bytes'] / 1024 ** 2:.1f} MB ({data_type['compressed_bytes'] / 1024 ** 2:.1f} MB compressed)" + Style.RESET_ALL)
+    if estimate is not None:
+        print(Fore.YELLOW + f"[*] {report['upload_objects']} object(s) to upload, estimated upload {formatDuration(estimate['upload_seconds'])} "
+              f"and ingestion {formatDuration(estimate['ingest_seconds'])}, from the last {estimate['runs']} run(s) of the project" + Style.RESET_ALL)
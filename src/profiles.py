@@ -0,0 +1,64 @@
+import os
+
+from typing import Optional
+
+# Memory budget of the neo4j container for each profile
+PROFILES = {
+    "small": 2 * 1024 ** 3,
+    "large": 16 * 1024 ** 3,
+}
+# Share of the host memory split between the projects by the auto profile, the rest is left to
+# postgres, BloodHound and the host itself
+AUTO_HOST_SHARE = 0.6
+MIN_BUDGET = 1024 ** 3
+MAX_BUDGET = 64 * 1024 ** 3
+# Above 31G the JVM loses compressed object pointers, the remaining memory is better used by the page cache
+MAX_HEAP = 31 * 1024 ** 3
+HEAP_SHARE = 0.4
+PAGECACHE_SHARE = 0.4
+# Neo4j default share of the heap usable by the transactions, made explicit so that it follows the heap
+TRANSACTION_SHARE = 0.7
+
+
+def hostMemory() -> Optional[int]:
+    """
+    Return the physical memory of the host in bytes, or None when it cannot be read
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def profileBudget(profile: str, projects: int) -> int:
+    """
+    Return the memory budget of a profile. The auto profile shares the host memory between the given number of projects
+    """
+    if profile != "auto":
+        return PROFILES[profile]
+    host = hostMemory()
+    if host is None:
+        return PROFILES["small"]
+    budget = int(host * AUTO_HOST_SHARE / max(projects, 1))
+    return min(max(budget, MIN_BUDGET), MAX_BUDGET)
+
+
+def formatSize(size: int) -> str:
+    """
+    Format a size in bytes as whole megabytes, as understood by neo4j and docker
+    """
+    return f"{size // 1024 ** 2}m"
+
+
+def neo4jSettings(budget: int) -> dict:
+    """
+    Return the neo4j environment variables fitting the heap, the page cache and the transactions in the memory budget
+    """
+    heap = min(int(budget * HEAP_SHARE), MAX_HEAP)
+    pagecache = int(budget * PAGECACHE_SHARE) + (int(budget * HEAP_SHARE) - heap)
+    return {
+        "NEO4J_dbms_memory_heap_initial__size": formatSize(heap),
+        "NEO4J_dbms_memory_heap_max__size": formatSize(heap),
+        "NEO4J_dbms_memory_pagecache_size": formatSize(pagecache),
+        "NEO4J_dbms_memory_transaction_global__max__size": formatSize(int(heap * TRANSACTION_SHARE)),
+    }
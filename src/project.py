@@ -1,22 +1,33 @@
-import os
-import subprocess
-import requests
-import zipfile
-import shutil
 import time
-import json
 import re
 import pickle
 
 from pathlib import Path
 from colorama import Fore, Back, Style
 
-from typing import List
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
 
 import src.utils as utils
+from src.metrics import TIMELINE, span
+from src.registry import Registry
+
+# The HTTP, docker and ingestion layers are imported by the methods using them, to keep the CLI startup fast
+if TYPE_CHECKING:
+    import subprocess
+    from src.api import BloodHoundAPI
+    from src.cache import DatasetCache
+    from src.golden import GoldenTemplate
+    from src.ingest import IngestFilter, JSONSource, ZipMember
+    from src.readiness import Deadline, LogTail
+    from src.manifest import IngestManifest
+    from src.scheduler import IngestScheduler
+    from src.tracker import UploadBatch, UploadStats
+
+UPLOAD_RETRIES = 3
+UPLOAD_RETRY_DELAY = 2
 
 class Project:
-    def __init__(self, name: str, source_directory: Path, ports: dict, password: str, timeout: int, no_gds: bool):
+    def __init__(self, name: str, source_directory: Path, ports: dict, password: str, timeout: int, no_gds: bool, memory: Optional[int] = None):
         """
         Represents a project
         """
@@ -27,9 +38,48 @@ class Project:
         self.password = password
         self.base_url = f"http://localhost:{self.ports['web']}"
         self.user_ID = ""
+        # Session token of the admin and its expiry time, kept with the project so that each command does not log in again
         self.jwt = ""
+        self.jwt_expiry = 0
         self.timeout = timeout
         self.no_gds = no_gds
+        # Memory budget of the neo4j container in bytes, neo4j defaults when None
+        self.memory = memory
+        self._api = None
+
+
+    def __getstate__(self) -> dict:
+        # The API client holds open connections, it is created again when needed
+        state = self.__dict__.copy()
+        state["_api"] = None
+        return state
+
+
+    def __setstate__(self, state: dict) -> None:
+        # Projects saved by older versions have no cached token nor memory budget
+        self.__dict__.update({"jwt_expiry": 0, "memory": None, "_api": None, **state})
+
+
+    @property
+    def api(self) -> "BloodHoundAPI":
+        """
+        Client of the BloodHound API of the project, logging in with the project's password when the cached token is not valid
+        """
+        from src.api import BloodHoundAPI
+
+        if self._api is None or self._api.base_url != self.base_url:
+            self._api = BloodHoundAPI(self.base_url, self.password, self.jwt, self.jwt_expiry, on_login=self.onLogin)
+        return self._api
+
+
+    def onLogin(self, token: str, expiry: float) -> None:
+        """
+        Keep a new session token, in the saved project too when it exists
+        """
+        self.jwt = token
+        self.jwt_expiry = expiry
+        if (self.source_directory / self.name / "project.pkl").exists():
+            self.save()
 
 
     def isValidPassword(self) -> bool:
@@ -52,15 +102,26 @@ class Project:
         """
         Fill and copy the docker templates into the project folder
         """
+        from src.docker import loadCompose, setEnvironment, writeCompose
+        from src.profiles import formatSize, neo4jSettings
+
         with open("./templates/docker-compose.yml", "r") as ifile:
-            with open(self.source_directory / self.name / "docker-compose.yml", "w") as ofile:
-                tmp_file = (ifile.read()
-                            .replace("7687:", str(self.ports["bolt"])+":")
-                            .replace("7474:", str(self.ports["neo4j"])+":")
-                            .replace("8080", str(self.ports["web"])))
-                if self.no_gds:
-                    tmp_file = tmp_file.replace('- NEO4J_PLUGINS=["graph-data-science"]', '')
-                ofile.write(tmp_file)
+            # Keep the license header of the template, the YAML comments are lost otherwise
+            header = "".join(line for line in ifile if line.startswith("#")) + "\n"
+        definition = loadCompose("./templates/docker-compose.yml")
+        graph_db = definition["services"]["graph-db"]
+        graph_db["ports"] = [f"{self.ports['bolt']}:7687", f"{self.ports['neo4j']}:7474"]
+        # BloodHound listens on the web port inside its container too, see bloodhound.config.json
+        definition["services"]["bloodhound"]["ports"] = [f"{self.ports['web']}:{self.ports['web']}"]
+        if self.ports.get("metrics"):
+            # Prometheus endpoint of BloodHound, see metrics_port in bloodhound.config.json
+            definition["services"]["bloodhound"]["ports"].append(f"{self.ports['metrics']}:2112")
+        if self.no_gds:
+            setEnvironment(graph_db, {"NEO4J_PLUGINS": None})
+        if self.memory:
+            setEnvironment(graph_db, neo4jSettings(self.memory))
+            graph_db["mem_limit"] = formatSize(self.memory)
+        writeCompose(self.source_directory / self.name / "docker-compose.yml", definition, header)
         
         with open("./templates/bloodhound.config.json", "r") as ifile:
             with open(self.source_directory / self.name / "bloodhound.config.json", "w") as ofile:
@@ -68,55 +129,55 @@ class Project:
                             .replace("8080", str(self.ports["web"])))
 
 
-    def getAdminPassword(self) -> str:
+    def getAdminPassword(self, log: "LogTail", deadline: "Deadline", docker_process: "subprocess.Popen") -> str:
         """
         Find and return the random temporary admin password
         """
-        start_time = time.time()
-        while True:
-            with open(self.source_directory / self.name / "logs.txt", "r") as logfile:
-                log = logfile.read()
-                if "Initial Password Set To" in log:
-                    start_index = log.find("Initial Password Set To:") + len("Initial Password Set To:")
-                    end_index = log.find('#"}', start_index)
-                    adminPassword = log[start_index:end_index].strip()
-                    return adminPassword
-                if time.time() - start_time > self.timeout:
-                    print(Fore.RED + "[-] Timeout : a problem occured, check the logs for more information" + Style.RESET_ALL)
-                    exit(1)
+        try:
+            match = log.waitFor(r'Initial Password Set To:(.*?)#"\}', deadline, docker_process)
+        except (TimeoutError, RuntimeError) as e:
+            print(Fore.RED + f"[-] Timeout : a problem occured, check the logs for more information ({e})" + Style.RESET_ALL)
+            exit(1)
+        return match.group(1).strip()
 
 
     def refreshJWT(self, adminPassword: str) -> None:
         """
-        Get the JWT token required for actions
+        Log in with the given admin password to get a new JWT token, used for the next actions
         """
-        url = self.base_url + "/api/v2/login"
-        data_to_send = {
-            "login_method": "secret",
-            "secret": adminPassword,
-            "username": "admin"
-        }
-        response = requests.post(url, json=data_to_send)
-        if response.status_code == 200:
-            response_json = response.json()
-            self.jwt = response_json["data"]["session_token"]
-            return
-        else:
-            print(Fore.RED + f"[-] Login request was not successful. Could not extract JWT. Status code : {response.status_code}\n{response.text}" + Style.RESET_ALL)
-            return
+        import requests
+        from src.api import APIError
+
+        try:
+            self.api.login(adminPassword)
+        except (APIError, requests.exceptions.RequestException) as e:
+            print(Fore.RED + f"[-] Could not extract JWT. {e}" + Style.RESET_ALL)
+            exit(1)
+
+
+    def authenticate(self) -> None:
+        """
+        Make sure that a valid JWT token is available, only logging in when the cached one expired
+        """
+        import requests
+        from src.api import APIError
+
+        try:
+            self.api.authorization()
+        except (APIError, requests.exceptions.RequestException) as e:
+            print(Fore.RED + f"[-] Could not log into BloodHound. {e}" + Style.RESET_ALL)
+            exit(1)
 
 
     def getUserID(self) -> None:
         """
         Get the user ID of the admin account
         """
-        headers = {
-                    "User-Agent": "bh-automation",
-                    "Authorization": f"Bearer {self.jwt}"
-                }
-
-        request0 = requests.get(self.base_url + f"/api/v2/self", headers=headers)
-        self.user_ID = request0.json()["data"]["id"]
+        response = self.api.get("/api/v2/self")
+        if response.status_code != 200:
+            print(Fore.RED + f"[-] Could not get the user ID of the admin. Status code : {response.status_code}\n{response.text}" + Style.RESET_ALL)
+            exit(1)
+        self.user_ID = response.json()["data"]["id"]
 
         print(Fore.GREEN + f"[+] UserID found : {self.user_ID}" + Style.RESET_ALL)
         return
@@ -126,20 +187,19 @@ class Project:
         """
         Reset the admin's password
         """
-        headers = {
-                    "User-Agent": "bh-automation",
-                    "Authorization": f"Bearer {self.jwt}",
-                    "Content-Type": "application/json",
-                }
-
         passwData = {
             "current_secret": adminPassword,
             "needs_password_reset": False,
             "secret": self.password
         }
 
-        request0 = requests.put(self.base_url + f"/api/v2/bloodhound-users/{self.user_ID}/secret", headers=headers, data=json.dumps(passwData))
-        
+        response = self.api.put(f"/api/v2/bloodhound-users/{self.user_ID}/secret", json=passwData)
+        if response.status_code >= 400:
+            print(Fore.RED + f"[-] Could not change the admin password. Status code : {response.status_code}\n{response.text}" + Style.RESET_ALL)
+            exit(1)
+        # The next logins use the new password
+        self.api.secret = self.password
+
         print(Fore.GREEN + f"[+] Changed admin password to : {self.password}" + Style.RESET_ALL)
         return
 
@@ -147,13 +207,7 @@ class Project:
         """
         Print the current BHCE server version in green.
         """
-        headers = {
-            "User-Agent": "bh-automation",
-            "Authorization": f"Bearer {self.jwt}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.get(self.base_url + "/api/version", headers=headers)
+        response = self.api.get("/api/version")
 
         if response.status_code == 200:
             json_data = response.json().get("data", {})
@@ -165,28 +219,30 @@ class Project:
         return
 
 
-    def save(self) -> None:
+    def save(self, **fields) -> None:
         """
-        Save the project object in a pickle dump
+        Save the project object in a pickle dump and refresh its entry in the projects registry
         """
         with open(self.source_directory / self.name / "project.pkl", "wb") as pkl_file:
             pickle.dump(self, pkl_file)
+        Registry(self.source_directory).update(self, **fields)
         return
 
 
+    def dataChanged(self) -> None:
+        """
+        Give a new data version to the project, the cached query results being outdated
+        """
+        from src.query import bumpDataVersion
+
+        bumpDataVersion(self.source_directory / self.name)
+
+
     def enableNTLM(self) -> None:
         """
         Enable the NTLM Post Processing Support feature (Early Access) via the BloodHound API using a PUT request
         """
-        self.refreshJWT(self.password)  # Ensure we have a valid JWT token
-        url = f"{self.base_url}/api/v2/features/18/toggle"
-        headers = {
-            "User-Agent": "bh-automation",
-            "Authorization": f"Bearer {self.jwt}",
-            "Accept": "application/json, text/plain, */*",
-        }
-
-        response = requests.put(url, headers=headers)
+        response = self.api.put("/api/v2/features/18/toggle", headers={"Accept": "application/json, text/plain, */*"})
         if response.status_code == 200 or response.status_code == 204:
             print(Fore.GREEN + "[+] NTLM Post Processing Support feature (Early Access) enabled successfully" + Style.RESET_ALL)
         else:
@@ -194,73 +250,151 @@ class Project:
         return
 
 
-    def start(self) -> None:
+    def launch(self) -> Tuple["subprocess.Popen", "LogTail", "Deadline"]:
         """
-        Start the project and do initial tasks
+        Run docker compose in the background and return its process, the tail of its logs and the startup deadline
         """
-        # Check that the password respects the complexity criteria of BH
-        if not self.isValidPassword():
-            print(Fore.RED + f"[-] The chosen password '{self.password}' does not respect the complexity criteria\nYour password must be at least 12 characters long and must contain every type of characters (lowercase, uppercase, digit and special characters)" + Style.RESET_ALL)
-            print('Exiting...')
-            exit(1)
-        
-        # Create projects directory
-        if not utils.createDir(Path(__file__).parent, self.source_directory):
-            print(Fore.RED + f'[-] The folder "{self.source_directory}" could not be created.')
-            print(Style.RESET_ALL + 'Exiting...')
-            exit(1)
-        
-        # Create project directory
-        self.createProject()
-        
-        # Setup the docker files for the project
-        self.dockerSetup()
-        print(Fore.GREEN + "[+] Docker setup done" + Style.RESET_ALL)
+        from src.docker import compose, composeBackground
+        from src.readiness import Deadline, LogTail
+
         print(Fore.YELLOW + "[*] Launching BloodHound..." + Style.RESET_ALL)
         print(f"The docker log are accessible in the {self.source_directory / self.name / 'logs.txt'} file")
 
-        # Run docker-compose
+        # Run docker-compose, the images being pulled before the containers are created from them
         try:
             with open(self.source_directory / self.name / "logs.txt", "w") as output_log:
-                docker_compose_bin = ["docker", "compose"]
-                docker_pull = subprocess.Popen(
-                    [*docker_compose_bin, "pull"], cwd=self.source_directory / self.name, text=True, stdout=output_log, stderr=output_log
-                    )
-                docker_process = subprocess.Popen(
-                    [*docker_compose_bin, "up"], cwd=self.source_directory / self.name, text=True, stdout=output_log, stderr=output_log
-                    )
-        except subprocess.CalledProcessError as e:
+                with span("pull", project=self.name) as attributes:
+                    attributes["returncode"] = compose(self.source_directory / self.name, "pull", log=output_log).returncode
+                if attributes["returncode"] != 0:
+                    # The images already on the host are used when the registry cannot be reached
+                    print(Fore.YELLOW + "[*] Could not pull the images, using the local ones. Check the logs for more information" + Style.RESET_ALL)
+                output_log.flush()
+                docker_process = composeBackground(self.source_directory / self.name, "up", log=output_log)
+                TIMELINE.untilOutput("compose up", docker_process, self.source_directory / self.name / "logs.txt", project=self.name)
+        except OSError as e:
             print(Fore.RED + f"An error occurred: {e}")
             print(Style.RESET_ALL + 'Exiting...')
             exit(1)
-        
+
+        # Only read what docker appends to the logs
+        return docker_process, LogTail(self.source_directory / self.name / "logs.txt"), Deadline(self.timeout)
+
+
+    def waitForWeb(self, deadline: "Deadline") -> None:
+        """
+        Wait for the web server to answer, or exit at the deadline
+        """
+        from src.readiness import waitForHTTP
+
+        try:
+            with span("server ready", project=self.name):
+                waitForHTTP(self.base_url + "/api/version", deadline)
+        except TimeoutError as e:
+            print(Fore.RED + f"[-] Timeout : the web server is not reachable, check the logs for more information ({e})" + Style.RESET_ALL)
+            exit(1)
+        print(Fore.GREEN + "[+] Web server launched successfully" + Style.RESET_ALL)
+
+
+    def initialize(self, log: "LogTail", deadline: "Deadline", docker_process: "subprocess.Popen") -> None:
+        """
+        Set up a fresh BloodHound instance: replace the temporary admin password and enable the features
+        """
         # Get the default admin password
-        adminPassword = self.getAdminPassword()
+        with span("password found", project=self.name):
+            adminPassword = self.getAdminPassword(log, deadline, docker_process)
         print(Fore.GREEN + f"[+] Found admin temporary password : {adminPassword}" + Style.RESET_ALL)
 
         # Wait for the web server to be ready
-        while True:
-            with open(self.source_directory / self.name / "logs.txt", "r") as logfile:
-                log = logfile.read()
-                if "Server started successfully" in log:
-                    print(Fore.GREEN + "[+] Web server launched successfully" + Style.RESET_ALL)
-                    break
-        
+        self.waitForWeb(deadline)
+
         # Get the JWT token of the admin
-        self.refreshJWT(adminPassword)
+        with span("jwt", project=self.name):
+            self.refreshJWT(adminPassword)
         print(Fore.GREEN + f"[+] Found JWT token : {self.jwt}" + Style.RESET_ALL)
 
         # Find user ID
-        self.getUserID()
+        with span("user id", project=self.name):
+            self.getUserID()
 
         # Reset the admin password
-        self.resetPassword(adminPassword)
+        with span("password reset", project=self.name):
+            self.resetPassword(adminPassword)
 
         # Display BHCE version
-        self.getApiVersion()
+        with span("version", project=self.name):
+            self.getApiVersion()
 
         # Enable NTLM feature
-        self.enableNTLM()
+        with span("features", project=self.name):
+            self.enableNTLM()
+
+
+    def resume(self, adminPassword: str, deadline: "Deadline") -> None:
+        """
+        Log into an already initialized BloodHound instance, setting the project's password if needed
+        """
+        self.waitForWeb(deadline)
+
+        with span("jwt", project=self.name):
+            self.refreshJWT(adminPassword)
+        print(Fore.GREEN + f"[+] Found JWT token : {self.jwt}" + Style.RESET_ALL)
+
+        with span("user id", project=self.name):
+            self.getUserID()
+
+        if adminPassword != self.password:
+            with span("password reset", project=self.name):
+                self.resetPassword(adminPassword)
+
+        with span("version", project=self.name):
+            self.getApiVersion()
+
+
+    def start(self, golden: Optional["GoldenTemplate"] = None) -> None:
+        """
+        Start the project and do initial tasks. New projects are cloned from the golden template when one is given
+        """
+        from src.golden import OVERRIDE_FILE
+
+        # Check that the password respects the complexity criteria of BH
+        if not self.isValidPassword():
+            print(Fore.RED + f"[-] The chosen password '{self.password}' does not respect the complexity criteria\nYour password must be at least 12 characters long and must contain every type of characters (lowercase, uppercase, digit and special characters)" + Style.RESET_ALL)
+            print('Exiting...')
+            exit(1)
+        
+        # Create projects directory
+        if not utils.createDir(Path(__file__).parent, self.source_directory):
+            print(Fore.RED + f'[-] The folder "{self.source_directory}" could not be created.')
+            print(Style.RESET_ALL + 'Exiting...')
+            exit(1)
+        
+        # Create project directory
+        self.createProject()
+        
+        # Setup the docker files for the project
+        with span("docker setup", project=self.name):
+            self.dockerSetup()
+        restored = False
+        if golden is not None:
+            golden.writeOverride(self.source_directory / self.name, clone=True)
+            try:
+                with span("golden restore", project=self.name, template=golden.key):
+                    restored = golden.restore(self.source_directory / self.name)
+            except RuntimeError as e:
+                (self.source_directory / self.name / OVERRIDE_FILE).unlink()
+                print(Fore.RED + f"[-] Could not clone the golden template {golden.key}: {e}" + Style.RESET_ALL)
+                print('Exiting...')
+                exit(1)
+        print(Fore.GREEN + "[+] Docker setup done" + Style.RESET_ALL)
+
+        docker_process, log, deadline = self.launch()
+        if (self.source_directory / self.name / OVERRIDE_FILE).exists():
+            # The state of BloodHound is kept in volumes, it was initialized by the golden template or a previous start
+            self.resume(golden.password if restored else self.password, deadline)
+            if restored:
+                golden.checkVersion(self.bhce_version)
+        else:
+            self.initialize(log, deadline, docker_process)
 
         print(Fore.GREEN + 
           f"""
@@ -282,131 +416,501 @@ class Project:
           """ 
           + Style.RESET_ALL)
         
-        self.save()
+        self.save(running=True)
         return
 
 
-    def extractZip(self, zip_file: str) -> List[str]:
+    def extractZip(self, zip_file: str) -> List["ZipMember"]:
         """
-        Extract the zip file into a temporary directory
+        List the json files of the zip file, which are streamed at upload time instead of being extracted
         """
-        extract_directory = self.source_directory / self.name / ".json_tmp_storage"
+        import zipfile
+        from src.ingest import listJSONMembers
 
-        # Remove the existing directory if it exists
-        if os.path.exists(extract_directory):
-            shutil.rmtree(extract_directory)
+        try:
+            with span("extraction", project=self.name, zip=zip_file) as attributes:
+                json_files = listJSONMembers(zip_file)
+                attributes["files"] = len(json_files)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(Fore.RED + f"[-] Could not read the zip file {zip_file}: {e}")
+            print(Style.RESET_ALL + 'Exiting...')
+            exit(1)
 
-        # Create the extraction directory
-        os.makedirs(extract_directory)
+        return json_files
 
-        # Extract the contents of the zip file
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            zip_ref.extractall(extract_directory)
-        
-        file_list = os.listdir(extract_directory)
-        json_files = [extract_directory / file for file in file_list if file.endswith(".json")]
 
-        return json_files
+    def filterJSON(self, json_files: List["ZipMember"], ingest_filter: "IngestFilter") -> Iterable["JSONSource"]:
+        """
+        Only keep the json files of the selected types, and the objects of the selected domains
+        """
+        from src.ingest import filterMembers
+
+        if not ingest_filter.active():
+            return json_files
+        print(Fore.YELLOW + f"[*] Only ingesting the selected data : {ingest_filter.key()}" + Style.RESET_ALL)
+
+        def skip(member: "ZipMember", data_type: str) -> None:
+            utils.printLocked(Fore.YELLOW + f"   [*] Skipped {member.name}, {data_type} are not selected" + Style.RESET_ALL)
+
+        return filterMembers(json_files, ingest_filter, skip)
+
+
+    def splitJSON(self, json_files: Iterable["JSONSource"], max_objects: Optional[int], max_bytes: Optional[int]) -> Iterable["JSONSource"]:
+        """
+        Split the json files exceeding the given limits into smaller files of the same upload batch
+        """
+        from src.ingest import splitMembers
+
+        if max_objects or max_bytes:
+            limits = ", ".join(limit for limit in [f"{max_objects} objects" if max_objects else "",
+                                                   f"{max_bytes} bytes" if max_bytes else ""] if limit)
+            print(Fore.YELLOW + f"[*] Json files are split into chunks of at most {limits}" + Style.RESET_ALL)
+        return splitMembers(json_files, max_objects, max_bytes)
+
+
+    def uploadFile(self, batch: "UploadBatch", file: "JSONSource", stats: "UploadStats", manifest: Optional["IngestManifest"]) -> bool:
+        """
+        Upload a single json file into an upload batch, retrying on transient errors. Files already ingested are skipped
+        """
+        import requests
+        import zipfile
+        import zlib
+        from src.api import APIError
+        from src.compression import ENCODING_HEADERS, ENCODING_NONE, CompressedStream
+        from src.ingest import SharpHoundError
+        from src.tracker import MeasuredStream
+
+        # Errors reading the file itself, which sending it again would not fix. Filtered files are parsed while they are sent
+        read_errors = (zipfile.BadZipFile, zlib.error, EOFError, OSError, SharpHoundError)
+        try:
+            # Only the files whose zip member matches an ingested one are hashed, the others are read once, by their upload
+            if manifest is not None and manifest.mayContain(file.signature()) and file.digest() in manifest:
+                stats.skip()
+                utils.printLocked(Fore.YELLOW + f"   [*] Skipped {file.name}, already ingested" + Style.RESET_ALL)
+                return True
+        except read_errors as e:
+            utils.printLocked(Fore.RED + f"   [-] Failed to upload {file.name}. Could not read the file: {e}" + Style.RESET_ALL)
+            return False
+        uploadId = batch.start()
+        if uploadId is None:
+            return False
+
+        with span("upload file", project=self.name, file=file.name) as attributes:
+            attempt = 1
+            while attempt <= UPLOAD_RETRIES:
+                encoding = batch.encoding()
+                try:
+                    # The generator body is sent with chunked transfer encoding, so the file is never held in memory
+                    body = MeasuredStream(file.stream(), getattr(file, "count", None))
+                    data = body if encoding == ENCODING_NONE else CompressedStream(body, encoding, file.name, file.size)
+                    # The body is a stream, the attempts are made here so that it is built again each time
+                    response = batch.api.post(f"/api/v2/file-upload/{uploadId}", headers=ENCODING_HEADERS[encoding], data=data, retries=1)
+                    if response.status_code < 400:
+                        stats.add(body, data.size)
+                        attributes.update({"bytes": body.size, "wire_bytes": data.size, "encoding": encoding, "attempts": attempt})
+                        batch.add(body, file.name, file.signature(), getattr(file, "upload_digest", None))
+                        utils.printLocked(Fore.GREEN + f"   [+] Successfully uploaded {file.name}" + Style.RESET_ALL)
+                        return True
+                    error = f"Status code : {response.status_code}\n{response.text}"
+                    if encoding != ENCODING_NONE and response.status_code in (400, 415):
+                        # Compressed bodies are not supported by this server, try again right away without compression
+                        batch.reject(encoding)
+                        continue
+                    # A rejected token was renewed by the client, the file is sent again with the new one
+                    if response.status_code < 500 and response.status_code != 401:
+                        break
+                except (requests.exceptions.RequestException, APIError) as e:
+                    error = str(e)
+                except read_errors as e:
+                    error = f"Could not read the file: {e}"
+                    break
+                if attempt < UPLOAD_RETRIES:
+                    utils.printLocked(Fore.YELLOW + f"   [*] Upload of {file.name} failed, retrying ({attempt}/{UPLOAD_RETRIES - 1})..." + Style.RESET_ALL)
+                    time.sleep(UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+                attempt += 1
+            attributes.update({"error": error.split("\n")[0], "attempts": min(attempt, UPLOAD_RETRIES)})
+            utils.printLocked(Fore.RED + f"   [-] Failed to upload {file.name}. {error}" + Style.RESET_ALL)
+            return False
+
+
+    def uploadJSON(self, json_files: Iterable["JSONSource"], workers: int = 4, ingest_timeout: int = 0, force: bool = False, encodings: Optional[List[str]] = None,
+                   scrape_metrics: bool = False, scheduler: Optional["IngestScheduler"] = None) -> dict:
+        """
+        Upload json files into BH, with several files of the batch in flight at once, and return the metrics of the batch.
+        Unless forced, the files whose content was already ingested into the project are not uploaded again.
+        The bodies are compressed with the first of the encodings accepted by the server.
+        With scrape_metrics, the Prometheus endpoint of BloodHound is sampled during the ingestion when the project publishes it.
+        With a scheduler, the ingestion waits for its turn in the host-wide queue
+        """
+        batch, stats = self.uploadFiles(json_files, workers, force, encodings)
+        return self.ingestBatch(batch, stats, ingest_timeout, scrape_metrics, scheduler)
 
 
-    def uploadJSON(self, json_files: List[str]):
+    def uploadFiles(self, json_files: Iterable["JSONSource"], workers: int = 4, force: bool = False, encodings: Optional[List[str]] = None) -> Tuple["UploadBatch", "UploadStats"]:
         """
-        Upload json files into BH
+        Upload json files into a new upload batch, which is not submitted for ingestion yet. Exit if a file could not be uploaded.
+        Without encodings, the files are sent as plain json
         """
-        self.refreshJWT(self.password)
-        print(Fore.GREEN + f"[+] Refreshed JWT token : {self.jwt}" + Style.RESET_ALL)
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from src.compression import ENCODING_NONE
+        from src.ingest import SharpHoundError
+        from src.manifest import MANIFEST_FILE, IngestManifest
+        from src.tracker import UploadBatch, UploadStats
 
-        headers = {
-                    "User-Agent": "bh-automation",
-                    "Authorization": f"Bearer {self.jwt}",
-                    "Content-Type": "application/json",
-                }
+        with span("jwt", project=self.name):
+            self.authenticate()
         print(Fore.YELLOW + "[*] Starting json upload..." + Style.RESET_ALL)
 
-        request1 = requests.post(self.base_url + "/api/v2/file-upload/start", headers=headers)
-        uploadId = request1.json()["data"]["id"]
-        print(Fore.GREEN + f"   [+] Started new upload batch, id : {uploadId}" + Style.RESET_ALL)
+        # One keep-alive connection per worker, shared by the whole batch
+        self.api.setPoolSize(workers)
+
+        manifest = IngestManifest(self.source_directory / self.name / MANIFEST_FILE)
+        stats = UploadStats()
+        batch = UploadBatch(self.api, encodings or [ENCODING_NONE])
+
+        # Files may be produced lazily (e.g. chunks held in memory), so only a few of them are queued ahead of the workers
+        in_flight = threading.BoundedSemaphore(workers * 2)
+        uploads = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                try:
+                    for file in json_files:
+                        in_flight.acquire()
+                        upload = executor.submit(self.uploadFile, batch, file, stats, None if force else manifest)
+                        upload.add_done_callback(lambda _: in_flight.release())
+                        uploads.append(upload)
+                except SharpHoundError as e:
+                    print(Fore.RED + f"[-] Could not read the json files: {e}" + Style.RESET_ALL)
+                    executor.shutdown(cancel_futures=True)
+                    exit(1)
+                results = [upload.result() for upload in uploads]
+            uploadId = batch.id
+            stats.upload_end_time = time.monotonic()
+            TIMELINE.record("upload", stats.start_time, stats.upload_end_time, project=self.name, upload_id=uploadId,
+                            files=stats.files, skipped_files=stats.skipped, bytes=stats.bytes, wire_bytes=stats.wire_bytes)
+
+            if not all(results):
+                print(Fore.RED + f"[-] {results.count(False)} file(s) could not be uploaded" + Style.RESET_ALL)
+                exit(1)
+        except BaseException:
+            # Otherwise the batch would stay open on the server until it times out
+            self.abandonBatch(batch)
+            raise
+        return batch, stats
 
-        for file in json_files:
-            with open(file, "r", encoding="utf-8-sig") as f:
-                data = f.read().encode("utf-8")
-                request2 = requests.post(self.base_url + f"/api/v2/file-upload/{uploadId}", headers=headers, data=data)
-                print(Fore.GREEN + f"   [+] Successfully uploaded {file.name}" + Style.RESET_ALL)
-        
-        request3 = requests.post(self.base_url + f"/api/v2/file-upload/{uploadId}/end", headers=headers)
 
-        print(Fore.YELLOW + f"   [*] Waiting for BloodHound to ingest the data. This could take a few minutes." + Style.RESET_ALL)
-        while True:
-            ingest = requests.get(self.base_url + f"/api/v2/file-upload?skip=0&limit=10&sort_by=-id", headers=headers)
-            status = ingest.json()["data"][0]
+    def abandonBatch(self, batch: "UploadBatch") -> None:
+        """
+        End an upload batch whose upload failed. BloodHound ingests the files uploaded so far, which are not recorded
+        in the manifest, so that they are uploaded again with the rest of the zip
+        """
+        import requests
+        from src.api import APIError
+        from src.history import HISTORY_FILE, IngestHistory
 
-            if status["id"] == uploadId and status["status_message"] == "Complete":
+        if batch.id is None:
+            return
+        try:
+            response = batch.end()
+        except (requests.exceptions.RequestException, APIError) as e:
+            print(Fore.RED + f"[-] Failed to end the upload batch {batch.id}. {e}" + Style.RESET_ALL)
+            return
+        if response.status_code >= 400:
+            print(Fore.RED + f"[-] Failed to end the upload batch {batch.id}. Status code : {response.status_code}\n{response.text}" + Style.RESET_ALL)
+            return
+        print(Fore.YELLOW + f"[*] Ended the upload batch {batch.id}, the files uploaded before the failure are ingested" + Style.RESET_ALL)
+        self.dataChanged()
+        IngestHistory(self.source_directory / self.name / HISTORY_FILE).recordEvent("abandon")
+
+
+    def ingestBatch(self, batch: "UploadBatch", stats: "UploadStats", ingest_timeout: int = 0, scrape_metrics: bool = False,
+                    scheduler: Optional["IngestScheduler"] = None) -> dict:
+        """
+        End an upload batch and wait for BloodHound to ingest it. The files of the batch are recorded in the manifest once fully ingested
+        """
+        import contextlib
+        from src.api import APIError
+        from src.history import HISTORY_FILE, IngestHistory
+        from src.manifest import MANIFEST_FILE, IngestManifest
+        from src.metrics import PrometheusSampler
+        from src.scheduler import DEFAULT_INGEST_RATE
+        from src.tracker import JOB_COMPLETE, JOB_PARTIALLY_COMPLETE, IngestTracker, printSummary
+
+        uploadId = batch.id
+        if uploadId is None:
+            stats.ingest_end_time = time.monotonic()
+            summary = stats.summary(None, "Unchanged", True, complete=True)
+            print(Fore.GREEN + f"[+] Every json file was already ingested, nothing to upload (use --force to upload them again)" + Style.RESET_ALL)
+            printSummary(summary)
+            return summary
+
+        history = IngestHistory(self.source_directory / self.name / HISTORY_FILE)
+        slot = contextlib.nullcontext()
+        if scheduler is not None:
+            slot = scheduler.slot(self.name, stats.objects / (history.ingestRate() or DEFAULT_INGEST_RATE), self.memory)
+        queued = time.monotonic()
+        # The slot is held from the submission of the batch to the end of its ingestion
+        with slot:
+            TIMELINE.record("ingest queue", queued, time.monotonic(), project=self.name, upload_id=uploadId)
+            stats.ingest_start_time = time.monotonic()
+            with span("end batch", project=self.name, upload_id=uploadId):
+                request3 = batch.end()
+            if request3.status_code >= 400:
+                print(Fore.RED + f"[-] Failed to end the upload batch {uploadId}. Status code : {request3.status_code}\n{request3.text}" + Style.RESET_ALL)
+                exit(1)
+            self.dataChanged()
+
+            print(Fore.YELLOW + f"   [*] Waiting for BloodHound to ingest the data. This could take a few minutes." + Style.RESET_ALL)
+            sampler = contextlib.nullcontext()
+            if scrape_metrics and "metrics" in self.ports:
+                sampler = PrometheusSampler(f"http://localhost:{self.ports['metrics']}/metrics")
+            with span("ingest wait", project=self.name, upload_id=uploadId) as attributes, sampler:
+                try:
+                    job = IngestTracker(self.api, uploadId, ingest_timeout).wait()
+                except APIError as e:
+                    attributes["status"] = "Error"
+                    print(Fore.RED + f"[-] {e}" + Style.RESET_ALL)
+                    exit(1)
+                attributes["status"] = job.get("status_message", "") if job is not None else "Timeout"
+            stats.ingest_end_time = time.monotonic()
+        # Queries run during the ingestion saw partial data
+        self.dataChanged()
+
+        if job is None:
+            summary = stats.summary(uploadId, "Timeout", False)
+            print(Fore.RED + f"[-] BloodHound did not finish ingesting the upload batch {uploadId} within {ingest_timeout}s" + Style.RESET_ALL)
+        else:
+            summary = stats.summary(uploadId, job.get("status_message", ""), job["status"] in (JOB_COMPLETE, JOB_PARTIALLY_COMPLETE),
+                                    complete=job["status"] == JOB_COMPLETE)
+            if job["status"] == JOB_COMPLETE:
                 print(Fore.GREEN + f"[+] The JSON upload was successful" + Style.RESET_ALL)
-                return
+                # Only a complete ingestion guarantees that every file of the batch is in the graph. The manifest is read again,
+                # other batches may have been ingested since this one was uploaded
+                manifest = IngestManifest(self.source_directory / self.name / MANIFEST_FILE)
+                for digest, (name, size, signature) in batch.uploaded.items():
+                    manifest.add(digest, name, size, signature)
+                manifest.save()
+            elif job["status"] == JOB_PARTIALLY_COMPLETE:
+                print(Fore.YELLOW + f"[*] The JSON upload was partially ingested, some files were rejected by BloodHound" + Style.RESET_ALL)
             else:
-                time.sleep(5)
+                print(Fore.RED + f"[-] The ingestion of the upload batch {uploadId} ended with the status : {summary['status']}" + Style.RESET_ALL)
+        # Measures the rates used to estimate the next uploads of the project, and tells that it holds data
+        history.record(summary)
+        printSummary(summary)
+        return summary
     
 
+    def holdsData(self) -> Optional[bool]:
+        """
+        Check if the project holds data: loaded by this script since it was created or last cleared, or else found in the graph,
+        such as data uploaded through the web interface. None when the server could not be asked
+        """
+        from src.history import HISTORY_FILE, IngestHistory
+        from src.manifest import MANIFEST_FILE, IngestManifest
+
+        project_dir = self.source_directory / self.name
+        if len(IngestManifest(project_dir / MANIFEST_FILE).entries) > 0 or IngestHistory(project_dir / HISTORY_FILE).dataLoaded():
+            return True
+        return self.graphHoldsData()
+
+
+    def graphHoldsData(self) -> Optional[bool]:
+        """
+        Ask BloodHound if its graph holds any node, or return None when it cannot tell (server down, cypher queries refused...)
+        """
+        import requests
+        from src.api import APIError
+
+        try:
+            self.api.authorization()
+            response = self.api.post("/api/v2/graphs/cypher", json={"query": "MATCH (n) RETURN n LIMIT 1", "include_properties": False})
+        except (APIError, requests.exceptions.RequestException):
+            return None
+        # BloodHound answers a query without any result with a 404
+        if response.status_code == 404:
+            return False
+        if response.status_code == 200:
+            return True
+        return None
+
+
     def clear(self) -> None:
         """
         Clear the Neo4j database via BloodHound API
         """
-        self.refreshJWT(self.password)
-        url = f"http://localhost:{self.ports['web']}/api/v2/clear-database"
-        headers = {
-            "User-Agent": "bh-automation",
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.jwt}"
-        }
+        from src.history import HISTORY_FILE, IngestHistory
+        from src.manifest import MANIFEST_FILE, IngestManifest
 
+        self.authenticate()
         data = {
             "deleteCollectedGraphData": True
         }
 
-        response = requests.post(url, headers=headers, json=data)
+        response = self.api.post("/api/v2/clear-database", json=data)
         if response.status_code == 204:
+            IngestManifest(self.source_directory / self.name / MANIFEST_FILE).reset()
+            IngestHistory(self.source_directory / self.name / HISTORY_FILE).recordEvent("clear")
+            self.dataChanged()
             print(Fore.GREEN + "[+] Neo4j database cleared successfully. You must wait a few seconds before the changes take effect." + Style.RESET_ALL)
         else:
             print(Fore.RED + f"[-] Failed to clear Neo4j database. Status code: {response.status_code}\n{response.text}" + Style.RESET_ALL)
 
 
+    def dumpCommands(self, dump_dir: Path) -> dict:
+        """
+        Return the docker compose commands saving and loading the graph and the application database through dump_dir
+        """
+        import os
+
+        user = os.environ.get("POSTGRES_USER") or "bloodhound"
+        run = ["run", "--rm", "--no-deps", "-v", f"{Path(dump_dir).resolve()}:/dump", "graph-db", "neo4j-admin"]
+        return {
+            "graph_dump": [*run, "dump", "--database=neo4j", "--to=/dump/neo4j.dump"],
+            "graph_load": [*run, "load", "--from=/dump/neo4j.dump", "--database=neo4j", "--force"],
+            "app_db_dump": ["exec", "-T", "app-db", "pg_dump", "-U", user, "-d", user, "-Fc"],
+            "app_db_load": ["exec", "-T", "app-db", "pg_restore", "-U", user, "-d", user, "--clean", "--if-exists", "--no-owner", "--single-transaction"],
+        }
+
+
+    def snapshotDataset(self, cache: "DatasetCache", key: str, zip_file: str, summary: dict) -> bool:
+        """
+        Save the graph and the application database into the dataset cache. BloodHound and neo4j are stopped meanwhile,
+        since neo4j-admin dump needs an offline database
+        """
+        import shutil
+        from src.cache import APP_DB_DUMP
+        from src.docker import compose
+        from src.golden import templateImages
+        from src.manifest import MANIFEST_FILE
+        from src.readiness import Deadline
+
+        project_dir = self.source_directory / self.name
+        print(Fore.YELLOW + f"[*] Saving the dataset into the cache..." + Style.RESET_ALL)
+        started = time.monotonic()
+        directory = cache.reserve(key)
+        commands = self.dumpCommands(directory)
+        try:
+            with open(project_dir / "logs.txt", "a") as output_log:
+                if compose(project_dir, "stop", "bloodhound", "graph-db", log=output_log).returncode != 0:
+                    raise RuntimeError("could not stop the containers")
+                try:
+                    with open(directory / APP_DB_DUMP, "wb") as dump_file:
+                        if compose(project_dir, *commands["app_db_dump"], log=output_log, stdout=dump_file).returncode != 0:
+                            raise RuntimeError("pg_dump failed")
+                    if compose(project_dir, *commands["graph_dump"], log=output_log).returncode != 0:
+                        raise RuntimeError("neo4j-admin dump failed")
+                finally:
+                    compose(project_dir, "up", "-d", "graph-db", "bloodhound", log=output_log)
+            if (project_dir / MANIFEST_FILE).exists():
+                shutil.copy(project_dir / MANIFEST_FILE, directory / MANIFEST_FILE)
+        except (OSError, RuntimeError) as e:
+            shutil.rmtree(directory, ignore_errors=True)
+            print(Fore.RED + f"[-] Could not save the dataset into the cache: {e}, check the logs for more information" + Style.RESET_ALL)
+            return False
+
+        entry = cache.store(key, directory, {
+            "zip_name": Path(zip_file).name,
+            "project": self.name,
+            "bhce_version": self.bhce_version,
+            "neo4j_image": templateImages(project_dir / "docker-compose.yml").get("graph-db", ""),
+            # The application database holds the admin account of this project, needed to log in after a restore
+            "password": self.password,
+            "objects": summary.get("objects", 0),
+        })
+        TIMELINE.record("cache snapshot", started, time.monotonic(), project=self.name, key=key, bytes=entry["size"])
+        print(Fore.GREEN + f"[+] Dataset cached as {key[:12]} ({entry['size'] / 1024 ** 2:.1f} MB)" + Style.RESET_ALL)
+        self.waitForWeb(Deadline(self.timeout))
+        return True
+
+
+    def restoreDataset(self, cache: "DatasetCache", entry: dict) -> None:
+        """
+        Replace the graph and the application database with a cached dataset, skipping the upload and the ingestion
+        """
+        import shutil
+        from src.cache import APP_DB_DUMP
+        from src.docker import compose
+        from src.history import HISTORY_FILE, IngestHistory
+        from src.manifest import MANIFEST_FILE, IngestManifest
+        from src.readiness import Deadline
+
+        project_dir = self.source_directory / self.name
+        directory = Path(entry["path"])
+        print(Fore.YELLOW + f"[*] Restoring the dataset {entry['key'][:12]} ({entry.get('zip_name', '')}) from the cache..." + Style.RESET_ALL)
+        started = time.monotonic()
+        cache.touch(entry)
+        commands = self.dumpCommands(directory)
+        try:
+            with open(project_dir / "logs.txt", "a") as output_log:
+                if compose(project_dir, "stop", "bloodhound", "graph-db", log=output_log).returncode != 0:
+                    raise RuntimeError("could not stop the containers")
+                try:
+                    if compose(project_dir, *commands["graph_load"], log=output_log).returncode != 0:
+                        raise RuntimeError("neo4j-admin load failed")
+                    with open(directory / APP_DB_DUMP, "rb") as dump_file:
+                        if compose(project_dir, *commands["app_db_load"], log=output_log, stdin=dump_file).returncode != 0:
+                            raise RuntimeError("pg_restore failed")
+                finally:
+                    compose(project_dir, "up", "-d", "graph-db", "bloodhound", log=output_log)
+        except (OSError, RuntimeError) as e:
+            print(Fore.RED + f"[-] Could not restore the dataset: {e}, check the logs for more information" + Style.RESET_ALL)
+            exit(1)
+
+        TIMELINE.record("cache restore", started, time.monotonic(), project=self.name, key=entry["key"])
+        self.dataChanged()
+        IngestHistory(project_dir / HISTORY_FILE).recordEvent("restore")
+        manifest = IngestManifest(project_dir / MANIFEST_FILE)
+        manifest.reset()
+        if (directory / MANIFEST_FILE).exists():
+            shutil.copy(directory / MANIFEST_FILE, project_dir / MANIFEST_FILE)
+
+        # The admin account now is the one of the cached project
+        self.resume(entry.get("password", self.password), Deadline(self.timeout))
+        print(Fore.GREEN + f"[+] Dataset restored, {entry.get('objects', 0)} object(s) loaded without ingestion" + Style.RESET_ALL)
+
+
     def stop(self) -> None:
-        # Run docker-compose
-        print(Fore.GREEN + f"[+] Stopping project : {self.name}" + Style.RESET_ALL)
+        """
+        Stop the containers of the project and wait for them to be stopped
+        """
+        from src.docker import compose
 
+        print(Fore.YELLOW + f"[*] Stopping project : {self.name}" + Style.RESET_ALL)
         try:
-            with open(self.source_directory / self.name / "logs.txt", "w") as output_log:
-                docker_compose_bin = ["docker", "compose"]
-                docker_stop = subprocess.Popen(
-                    [*docker_compose_bin, "stop"], cwd=self.source_directory / self.name, text=True, stdout=output_log,
-                    stderr=output_log
-                )
-                print(Fore.GREEN + f"[+] Done!" + Style.RESET_ALL)
-        except subprocess.CalledProcessError as e:
+            with open(self.source_directory / self.name / "logs.txt", "a") as output_log:
+                returncode = compose(self.source_directory / self.name, "stop", log=output_log).returncode
+        except OSError as e:
             print(Fore.RED + f"An error occurred: {e}")
             print(Style.RESET_ALL + 'Exiting...')
             exit(1)
-
+        if returncode != 0:
+            print(Fore.RED + f"[-] docker compose stop failed with code {returncode}, check the logs for more information" + Style.RESET_ALL)
+            exit(1)
+        Registry(self.source_directory).set(self.name, running=False)
+        print(Fore.GREEN + f"[+] Project {self.name} stopped" + Style.RESET_ALL)
 
 
     def delete(self) -> None:
         """
-        Delete the containers and network interface
+        Delete the containers, volumes and network interface, then the project's folder once docker is done
         """
+        import shutil
+        from src.docker import compose
+
         print(Fore.YELLOW + f"[*] Deleting {self.name} project..." + Style.RESET_ALL)
-        # Run docker-compose
         try:
             with open(self.source_directory / self.name / "logs.txt", "a") as output_log:
-                docker_compose_bin = ["docker", "compose"]
-                docker_process = subprocess.Popen(
-                    [*docker_compose_bin, "down"], cwd=self.source_directory / self.name, text=True, stdout=output_log, stderr=output_log
-                    )
-        except subprocess.CalledProcessError as e:
+                returncode = compose(self.source_directory / self.name, "down", "--volumes", "--remove-orphans", log=output_log).returncode
+        except OSError as e:
             print(Fore.RED + f"An error occurred: {e}")
             print(Style.RESET_ALL + 'Exiting...')
             exit(1)
-        # Wait for a bit
-        time.sleep(10)
+        if returncode != 0:
+            # The project's folder is kept, it is needed to remove the containers
+            print(Fore.RED + f"[-] docker compose down failed with code {returncode}, check the logs for more information" + Style.RESET_ALL)
+            exit(1)
         # Delete project's folder
         shutil.rmtree(self.source_directory / self.name)
+        Registry(self.source_directory).remove(self.name)
         print(Fore.GREEN + f"[+] The project {self.name} has been successfuly deleted" + Style.RESET_ALL)
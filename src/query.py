@@ -0,0 +1,192 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from colorama import Fore, Style
+
+from src.metrics import span
+from src.utils import printLocked
+
+QUERY_CACHE_DIR = "queries"
+# Stamp of the data loaded into the project, changed by every data, clear or restore
+DATA_VERSION_FILE = "data.version"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "neo5j"
+FORMATS = ["jsonl", "csv"]
+
+
+def dataVersion(project_dir: Path) -> str:
+    """
+    Return the data version of a project, created on first use
+    """
+    try:
+        with open(project_dir / DATA_VERSION_FILE, "r") as version_file:
+            version = version_file.read().strip()
+        if version:
+            return version
+    except OSError:
+        pass
+    return bumpDataVersion(project_dir)
+
+
+def bumpDataVersion(project_dir: Path) -> str:
+    """
+    Give a new data version to a project, so that the results cached for the previous data are not used anymore
+    """
+    version = uuid.uuid4().hex
+    tmp_path = project_dir / f".{DATA_VERSION_FILE}.tmp"
+    with open(tmp_path, "w") as version_file:
+        version_file.write(version)
+    os.replace(tmp_path, project_dir / DATA_VERSION_FILE)
+    return version
+
+
+def listQueries(paths: List[str]) -> List[Path]:
+    """
+    Return the .cypher files given, directories being searched recursively
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.cypher")))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def csvValue(value):
+    """
+    Format a value for a CSV cell, lists and maps being written as JSON
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, default=str)
+
+
+class QueryRunner:
+    def __init__(self, project_dir: Path, bolt_port: int, jobs: int = 4, output_format: str = "jsonl", use_cache: bool = True):
+        """
+        Runs Cypher queries on the neo4j database of a project over bolt, with up to jobs sessions at once.
+        The results are cached per data version, so that the queries are only run again once the data changed
+        """
+        self.project_dir = Path(project_dir)
+        self.uri = f"bolt://localhost:{bolt_port}"
+        self.jobs = jobs
+        self.output_format = output_format
+        self.use_cache = use_cache
+        self.version = dataVersion(self.project_dir)
+        self.cache_dir = self.project_dir / QUERY_CACHE_DIR / self.version
+        self.driver = None
+
+
+    def prune(self) -> None:
+        """
+        Delete the results cached for previous versions of the data
+        """
+        if not (self.project_dir / QUERY_CACHE_DIR).is_dir():
+            return
+        for directory in (self.project_dir / QUERY_CACHE_DIR).iterdir():
+            if directory.name != self.version:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+    def cached(self, key: str) -> Optional[dict]:
+        """
+        Return the metadata of cached results, or None
+        """
+        try:
+            with open(self.cache_dir / f"{key}.json", "r") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        return meta if (self.cache_dir / f"{key}.{self.output_format}").exists() else None
+
+
+    def write(self, result, path: Path) -> int:
+        """
+        Stream the records of a result into a file, return the number of rows
+        """
+        rows = 0
+        with open(path, "w", newline="") as out_file:
+            if self.output_format == "csv":
+                writer = csv.writer(out_file)
+                writer.writerow(result.keys())
+                for record in result:
+                    writer.writerow([csvValue(value) for value in record.data().values()])
+                    rows += 1
+            else:
+                for record in result:
+                    out_file.write(json.dumps(record.data(), default=str) + "\n")
+                    rows += 1
+        return rows
+
+
+    def run(self, query_file: Path, out_dir: Path) -> dict:
+        """
+        Run a query, or take its results from the cache, and copy them into the output directory
+        """
+        import neo4j
+
+        start = time.monotonic()
+        report = {"query": str(query_file), "output": str(out_dir / f"{query_file.stem}.{self.output_format}"), "cached": False}
+        try:
+            text = query_file.read_text()
+        except OSError as e:
+            return {**report, "error": str(e), "seconds": 0}
+        key = hashlib.sha256(text.encode()).hexdigest()
+        meta = self.cached(key) if self.use_cache else None
+        if meta is None:
+            tmp_path = self.cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+            try:
+                with self.driver.session() as session:
+                    rows = session.execute_read(lambda tx: self.write(tx.run(text), tmp_path))
+                os.replace(tmp_path, self.cache_dir / f"{key}.{self.output_format}")
+            except (neo4j.exceptions.Neo4jError, neo4j.exceptions.DriverError, OSError) as e:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                return {**report, "error": str(e).split("\n")[0], "seconds": round(time.monotonic() - start, 3)}
+            meta = {"query": str(query_file), "rows": rows, "run_seconds": round(time.monotonic() - start, 3), "ran_at": int(time.time())}
+            with open(self.cache_dir / f"{key}.json", "w") as meta_file:
+                json.dump(meta, meta_file)
+        else:
+            report["cached"] = True
+        shutil.copyfile(self.cache_dir / f"{key}.{self.output_format}", report["output"])
+        return {**report, "rows": meta["rows"], "run_seconds": meta["run_seconds"], "seconds": round(time.monotonic() - start, 3)}
+
+
+    def runAll(self, query_files: List[Path], out_dir: Path) -> List[dict]:
+        """
+        Run the queries in parallel, printing the rows and the duration of each one as it ends
+        """
+        import neo4j
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.prune()
+
+        def run(query_file: Path) -> dict:
+            with span("query", file=query_file.name) as attributes:
+                report = self.run(query_file, out_dir)
+                attributes.update({key: report[key] for key in ("rows", "cached", "error") if key in report})
+            if "error" in report:
+                printLocked(Fore.RED + f"   [-] {query_file.name} failed: {report['error']}" + Style.RESET_ALL)
+            elif report["cached"]:
+                printLocked(Fore.GREEN + f"   [+] {query_file.name} : {report['rows']} row(s), cached (ran in {report['run_seconds']}s)" + Style.RESET_ALL)
+            else:
+                printLocked(Fore.GREEN + f"   [+] {query_file.name} : {report['rows']} row(s) in {report['seconds']}s" + Style.RESET_ALL)
+            return report
+
+        self.driver = neo4j.GraphDatabase.driver(self.uri, auth=(NEO4J_USER, NEO4J_PASSWORD), max_connection_pool_size=self.jobs)
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                return list(executor.map(run, query_files))
+        finally:
+            self.driver.close()
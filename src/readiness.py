@@ -0,0 +1,99 @@
+import re
+import time
+import subprocess
+
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+POLL_INTERVAL = 0.2
+HTTP_BACKOFF_START = 0.1
+HTTP_BACKOFF_MAX = 2
+
+
+class Deadline:
+    def __init__(self, timeout: float):
+        """
+        Represents the time budget shared by every phase of a startup
+        """
+        self.timeout = timeout
+        self.end = time.monotonic() + timeout
+
+
+    def remaining(self) -> float:
+        """
+        Return the number of seconds left, never negative
+        """
+        return max(self.end - time.monotonic(), 0)
+
+
+    def expired(self) -> bool:
+        """
+        Check if the time budget is spent
+        """
+        return self.remaining() == 0
+
+
+class LogTail:
+    def __init__(self, path: Path):
+        """
+        Reads a growing log file incrementally, from the last byte offset read
+        """
+        self.path = path
+        self.offset = 0
+        self.partial = ""
+
+
+    def lines(self) -> list:
+        """
+        Return the complete lines written since the last call
+        """
+        try:
+            with open(self.path, "rb") as logfile:
+                logfile.seek(0, 2)
+                if logfile.tell() < self.offset:
+                    # The file was truncated, start over
+                    self.offset, self.partial = 0, ""
+                logfile.seek(self.offset)
+                data = logfile.read()
+                self.offset += len(data)
+        except FileNotFoundError:
+            return []
+        *lines, self.partial = (self.partial + data.decode("utf-8", errors="replace")).split("\n")
+        return lines
+
+
+    def waitFor(self, pattern: str, deadline: Deadline, process: Optional[subprocess.Popen] = None) -> re.Match:
+        """
+        Wait for a line matching the pattern to be written, only scanning new data
+        """
+        regex = re.compile(pattern)
+        while True:
+            for line in self.lines():
+                match = regex.search(line)
+                if match:
+                    return match
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"the process writing {self.path.name} exited with code {process.returncode}")
+            if deadline.expired():
+                raise TimeoutError(f"'{pattern}' was not found in {self.path.name}")
+            time.sleep(min(POLL_INTERVAL, deadline.remaining()))
+
+
+def waitForHTTP(url: str, deadline: Deadline) -> None:
+    """
+    Poll an HTTP endpoint with exponential backoff until the server answers without a server error
+    """
+    delay = HTTP_BACKOFF_START
+    while True:
+        try:
+            response = requests.get(url, timeout=max(deadline.remaining(), 1))
+            if response.status_code < 500:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        if deadline.expired():
+            raise TimeoutError(f"{url} did not answer")
+        time.sleep(min(delay, deadline.remaining()))
+        delay = min(delay * 2, HTTP_BACKOFF_MAX)
@@ -0,0 +1,185 @@
+import json
+import os
+import pickle
+
+from pathlib import Path
+from typing import ContextManager, List, Optional
+
+from src.utils import fileLock
+
+REGISTRY_FILE = "registry.json"
+LOCK_FILE = ".registry.lock"
+SCHEMA_VERSION = 1
+
+
+class ProjectEntry:
+    def __init__(self, source_directory: Path, fields: dict):
+        """
+        Represents a registered project. Its fields are read from the index, the full project is only unpickled on demand
+        """
+        self.source_directory = source_directory
+        self.fields = fields
+
+
+    def __getattr__(self, name: str):
+        try:
+            return self.__dict__["fields"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+    def load(self):
+        """
+        Unpickle the full project
+        """
+        with open(self.source_directory / self.name / "project.pkl", "rb") as pkl_file:
+            return pickle.load(pkl_file)
+
+
+class Registry:
+    def __init__(self, source_directory: Path):
+        """
+        Index of the projects, stored in a single json file of the projects directory
+        """
+        self.source_directory = Path(source_directory)
+        self.path = self.source_directory / REGISTRY_FILE
+
+
+    def locked(self) -> ContextManager[None]:
+        """
+        Hold the registry lock, so that concurrent invocations do not lose each other's updates
+        """
+        return fileLock(self.source_directory / LOCK_FILE)
+
+
+    def load(self) -> Optional[dict]:
+        """
+        Return the indexed projects by name, or None when the index is missing or has an outdated schema
+        """
+        try:
+            with open(self.path, "r") as registry_file:
+                registry = json.load(registry_file)
+            if registry.get("version") == SCHEMA_VERSION:
+                return registry["projects"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+
+    def read(self) -> dict:
+        """
+        Return the indexed projects by name, rebuilding the index when needed
+        """
+        if not self.source_directory.exists():
+            return {}
+        projects = self.load()
+        if projects is None:
+            with self.locked():
+                projects = self.readUnlocked()
+                self.write(projects)
+        return projects
+
+
+    def write(self, projects: dict) -> None:
+        """
+        Atomically replace the index, must be called with the lock held
+        """
+        import tempfile
+
+        os.makedirs(self.source_directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.source_directory, prefix=".registry-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump({"version": SCHEMA_VERSION, "projects": projects}, tmp_file, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+    def rebuild(self) -> dict:
+        """
+        Index the projects by unpickling the project.pkl at the first level of the projects directory
+        """
+        projects = {}
+        for pkl_path in sorted(self.source_directory.glob("*/project.pkl")):
+            try:
+                with open(pkl_path, "rb") as pkl_file:
+                    project = pickle.load(pkl_file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                continue
+            projects[project.name] = fieldsOf(project, running=False)
+        return projects
+
+
+    def update(self, project, **fields) -> None:
+        """
+        Add or refresh a project in the index
+        """
+        with self.locked():
+            projects = self.readUnlocked()
+            previous = projects.get(project.name, {})
+            projects[project.name] = fieldsOf(project, **{"running": previous.get("running", False), **fields})
+            self.write(projects)
+
+
+    def set(self, name: str, **fields) -> None:
+        """
+        Change some fields of an indexed project
+        """
+        with self.locked():
+            projects = self.readUnlocked()
+            if name in projects:
+                projects[name].update(fields)
+                self.write(projects)
+
+
+    def remove(self, name: str) -> None:
+        """
+        Remove a project from the index
+        """
+        with self.locked():
+            projects = self.readUnlocked()
+            if projects.pop(name, None) is not None:
+                self.write(projects)
+
+
+    def readUnlocked(self) -> dict:
+        """
+        Return the indexed projects while the lock is already held
+        """
+        projects = self.load()
+        return self.rebuild() if projects is None else projects
+
+
+    def get(self, name: str) -> Optional[ProjectEntry]:
+        """
+        Return a project of the index, or None if it does not exist
+        """
+        fields = self.read().get(name)
+        if fields is None or not (self.source_directory / name / "project.pkl").exists():
+            return None
+        return ProjectEntry(self.source_directory, fields)
+
+
+    def list(self, running: Optional[bool] = None) -> List[ProjectEntry]:
+        """
+        Return the indexed projects, optionally filtered on their running state
+        """
+        return [ProjectEntry(self.source_directory, fields)
+                for fields in self.read().values()
+                if running is None or fields.get("running", False) == running]
+
+
+def fieldsOf(project, **extra) -> dict:
+    """
+    Return the fields of a project stored in the index
+    """
+    return {
+        "name": project.name,
+        "bhce_version": project.bhce_version,
+        "ports": project.ports,
+        "password": project.password,
+        "no_gds": project.no_gds,
+        **extra,
+    }
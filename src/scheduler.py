@@ -0,0 +1,151 @@
+import json
+import os
+import time
+import uuid
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from colorama import Fore, Style
+
+from src.utils import fileLock, printLocked
+
+QUEUE_FILE = ".ingest-queue.json"
+QUEUE_LOCK = ".ingest-queue.lock"
+DEFAULT_SLOTS = 2
+POLL_INTERVAL = 1
+# Seconds between two reports of the queue position when it does not change
+REPORT_INTERVAL = 30
+# Ingest rate assumed to estimate the waits, in objects per second
+DEFAULT_INGEST_RATE = 1000
+# Memory accounted for the projects started without a memory budget, as with the small profile
+DEFAULT_MEMORY = 2 * 1024 ** 3
+
+
+def processAlive(pid: int) -> bool:
+    """
+    Check if a process of this host is still running
+    """
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestScheduler:
+    def __init__(self, source_directory: Path, slots: int = DEFAULT_SLOTS, memory_budget: Optional[int] = None, priority: int = 0):
+        """
+        Host-wide queue of the ingestions of every project, stored in the projects directory and shared by the invocations of the script.
+        At most slots ingestions run at once, and within the memory budget of their neo4j containers when one is given.
+        The ingestions of a higher priority go first, then they are admitted in arrival order
+        """
+        self.source_directory = Path(source_directory)
+        self.path = self.source_directory / QUEUE_FILE
+        self.slots = max(slots, 1)
+        self.memory_budget = memory_budget
+        self.priority = priority
+
+
+    def read(self) -> List[dict]:
+        """
+        Return the queue entries of the running processes, while the lock is held
+        """
+        try:
+            with open(self.path, "r") as queue_file:
+                entries = json.load(queue_file)
+        except (OSError, ValueError):
+            return []
+        # Entries of interrupted invocations are dropped
+        return [entry for entry in entries if processAlive(entry["pid"])]
+
+
+    def write(self, entries: List[dict]) -> None:
+        tmp_path = self.path.with_name(f"{QUEUE_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as queue_file:
+            json.dump(entries, queue_file, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+    def waiting(self, entries: List[dict]) -> List[dict]:
+        """
+        Return the entries waiting for a slot, the highest priority first then in arrival order
+        """
+        return sorted((entry for entry in entries if entry["admitted_at"] is None), key=lambda entry: (-entry["priority"], entry["enqueued_at"]))
+
+
+    def admissible(self, entry: dict, running: List[dict]) -> bool:
+        """
+        Check if an ingestion can start next to the running ones. A lone ingestion is always admitted, whatever its memory
+        """
+        if not running:
+            return True
+        if len(running) >= self.slots:
+            return False
+        return self.memory_budget is None or sum(other["memory"] for other in running) + entry["memory"] <= self.memory_budget
+
+
+    def estimate(self, entries: List[dict], entry_id: str) -> float:
+        """
+        Return the estimated seconds before an entry is admitted, simulating the queue with the estimated ingestion times
+        """
+        now = time.time()
+        running = [entry for entry in entries if entry["admitted_at"] is not None]
+        ends = sorted(max(entry["estimate"] - (now - entry["admitted_at"]), 0) for entry in running)
+        ends += [0] * max(self.slots - len(ends), 0)
+        for entry in self.waiting(entries):
+            start = ends.pop(0)
+            if entry["id"] == entry_id:
+                return start
+            ends = sorted(ends + [start + entry["estimate"]])
+        return 0
+
+
+    @contextmanager
+    def slot(self, project: str, estimate: float = 0, memory: Optional[int] = None) -> Iterator[float]:
+        """
+        Wait for an ingestion slot, reporting the position in the queue, and hold it until the block exits.
+        Yield the number of seconds waited
+        """
+        entry = {"id": uuid.uuid4().hex, "project": project, "pid": os.getpid(), "priority": self.priority,
+                 "memory": memory or DEFAULT_MEMORY, "estimate": estimate, "enqueued_at": time.time(), "admitted_at": None}
+        lock_path = self.source_directory / QUEUE_LOCK
+        with fileLock(lock_path):
+            self.write(self.read() + [entry])
+
+        start = time.monotonic()
+        reported, reported_at = None, 0
+        try:
+            while True:
+                with fileLock(lock_path):
+                    entries = self.read()
+                    if entry["id"] not in {other["id"] for other in entries}:
+                        entries.append(entry)
+                    running = [other for other in entries if other["admitted_at"] is not None]
+                    waiting = self.waiting(entries)
+                    # First come first served: an ingestion waits while another one is ahead of it, even if it would fit
+                    if waiting[0]["id"] == entry["id"] and self.admissible(entry, running):
+                        entry["admitted_at"] = time.time()
+                        self.write([entry if other["id"] == entry["id"] else other for other in entries])
+                        break
+                    self.write(entries)
+                position = [other["id"] for other in waiting].index(entry["id"]) + 1
+                if position != reported or time.monotonic() - reported_at > REPORT_INTERVAL:
+                    busy = ", ".join(sorted({other["project"] for other in running}))
+                    printLocked(Fore.YELLOW + f"   [*] Waiting for an ingestion slot : position {position} in the queue, about "
+                                f"{self.estimate(entries, entry['id']):.0f}s left (ingesting : {busy or 'none'})" + Style.RESET_ALL)
+                    reported, reported_at = position, time.monotonic()
+                time.sleep(POLL_INTERVAL)
+            waited = time.monotonic() - start
+            if reported is not None:
+                printLocked(Fore.GREEN + f"   [+] Ingestion slot acquired after {waited:.0f}s" + Style.RESET_ALL)
+            yield waited
+        finally:
+            with fileLock(lock_path):
+                self.write([other for other in self.read() if other["id"] != entry["id"]])
@@ -0,0 +1,258 @@
+import hashlib
+import threading
+import time
+
+from typing import Iterable, Iterator, List, Optional
+
+import requests
+from colorama import Fore, Style
+
+from src.api import APIError, BloodHoundAPI
+from src.compression import ENCODING_NONE
+from src.ingest import metaFromText
+from src.utils import printLocked
+
+JOB_INVALID = -1
+JOB_COMPLETE = 2
+JOB_CANCELED = 3
+JOB_TIMED_OUT = 4
+JOB_FAILED = 5
+JOB_PARTIALLY_COMPLETE = 8
+TERMINAL_STATUSES = {JOB_INVALID, JOB_COMPLETE, JOB_CANCELED, JOB_TIMED_OUT, JOB_FAILED, JOB_PARTIALLY_COMPLETE}
+
+POLL_START = 0.5
+POLL_MAX = 15
+POLL_FACTOR = 1.5
+# Bytes kept from both ends of an uploaded file to read its object count from the "meta" block
+META_SNIFF_SIZE = 64 * 1024
+
+
+class UploadStats:
+    def __init__(self):
+        """
+        Counters of an upload batch, shared by the upload workers
+        """
+        self.lock = threading.Lock()
+        self.files = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.objects = 0
+        self.start_time = time.monotonic()
+        self.upload_end_time = None
+        # The batch may wait between the end of its upload and its submission for ingestion
+        self.ingest_start_time = None
+        self.ingest_end_time = None
+
+
+    def add(self, stream: "MeasuredStream", wire_size: int) -> None:
+        """
+        Account for a file uploaded successfully, wire_size being the size actually sent once compressed
+        """
+        with self.lock:
+            self.files += 1
+            self.bytes += stream.size
+            self.wire_bytes += wire_size
+            self.objects += stream.objects or 0
+
+
+    def skip(self) -> None:
+        """
+        Account for a file skipped because it was already ingested
+        """
+        with self.lock:
+            self.skipped += 1
+
+
+    def summary(self, upload_id: Optional[int], status: str, ingested: bool, complete: bool = False) -> dict:
+        """
+        Return the metrics of the batch. A batch is complete when every file of the zip is in the graph
+        """
+        now = time.monotonic()
+        upload_end = self.upload_end_time or now
+        ingest_start = self.ingest_start_time or upload_end
+        ingest_end = self.ingest_end_time or now
+        elapsed = ingest_end - self.start_time
+        return {
+            "upload_id": upload_id,
+            "status": status,
+            "ingested": ingested,
+            "complete": complete,
+            "files": self.files,
+            "skipped_files": self.skipped,
+            "bytes": self.bytes,
+            "wire_bytes": self.wire_bytes,
+            "objects": self.objects,
+            "upload_seconds": round(upload_end - self.start_time, 3),
+            "queued_seconds": round(ingest_start - upload_end, 3),
+            "ingest_seconds": round(ingest_end - ingest_start, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "upload_bytes_per_second": round(self.bytes / max(upload_end - self.start_time, 1e-6)),
+            "wire_bytes_per_second": round(self.wire_bytes / max(upload_end - self.start_time, 1e-6)),
+            "objects_per_second": round(self.objects / max(elapsed, 1e-6), 1),
+        }
+
+
+class UploadBatch:
+    def __init__(self, api: BloodHoundAPI, encodings: Optional[List[str]] = None):
+        """
+        Represents a file-upload batch, only started on the server once a file actually needs to be uploaded.
+        The body encodings are tried in order of preference, until the server accepts one, plain json by default
+        """
+        self.api = api
+        self.encodings = list(encodings or [ENCODING_NONE])
+        self.lock = threading.Lock()
+        self.id = None
+        # SHA-256 of the files uploaded in the batch, with their name, size and signature
+        self.uploaded = {}
+
+
+    def start(self) -> Optional[int]:
+        """
+        Start the batch if needed and return its id, or None if the server refused it
+        """
+        with self.lock:
+            if self.id is None:
+                try:
+                    response = self.api.post("/api/v2/file-upload/start")
+                except (requests.exceptions.RequestException, APIError) as e:
+                    printLocked(Fore.RED + f"   [-] Could not start an upload batch. {e}" + Style.RESET_ALL)
+                    return None
+                if response.status_code >= 400:
+                    printLocked(Fore.RED + f"   [-] Could not start an upload batch. Status code : {response.status_code}\n{response.text}" + Style.RESET_ALL)
+                    return None
+                self.id = response.json()["data"]["id"]
+                printLocked(Fore.GREEN + f"   [+] Started new upload batch, id : {self.id}" + Style.RESET_ALL)
+            return self.id
+
+
+    def end(self) -> requests.Response:
+        """
+        End the started batch, which submits its files for ingestion. Not retried, the batch could be ended twice otherwise
+        """
+        return self.api.post(f"/api/v2/file-upload/{self.id}/end", retries=1)
+
+
+    def encoding(self) -> str:
+        """
+        Return the preferred body encoding not rejected by the server so far
+        """
+        with self.lock:
+            return self.encodings[0]
+
+
+    def reject(self, encoding: str) -> None:
+        """
+        Stop using an encoding the server does not accept, uncompressed json being the last resort
+        """
+        with self.lock:
+            if encoding in self.encodings and len(self.encodings) > 1:
+                self.encodings.remove(encoding)
+                printLocked(Fore.YELLOW + f"   [*] The server does not accept {encoding} uploads, falling back to {self.encodings[0]}" + Style.RESET_ALL)
+
+
+    def add(self, stream: "MeasuredStream", name: str, signature: Optional[str] = None, digest: Optional[str] = None) -> None:
+        """
+        Record a file uploaded successfully in the batch, with the signature of its zip member.
+        The file is identified by the hash of the content sent, unless it provides its own digest
+        """
+        with self.lock:
+            self.uploaded[digest or stream.sha256.hexdigest()] = (name, stream.size, signature)
+
+
+class MeasuredStream:
+    def __init__(self, stream: Iterable[bytes], objects: Optional[int] = None):
+        """
+        Forwards a file's chunks while measuring its size, and its object count when the meta block can be found
+        """
+        self.stream = stream
+        self.size = 0
+        self.objects = objects
+        self.sha256 = hashlib.sha256()
+
+
+    def __iter__(self) -> Iterator[bytes]:
+        head, tail = b"", b""
+        for chunk in self.stream:
+            self.size += len(chunk)
+            self.sha256.update(chunk)
+            if len(head) < META_SNIFF_SIZE:
+                head += chunk[:META_SNIFF_SIZE - len(head)]
+            tail = (tail + chunk[-META_SNIFF_SIZE:])[-META_SNIFF_SIZE:]
+            yield chunk
+        if self.objects is None:
+            for text in (tail, head):
+                meta = metaFromText(text.decode("utf-8", errors="replace"))
+                if meta is not None:
+                    self.objects = meta.get("count")
+                    break
+
+
+class IngestTracker:
+    def __init__(self, api: BloodHoundAPI, upload_id: int, timeout: int):
+        """
+        Follows the ingestion of an upload batch until it reaches a terminal status
+        """
+        self.api = api
+        self.upload_id = upload_id
+        self.timeout = timeout
+        # Cleared when the server refuses the filter on the job id, the latest jobs are listed instead
+        self.filtered = True
+
+
+    def getJob(self) -> Optional[dict]:
+        """
+        Return the upload job tracked, or None if the server does not know it (yet) or is temporarily unavailable.
+        Raise an APIError when the server rejects the request
+        """
+        path = f"/api/v2/file-upload?id=eq:{self.upload_id}" if self.filtered else "/api/v2/file-upload?sort_by=-id"
+        response = self.api.get(path, retries=1)
+        if 400 <= response.status_code < 500:
+            if self.filtered:
+                self.filtered = False
+                return self.getJob()
+            raise APIError(f"Could not follow the ingestion of the upload batch {self.upload_id}. "
+                           f"Status code : {response.status_code}\n{response.text}", response)
+        if response.status_code != 200:
+            return None
+        for job in response.json().get("data") or []:
+            if job.get("id") == self.upload_id:
+                return job
+        return None
+
+
+    def wait(self) -> Optional[dict]:
+        """
+        Poll the upload job, quickly at first then less and less often. Return the job in its terminal status, or None on timeout.
+        Raise an APIError when the server keeps rejecting the requests
+        """
+        start_time = time.monotonic()
+        delay = POLL_START
+        while True:
+            try:
+                job = self.getJob()
+            except (requests.exceptions.RequestException, APIError) as e:
+                # Only connection errors and 5xx statuses are worth waiting for
+                if isinstance(e, APIError) and e.response is not None and 400 <= e.response.status_code < 500:
+                    raise
+                job = None
+            if job is not None and job.get("status") in TERMINAL_STATUSES:
+                return job
+            if self.timeout and time.monotonic() - start_time + delay > self.timeout:
+                return None
+            time.sleep(delay)
+            delay = min(delay * POLL_FACTOR, POLL_MAX)
+
+
+def printSummary(summary: dict) -> None:
+    """
+    Print the metrics of an upload batch
+    """
+    skipped = f", skipped {summary['skipped_files']} already ingested" if summary["skipped_files"] else ""
+    print(Fore.YELLOW + f"   [*] Uploaded {summary['files']} file(s){skipped}, {summary['bytes'] / 1024 ** 2:.1f} MB in {summary['upload_seconds']}s "
+          f"({summary['upload_bytes_per_second'] / 1024 ** 2:.1f} MB/s)" + Style.RESET_ALL)
+    if summary["wire_bytes"] < summary["bytes"]:
+        print(Fore.YELLOW + f"   [*] Sent {summary['wire_bytes'] / 1024 ** 2:.1f} MB compressed, "
+              f"{summary['bytes'] / max(summary['wire_bytes'], 1):.1f}x smaller" + Style.RESET_ALL)
+    print(Fore.YELLOW + f"   [*] Ingested {summary['objects']} object(s) in {summary['ingest_seconds']}s, "
+          f"{summary['elapsed_seconds']}s overall ({summary['objects_per_second']} objects/s)" + Style.RESET_ALL)
@@ -1,8 +1,19 @@
 import os
+import re
+import threading
 
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 from colorama import Fore, Back, Style
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PRINT_LOCK = threading.RLock()
+
 def createDir(directory_path: Path, project_name: Path) -> bool:
     """
     Create a directory if it doesn't already exist
@@ -12,9 +23,87 @@ def createDir(directory_path: Path, project_name: Path) -> bool:
             os.makedirs(directory_path / project_name)
             print(Fore.YELLOW + f"[*] Created {project_name} directory" + Style.RESET_ALL)
             return True
+        except FileExistsError:
+            # Created in the meantime by a project started concurrently
+            return True
         except OSError as e:
             print(Fore.RED + f"An error occurred while creating {directory_path} directrory: {e}")
             print(Style.RESET_ALL + 'Exiting...')
             return False
     else:
-        return True
\ No newline at end of file
+        return True
+
+
+def parseSize(size: str) -> int:
+    """
+    Parse a size in bytes, with an optional K, M or G suffix
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)i?B?\s*", size, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size: {size}")
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    return int(match.group(1)) * units[match.group(2).upper()]
+
+
+@contextmanager
+def fileLock(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on the file, shared with the other invocations of the script (no-op without fcntl)
+    """
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def printLocked(*args, **kwargs) -> None:
+    """
+    Print from a worker thread without interleaving with the other threads' lines
+    """
+    with PRINT_LOCK:
+        print(*args, **kwargs)
+
+
+class PrefixedOutput:
+    def __init__(self, stream):
+        """
+        Wraps an output stream so that every line printed by a thread starts with that thread's prefix
+        """
+        self.stream = stream
+        self.local = threading.local()
+
+
+    def setPrefix(self, prefix: str) -> None:
+        """
+        Set the prefix of the lines printed by the current thread
+        """
+        if getattr(self.local, "line", ""):
+            self.write("\n")
+        self.local.prefix = prefix
+        self.local.line = ""
+
+
+    def write(self, text: str) -> int:
+        prefix = getattr(self.local, "prefix", "")
+        if not prefix:
+            with PRINT_LOCK:
+                return self.stream.write(text)
+        # Lines are only written once complete, so the threads' output never interleaves
+        *lines, self.local.line = (self.local.line + text).split("\n")
+        if lines:
+            with PRINT_LOCK:
+                self.stream.write("".join(f"{prefix}{line}\n" for line in lines))
+        return len(text)
+
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
@@ -0,0 +1,260 @@
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+from colorama import Fore, Style
+
+from src.utils import printLocked
+
+if TYPE_CHECKING:
+    from src.scheduler import IngestScheduler
+
+WATCH_FILE = "watched.json"
+WATCH_VERSION = 1
+POLL_INTERVAL = 5
+# Zips modified more recently than this may still be written by a collector or a copy
+SETTLE_TIME = 10
+
+STATUS_DONE = "done"
+STATUS_PARTIAL = "partial"
+STATUS_FAILED = "failed"
+
+
+class WatchState:
+    def __init__(self, path: Path):
+        """
+        Archives already processed by the watch mode of a project, keyed by the SHA-256 of the zip
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(self.path, "r") as state_file:
+                state = json.load(state_file)
+            if state.get("version") == WATCH_VERSION:
+                self.entries = state["archives"]
+        except (OSError, ValueError, KeyError):
+            pass
+        # Files already identified, so that their content is only hashed again when they change
+        self.known = {(entry["path"], entry["size"], entry["mtime"]): digest for digest, entry in self.entries.items()}
+
+
+    def processed(self, digest: str, retry_failed: bool = False) -> bool:
+        """
+        Check if an archive was processed, failed ones only counting when they are not retried
+        """
+        with self.lock:
+            entry = self.entries.get(digest)
+        return entry is not None and not (retry_failed and entry["status"] == STATUS_FAILED)
+
+
+    def add(self, digest: str, path: Path, signature: tuple, status: str, summary: Optional[dict] = None) -> None:
+        """
+        Record a processed archive and save the state
+        """
+        import tempfile
+
+        with self.lock:
+            self.entries[digest] = {"path": signature[0], "size": signature[1], "mtime": signature[2], "name": path.name,
+                                    "status": status, "upload_id": (summary or {}).get("upload_id"),
+                                    "objects": (summary or {}).get("objects", 0), "processed_at": int(time.time())}
+            self.known[signature] = digest
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".watched-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w") as tmp_file:
+                    json.dump({"version": WATCH_VERSION, "archives": self.entries}, tmp_file, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+
+class ZipWatcher:
+    def __init__(self, project, directory: Path, workers: int, ingest_timeout: int, encodings: List[str],
+                 max_chunk_objects: Optional[int] = None, max_chunk_bytes: Optional[int] = None,
+                 interval: float = POLL_INTERVAL, settle: float = SETTLE_TIME, retry_failed: bool = False,
+                 scheduler: Optional["IngestScheduler"] = None):
+        """
+        Feeds the SharpHound zips dropped into a directory to a project, through a pipeline of three stages running at once:
+        the next zip is validated while the current one is uploaded and the previous one is ingested.
+        Batches are submitted for ingestion one at a time, in the order they were found
+        """
+        self.project = project
+        self.directory = Path(directory)
+        self.workers = workers
+        self.ingest_timeout = ingest_timeout
+        self.encodings = encodings
+        self.max_chunk_objects = max_chunk_objects
+        self.max_chunk_bytes = max_chunk_bytes
+        self.interval = interval
+        self.settle = settle
+        self.retry_failed = retry_failed
+        self.scheduler = scheduler
+        self.state = WatchState(project.source_directory / project.name / WATCH_FILE)
+        # Only one archive waits between two stages, so the stages never run more than one zip ahead of each other
+        self.uploads = queue.Queue(maxsize=1)
+        self.ingests = queue.Queue(maxsize=1)
+        # Archives in the pipeline, by digest and by file
+        self.pending = set()
+        self.queued = set()
+        self.previous = {}
+        # Seconds before the last zip found too recent to be processed has settled
+        self.settling = 0
+
+
+    def signature(self, path: Path) -> Optional[tuple]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (str(path.resolve()), stat.st_size, int(stat.st_mtime))
+
+
+    def scan(self, once: bool = False) -> List[tuple]:
+        """
+        Return the new zips which are fully written, as (path, signature) in modification order.
+        A zip is ready once it has not changed since the previous scan nor for the settle time, and its central directory can be read.
+        With once, the zips found are not compared with a previous scan, and the ones which cannot be opened once settled are reported
+        """
+        ready = []
+        current = {}
+        now = time.time()
+        self.settling = 0
+        signatures = [(path, self.signature(path)) for path in self.directory.glob("*.zip") if not path.name.startswith(".")]
+        for path, signature in sorted(filter(lambda item: item[1] is not None, signatures), key=lambda item: item[1][2]):
+            current[signature[0]] = signature
+            if signature in self.queued or self.state.known.get(signature) in self.pending:
+                continue
+            if signature in self.state.known and self.state.processed(self.state.known[signature], self.retry_failed):
+                continue
+            if not once and self.previous.get(signature[0]) != signature:
+                continue
+            if now - signature[2] < self.settle:
+                self.settling = max(self.settling, min(self.settle - (now - signature[2]), self.settle))
+                continue
+            if not zipfile.is_zipfile(path):
+                if once:
+                    printLocked(Fore.RED + f"[-] {path.name} is not a valid zip, skipped" + Style.RESET_ALL)
+                continue
+            ready.append((path, signature))
+        self.previous = current
+        return ready
+
+
+    def validate(self, path: Path, signature: tuple) -> None:
+        """
+        First stage: identify the zip, list its json files and queue it for upload
+        """
+        from src.cache import zipDigest
+
+        try:
+            digest = zipDigest(str(path))
+        except OSError as e:
+            printLocked(Fore.RED + f"[-] Could not read {path.name}: {e}" + Style.RESET_ALL)
+            return
+        if digest in self.pending:
+            # Copy of an archive in the pipeline
+            self.state.known[signature] = digest
+            return
+        if self.state.processed(digest, self.retry_failed):
+            # Same content as an archive already processed, under another name
+            self.state.known[signature] = digest
+            printLocked(Fore.YELLOW + f"[*] {path.name} was already processed, skipped" + Style.RESET_ALL)
+            return
+        printLocked(Fore.YELLOW + f"[*] New archive : {path.name}" + Style.RESET_ALL)
+        try:
+            jsons = self.project.extractZip(str(path))
+        except SystemExit:
+            self.state.add(digest, path, signature, STATUS_FAILED)
+            return
+        self.pending.add(digest)
+        self.queued.add(signature)
+        self.uploads.put((path, signature, digest, self.project.splitJSON(jsons, self.max_chunk_objects, self.max_chunk_bytes)))
+
+
+    def upload(self) -> None:
+        """
+        Second stage: upload the json files of each zip into its own batch
+        """
+        while True:
+            item = self.uploads.get()
+            if item is None:
+                self.ingests.put(None)
+                return
+            path, signature, digest, jsons = item
+            printLocked(Fore.YELLOW + f"[*] Uploading {path.name}..." + Style.RESET_ALL)
+            try:
+                # The files already ingested from previous zips are skipped
+                batch, stats = self.project.uploadFiles(jsons, self.workers, False, self.encodings)
+            except (SystemExit, Exception) as e:
+                self.fail(path, signature, digest, e)
+                continue
+            self.ingests.put((path, signature, digest, batch, stats))
+
+
+    def ingest(self) -> None:
+        """
+        Third stage: submit the batches for ingestion one after the other, and record the archives once ingested
+        """
+        while True:
+            item = self.ingests.get()
+            if item is None:
+                return
+            path, signature, digest, batch, stats = item
+            printLocked(Fore.YELLOW + f"[*] Ingesting {path.name}..." + Style.RESET_ALL)
+            try:
+                summary = self.project.ingestBatch(batch, stats, self.ingest_timeout, scheduler=self.scheduler)
+            except (SystemExit, Exception) as e:
+                self.fail(path, signature, digest, e)
+                continue
+            status = STATUS_DONE if summary["complete"] else STATUS_PARTIAL if summary["ingested"] else STATUS_FAILED
+            self.finish(path, signature, digest, status, summary)
+
+
+    def fail(self, path: Path, signature: tuple, digest: str, error: BaseException) -> None:
+        # The project methods print their errors before exiting
+        if not isinstance(error, SystemExit):
+            printLocked(Fore.RED + f"[-] Unexpected error on {path.name}: {error}" + Style.RESET_ALL)
+        self.finish(path, signature, digest, STATUS_FAILED)
+
+
+    def finish(self, path: Path, signature: tuple, digest: str, status: str, summary: Optional[dict] = None) -> None:
+        self.state.add(digest, path, signature, status, summary)
+        self.pending.discard(digest)
+        self.queued.discard(signature)
+        color = Fore.GREEN if status == STATUS_DONE else Fore.YELLOW if status == STATUS_PARTIAL else Fore.RED
+        printLocked(color + f"[{'+' if status == STATUS_DONE else '*' if status == STATUS_PARTIAL else '-'}] {path.name} : {status}" + Style.RESET_ALL)
+
+
+    def run(self, once: bool = False) -> None:
+        """
+        Watch the directory until interrupted, or only process the zips already there with once
+        """
+        stages = [threading.Thread(target=self.upload, name="watch-upload", daemon=True),
+                  threading.Thread(target=self.ingest, name="watch-ingest", daemon=True)]
+        for stage in stages:
+            stage.start()
+        print(Fore.YELLOW + f"[*] Watching {self.directory} for SharpHound zips{'' if once else ' (Ctrl+C to stop)'}" + Style.RESET_ALL)
+        try:
+            while True:
+                for path, signature in self.scan(once):
+                    self.validate(path, signature)
+                if once and not self.settling:
+                    break
+                if once:
+                    # Zips copied just before the command are waited for, they may still be written
+                    printLocked(Fore.YELLOW + f"[*] Waiting {self.settling:.0f}s for the recent zips to settle..." + Style.RESET_ALL)
+                    time.sleep(min(self.settling, self.interval) + 0.1)
+                else:
+                    time.sleep(self.interval)
+            self.uploads.put(None)
+            for stage in stages:
+                stage.join()
+        except KeyboardInterrupt:
+            printLocked(Fore.YELLOW + f"[*] Stopped watching, the archives in progress will be processed again on the next run" + Style.RESET_ALL)
@@ -0,0 +1,59 @@
+import json
+
+from typing import List, Optional
+
+
+class StubResponse:
+    def __init__(self, status_code: int, data=None):
+        """
+        Response of the stub API, with the {"data": ...} envelope of BloodHound
+        """
+        self.status_code = status_code
+        self.data = data
+        self.text = json.dumps({"data": data}) if data is not None else ""
+
+
+    def json(self) -> dict:
+        return {"data": self.data}
+
+
+class StubAPI:
+    def __init__(self, responses: Optional[List[StubResponse]] = None, base_url: str = "http://localhost:8080"):
+        """
+        Stands for BloodHoundAPI, answering the requests with the given responses in order and recording them.
+        A response which is an exception is raised instead
+        """
+        self.base_url = base_url
+        self.responses = list(responses or [])
+        self.requests = []
+
+
+    def setPoolSize(self, size: int) -> None:
+        pass
+
+
+    def authorization(self, rejected: Optional[str] = None) -> dict:
+        return {"Authorization": "Bearer stub"}
+
+
+    def request(self, method: str, path: str, **kwargs) -> StubResponse:
+        if kwargs.get("data") is not None and not isinstance(kwargs["data"], bytes):
+            # Streamed bodies are read as they would be sent
+            kwargs["data"] = b"".join(kwargs["data"])
+        self.requests.append((method, path, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+    def get(self, path: str, **kwargs) -> StubResponse:
+        return self.request("GET", path, **kwargs)
+
+
+    def post(self, path: str, **kwargs) -> StubResponse:
+        return self.request("POST", path, **kwargs)
+
+
+    def put(self, path: str, **kwargs) -> StubResponse:
+        return self.request("PUT", path, **kwargs)
@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import requests
+
+from src.cache import datasetKey, zipDigest
+from src.history import HISTORY_FILE, IngestHistory
+from src.manifest import MANIFEST_FILE, IngestManifest
+from src.project import Project
+from tests.stubs import StubAPI, StubResponse
+
+
+class DatasetKeyTest(unittest.TestCase):
+    def test_selection(self):
+        with tempfile.TemporaryDirectory() as directory:
+            zip_file = Path(directory) / "collect.zip"
+            zip_file.write_bytes(b"PK\x05\x06" + b"\x00" * 18)
+            self.assertEqual(datasetKey(str(zip_file)), zipDigest(str(zip_file)))
+            self.assertEqual(datasetKey(str(zip_file), ""), zipDigest(str(zip_file)))
+            selected = datasetKey(str(zip_file), "types=users")
+            self.assertNotEqual(selected, zipDigest(str(zip_file)))
+            self.assertNotEqual(selected, datasetKey(str(zip_file), "types=groups"))
+            self.assertEqual(selected, datasetKey(str(zip_file), "types=users"))
+
+
+    def test_missing_zip(self):
+        with self.assertRaises(OSError):
+            datasetKey("/nonexistent/collect.zip", "types=users")
+
+
+class HoldsDataTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_directory = Path(self.directory.name)
+        (self.source_directory / "project").mkdir()
+        self.project = Project("project", self.source_directory, {"bolt": 7687, "neo4j": 7474, "web": 8080}, "password", 10, False)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def answer(self, *responses) -> StubAPI:
+        self.project._api = StubAPI(list(responses), self.project.base_url)
+        return self.project._api
+
+
+    def test_empty_graph(self):
+        api = self.answer(StubResponse(404))
+        self.assertIs(self.project.holdsData(), False)
+        self.assertEqual(api.requests[0][1], "/api/v2/graphs/cypher")
+
+
+    def test_data_uploaded_elsewhere(self):
+        # Nothing was loaded by this script, but the graph holds nodes, e.g. uploaded through the web interface
+        self.answer(StubResponse(200, {"nodes": {"1": {}}, "edges": []}))
+        self.assertIs(self.project.holdsData(), True)
+
+
+    def test_unknown(self):
+        self.answer(StubResponse(400))
+        self.assertIsNone(self.project.holdsData())
+        self.answer(requests.exceptions.ConnectionError("refused"))
+        self.assertIsNone(self.project.holdsData())
+
+
+    def test_loaded_by_this_script(self):
+        api = self.answer()
+        manifest = IngestManifest(self.source_directory / "project" / MANIFEST_FILE)
+        manifest.add("0" * 64, "users.json", 10)
+        manifest.save()
+        self.assertIs(self.project.holdsData(), True)
+        self.assertEqual(api.requests, [])
+
+
+    def test_history(self):
+        history = IngestHistory(self.source_directory / "project" / HISTORY_FILE)
+        history.recordEvent("restore")
+        self.answer()
+        self.assertIs(self.project.holdsData(), True)
+        # Once cleared, only the server can tell
+        history.recordEvent("clear")
+        self.answer(StubResponse(404))
+        self.assertIs(self.project.holdsData(), False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import codecs
+import json
+import tempfile
+import unittest
+import zipfile
+
+from pathlib import Path
+
+from src.ingest import FilteredMember, IngestFilter, JSONChunk, SharpHoundError, SharpHoundParser, filterMembers, listJSONMembers, metaFromText, splitMember, splitMembers
+
+
+def chunked(content: bytes, size: int):
+    """
+    Cut a document into chunks of size bytes, as read from a zip member
+    """
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+def document(objects: list, meta: dict) -> bytes:
+    return json.dumps({"data": objects, "meta": meta}).encode("utf-8")
+
+
+class SharpHoundParserTest(unittest.TestCase):
+    def parse(self, chunks) -> tuple:
+        parser = SharpHoundParser(chunks)
+        objects = [value for value, _ in parser.entries()]
+        return objects, parser.meta
+
+
+    def test_document(self):
+        objects = [{"ObjectIdentifier": "S-1-5-21-1-2-3-1001", "Properties": {"name": "ALICE@CORP.LOCAL"}}, {"ObjectIdentifier": "S-1-5-21-1-2-3-1002"}]
+        meta = {"type": "users", "version": 6, "count": 2}
+        self.assertEqual(self.parse([document(objects, meta)]), (objects, meta))
+
+
+    def test_raw_text(self):
+        content = b'{"data": [ {"a": 1} ,{"b" : [2, 3]}], "meta": {"count": 2}}'
+        self.assertEqual(list(SharpHoundParser([content]).objects()), ['{"a": 1}', '{"b" : [2, 3]}'])
+
+
+    def test_bom(self):
+        content = codecs.BOM_UTF8 + document([{"a": 1}], {"count": 1})
+        self.assertEqual(self.parse([content]), ([{"a": 1}], {"count": 1}))
+        self.assertEqual(self.parse(chunked(content, 1)), ([{"a": 1}], {"count": 1}))
+
+
+    def test_chunk_boundaries(self):
+        objects = [{"id": 1234567890, "ratio": -12.5e-3, "flag": True, "none": None}, 98765, "text", [1, 22, 333]]
+        content = document(objects, {"count": 4})
+        for size in (1, 2, 3, 7, 64):
+            self.assertEqual(self.parse(chunked(content, size)), (objects, {"count": 4}), size)
+
+
+    def test_number_at_end_of_chunk(self):
+        # A number ending a chunk could go on in the next one
+        self.assertEqual(self.parse([b'{"data":[12', b'34],"meta":{"count":1}}']), ([1234], {"count": 1}))
+
+
+    def test_utf8(self):
+        objects = [{"name": "JOSÉ@CORP.LOCAL", "description": "日本語 \U0001F600", "escaped": "\\u00e9"}]
+        content = json.dumps({"data": objects, "meta": {"count": 1}}, ensure_ascii=False).encode("utf-8")
+        for size in (1, 2, 3, 5):
+            self.assertEqual(self.parse(chunked(content, size)), (objects, {"count": 1}), size)
+
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(SharpHoundError):
+            self.parse([b'{"data":[{"name":"\xff\xfe"}]}'])
+
+
+    def test_empty_documents(self):
+        self.assertEqual(self.parse([b"{}"]), ([], None))
+        self.assertEqual(self.parse([b'{"data": [], "meta": {"count": 0}}']), ([], {"count": 0}))
+        self.assertEqual(self.parse([b' \r\n{ "meta" : {"count": 0} , "data" : [ ] }\n']), ([], {"count": 0}))
+
+
+    def test_meta_before_data(self):
+        self.assertEqual(self.parse([b'{"meta":{"count":1},"data":[{"a":1}]}']), ([{"a": 1}], {"count": 1}))
+
+
+    def test_empty_stream(self):
+        with self.assertRaises(SharpHoundError):
+            self.parse([])
+        with self.assertRaises(SharpHoundError):
+            self.parse([b""])
+
+
+    def test_truncated(self):
+        content = document([{"a": "x" * 100}, {"b": 2}], {"count": 2})
+        for end in (1, 10, 30, len(content) - 20, len(content) - 1):
+            with self.assertRaises(SharpHoundError, msg=end):
+                self.parse(chunked(content[:end], 7))
+
+
+    def test_trailing_garbage(self):
+        with self.assertRaises(SharpHoundError):
+            self.parse([b'{"data":[],"meta":{"count":0}}x'])
+        with self.assertRaises(SharpHoundError):
+            self.parse([b'{"data":[],"meta":{"count":0}}', b'{}'])
+
+
+    def test_malformed(self):
+        for content in (b"[]", b'{"data":{}}', b'{"data":[1,]}', b'{"data":[1 2]}', b'{"data":[1]'):
+            with self.assertRaises(SharpHoundError, msg=content):
+                self.parse([content])
+
+
+class MetaTest(unittest.TestCase):
+    def test_meta_from_text(self):
+        self.assertEqual(metaFromText('}], "meta": {"type": "users", "count": 2}}'), {"type": "users", "count": 2})
+        self.assertEqual(metaFromText('{"meta": {"type": "users"}} ... "meta" : {"type": "groups"}}'), {"type": "groups"})
+        self.assertIsNone(metaFromText('"name": "meta", "x": 1'))
+
+
+class SplitTest(unittest.TestCase):
+    def setUp(self):
+        self.objects = [{"ObjectIdentifier": f"S-1-5-21-1-2-3-{rid}", "Properties": {"name": f"USER{rid}"}} for rid in range(1000, 1025)]
+        self.meta = {"type": "users", "version": 6, "count": len(self.objects)}
+        self.member = JSONChunk("20240101000000_users.json", document(self.objects, self.meta), len(self.objects))
+
+
+    def documents(self, chunks) -> list:
+        return [json.loads(b"".join(chunk.stream())) for chunk in chunks]
+
+
+    def test_split_by_objects(self):
+        chunks = list(splitMember(self.member, self.meta, 10, None))
+        documents = self.documents(chunks)
+        self.assertEqual([chunk.name for chunk in chunks], [f"20240101000000_users_part{i:04d}.json" for i in (1, 2, 3)])
+        self.assertEqual([len(doc["data"]) for doc in documents], [10, 10, 5])
+        self.assertEqual([doc["meta"] for doc in documents], [dict(self.meta, count=count) for count in (10, 10, 5)])
+        self.assertEqual(sum((doc["data"] for doc in documents), []), self.objects)
+
+
+    def test_split_by_bytes(self):
+        max_bytes = 300
+        documents = self.documents(splitMember(self.member, self.meta, None, max_bytes))
+        self.assertGreater(len(documents), 1)
+        self.assertEqual(sum((doc["data"] for doc in documents), []), self.objects)
+        for doc in documents:
+            self.assertEqual(doc["meta"]["count"], len(doc["data"]))
+            self.assertLessEqual(len(json.dumps(doc["data"], separators=(",", ":"))), max_bytes)
+
+
+    def test_split_empty(self):
+        member = JSONChunk("20240101000000_gpos.json", document([], {"type": "gpos", "count": 0}), 0)
+        documents = self.documents(splitMember(member, {"type": "gpos", "count": 0}, 10, None))
+        self.assertEqual(documents, [{"data": [], "meta": {"type": "gpos", "count": 0}}])
+
+
+    def test_split_members(self):
+        with tempfile.TemporaryDirectory() as directory:
+            zip_file = str(Path(directory) / "collect.zip")
+            with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+                zip_ref.writestr("20240101000000_domains.json", document([{"a": 1}], {"type": "domains", "count": 1}))
+                zip_ref.writestr("20240101000000_users.json", self.member.content)
+            small, big = listJSONMembers(zip_file)
+            files = list(splitMembers([small, big], 10, None))
+            self.assertIs(files[0], small)
+            self.assertEqual(sum((doc["data"] for doc in self.documents(files[1:])), []), self.objects)
+            self.assertEqual(list(splitMembers([small, big], None, None)), [small, big])
+            self.assertEqual(list(splitMembers([small, big], 100, None)), [small, big])
+
+
+class FilterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.zip_file = str(Path(self.directory.name) / "collect.zip")
+        self.objects = [{"ObjectIdentifier": "S-1-5-21-1-2-3-1001", "Properties": {"domain": "CORP.LOCAL"}},
+                        {"ObjectIdentifier": "S-1-5-21-4-5-6-1001", "Properties": {"domain": "OTHER.LOCAL"}}]
+        with zipfile.ZipFile(self.zip_file, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("20240101000000_users.json", document(self.objects, {"type": "users", "count": 2}))
+            zip_ref.writestr("20240101000000_broken.json", b'{"data":[{"a":1}]}')
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_filtered_member(self):
+        users, _ = listJSONMembers(self.zip_file)
+        member = FilteredMember(users, None, IngestFilter(domains=["corp.local"]))
+        self.assertEqual(json.loads(b"".join(member.stream())), {"data": self.objects[:1], "meta": {"type": "users", "count": 1}})
+        # The digest checked before the upload is the one recorded after it, without parsing the file
+        self.assertEqual(member.upload_digest, member.digest())
+        self.assertNotEqual(member.digest(), FilteredMember(users, None, IngestFilter(domains=["OTHER.LOCAL"])).digest())
+        self.assertEqual(member.signature(), f"{users.signature()}:domains=CORP.LOCAL")
+
+
+    def test_no_meta(self):
+        _, broken = listJSONMembers(self.zip_file)
+        member = next(filterMembers([broken], IngestFilter(domains=["CORP.LOCAL"])))
+        with self.assertRaises(SharpHoundError):
+            b"".join(member.stream())
+        self.assertIsNone(member.upload_digest)
+        with self.assertRaises(SharpHoundError):
+            list(filterMembers([broken], IngestFilter(types=["users"])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import tempfile
+import unittest
+import zipfile
+
+from pathlib import Path
+from unittest import mock
+
+from src.ingest import ZipMember, listJSONMembers
+from src.manifest import MANIFEST_FILE, MANIFEST_VERSION, IngestManifest
+from src.project import Project
+from src.tracker import UploadBatch, UploadStats
+from tests.stubs import StubAPI, StubResponse
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / MANIFEST_FILE
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_signatures(self):
+        manifest = IngestManifest(self.path)
+        self.assertFalse(manifest.mayContain("0000abcd:10"))
+        # Files without a zip member signature always have their hash checked
+        self.assertTrue(manifest.mayContain(None))
+        manifest.add("a" * 64, "users.json", 10, "0000abcd:10")
+        manifest.save()
+        manifest = IngestManifest(self.path)
+        self.assertTrue(manifest.mayContain("0000abcd:10"))
+        self.assertFalse(manifest.mayContain("0000abcd:11"))
+        self.assertIn("a" * 64, manifest)
+
+
+    def test_legacy(self):
+        # Entries recorded without signatures can only be matched by their hash
+        with open(self.path, "w") as manifest_file:
+            json.dump({"version": MANIFEST_VERSION, "files": {"a" * 64: {"name": "users.json", "size": 10}}}, manifest_file)
+        manifest = IngestManifest(self.path)
+        self.assertTrue(manifest.mayContain("0000abcd:10"))
+
+
+    def test_reset(self):
+        manifest = IngestManifest(self.path)
+        manifest.add("a" * 64, "users.json", 10, "0000abcd:10")
+        manifest.save()
+        manifest.reset()
+        self.assertFalse(self.path.exists())
+        self.assertFalse(manifest.mayContain("0000abcd:10"))
+        self.assertNotIn("a" * 64, manifest)
+
+
+class SkipTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        source_directory = Path(self.directory.name)
+        self.zip_file = str(source_directory / "collect.zip")
+        with zipfile.ZipFile(self.zip_file, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("20240101000000_users.json", b'{"data":[{"a":1}],"meta":{"type":"users","count":1}}')
+            zip_ref.writestr("20240101000000_groups.json", b'{"data":[{"b":2}],"meta":{"type":"groups","count":1}}')
+        self.project = Project("project", source_directory, {"bolt": 7687, "neo4j": 7474, "web": 8080}, "password", 10, False)
+        self.manifest = IngestManifest(source_directory / MANIFEST_FILE)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def upload(self, member: ZipMember) -> bool:
+        """
+        Return True when the file is skipped. The server refuses the batch, so a file which is not skipped fails to upload
+        """
+        return self.project.uploadFile(UploadBatch(StubAPI([StubResponse(403)])), member, UploadStats(), self.manifest)
+
+
+    def test_skip_by_signature(self):
+        users, groups = listJSONMembers(self.zip_file)
+        self.manifest.add(users.digest(), users.name, users.size, users.signature())
+        with mock.patch.object(ZipMember, "digest", autospec=True, side_effect=ZipMember.digest) as digest:
+            self.assertTrue(self.upload(users))
+            # Only the member matching an ingested signature is hashed
+            self.assertEqual([call.args[0].name for call in digest.call_args_list], [users.name])
+            self.assertFalse(self.upload(groups))
+            self.assertEqual(digest.call_count, 1)
+
+
+    def test_same_signature_other_content(self):
+        users, _ = listJSONMembers(self.zip_file)
+        self.manifest.add("f" * 64, users.name, users.size, users.signature())
+        self.assertFalse(self.upload(users))
+
+
+if __name__ == "__main__":
+    unittest.main()
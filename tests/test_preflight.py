@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+import zipfile
+
+from pathlib import Path
+
+from src.ingest import IngestFilter
+from src.preflight import inspectZip
+
+USERS = b'{"data":[{"ObjectIdentifier":"S-1-5-21-1-2-3-1001"}],"meta":{"type":"users","version":6,"count":1}}'
+# Malformed data array, but a readable meta block
+BROKEN_GPOS = b'{"data":[{"a":1},],"meta":{"type":"gpos","version":6,"count":1}}'
+# Truncated before its meta block, the type of the file cannot be known
+TRUNCATED = b'{"data":[{"a":1},{"b"'
+
+
+class SelectionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def inspect(self, members: dict, ingest_filter=None) -> dict:
+        zip_file = str(Path(self.directory.name) / "collect.zip")
+        with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            for name, content in members.items():
+                zip_ref.writestr(name, content)
+        return inspectZip(zip_file, ingest_filter)
+
+
+    def test_valid(self):
+        report = self.inspect({"20240101000000_users.json": USERS})
+        self.assertEqual((report["errors"], report["objects"]), (0, 1))
+
+
+    def test_errors_of_the_uploaded_files(self):
+        members = {"20240101000000_users.json": USERS, "20240101000000_gpos.json": BROKEN_GPOS}
+        self.assertEqual(self.inspect(members)["errors"], 1)
+        report = self.inspect(members, IngestFilter(types=["gpos"]))
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual([file["skipped"] for file in report["files"]], [True, False])
+        self.assertEqual(self.inspect(members, IngestFilter(domains=["CORP.LOCAL"]))["errors"], 1)
+
+
+    def test_errors_of_the_skipped_files(self):
+        members = {"20240101000000_users.json": USERS, "20240101000000_gpos.json": BROKEN_GPOS}
+        for ingest_filter in (IngestFilter(types=["users"]), IngestFilter(exclude_types=["gpos"])):
+            report = self.inspect(members, ingest_filter)
+            self.assertEqual(report["errors"], 0)
+            gpos = next(file for file in report["files"] if file["name"] == "20240101000000_gpos.json")
+            self.assertEqual((gpos["skipped"], gpos["selected"]), (True, 0))
+            self.assertEqual(len(gpos["warnings"]), 1)
+            self.assertEqual(report["upload_objects"], 1)
+
+
+    def test_unknown_type(self):
+        # The upload could not tell whether the file is selected either, it fails on it
+        report = self.inspect({"20240101000000_users.json": USERS, "20240101000000_gpos.json": TRUNCATED}, IngestFilter(types=["users"]))
+        self.assertEqual(report["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
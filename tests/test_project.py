@@ -0,0 +1,23 @@
+import pickle
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from src.project import Project
+
+
+class PickleTest(unittest.TestCase):
+    def test_older_projects(self):
+        with tempfile.TemporaryDirectory() as directory:
+            project = Project("project", Path(directory), {"bolt": 7687, "neo4j": 7474, "web": 8080}, "password", 10, False)
+            # Attributes a project saved by an older version does not have
+            for name in ("memory", "jwt_expiry"):
+                del project.__dict__[name]
+            project = pickle.loads(pickle.dumps(project))
+            self.assertIsNone(project.memory)
+            self.assertEqual(project.jwt_expiry, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from src.scheduler import QUEUE_FILE, IngestScheduler
+
+GB = 1024 ** 3
+
+
+def entry(name: str, priority: int = 0, enqueued_at: float = 0, admitted_at=None, memory: int = 2 * GB, estimate: float = 0) -> dict:
+    return {"id": name, "project": name, "pid": os.getpid(), "priority": priority, "memory": memory, "estimate": estimate,
+            "enqueued_at": enqueued_at, "admitted_at": admitted_at}
+
+
+class AdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_slots(self):
+        scheduler = IngestScheduler(Path(self.directory.name), slots=2)
+        self.assertTrue(scheduler.admissible(entry("a"), []))
+        self.assertTrue(scheduler.admissible(entry("b"), [entry("a")]))
+        self.assertFalse(scheduler.admissible(entry("c"), [entry("a"), entry("b")]))
+
+
+    def test_memory_budget(self):
+        scheduler = IngestScheduler(Path(self.directory.name), slots=4, memory_budget=10 * GB)
+        # A lone ingestion is admitted even when it exceeds the budget
+        self.assertTrue(scheduler.admissible(entry("a", memory=16 * GB), []))
+        self.assertTrue(scheduler.admissible(entry("b", memory=4 * GB), [entry("a", memory=6 * GB)]))
+        self.assertFalse(scheduler.admissible(entry("b", memory=5 * GB), [entry("a", memory=6 * GB)]))
+
+
+    def test_waiting_order(self):
+        scheduler = IngestScheduler(Path(self.directory.name))
+        entries = [entry("a", enqueued_at=1), entry("b", enqueued_at=2, priority=1), entry("c", enqueued_at=0), entry("d", admitted_at=0)]
+        self.assertEqual([waiting["id"] for waiting in scheduler.waiting(entries)], ["b", "c", "a"])
+
+
+    def test_estimate(self):
+        scheduler = IngestScheduler(Path(self.directory.name), slots=1)
+        now = time.time()
+        entries = [entry("a", admitted_at=now, estimate=100), entry("b", enqueued_at=1, estimate=50), entry("c", enqueued_at=2, estimate=10)]
+        self.assertAlmostEqual(scheduler.estimate(entries, "b"), 100, delta=1)
+        self.assertAlmostEqual(scheduler.estimate(entries, "c"), 150, delta=1)
+
+
+@mock.patch("src.scheduler.POLL_INTERVAL", 0.01)
+class SlotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_directory = Path(self.directory.name)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def queue(self) -> list:
+        with open(self.source_directory / QUEUE_FILE, "r") as queue_file:
+            return json.load(queue_file)
+
+
+    def test_one_slot(self):
+        scheduler = IngestScheduler(self.source_directory, slots=1)
+        events = []
+
+        def second() -> None:
+            with scheduler.slot("b"):
+                events.append("b admitted")
+
+        with scheduler.slot("a") as waited:
+            self.assertLess(waited, 1)
+            thread = threading.Thread(target=second)
+            thread.start()
+            time.sleep(0.1)
+            # The second ingestion is queued behind the running one
+            self.assertEqual([(other["project"], other["admitted_at"] is not None) for other in self.queue()], [("a", True), ("b", False)])
+            events.append("a released")
+        thread.join(5)
+        self.assertEqual(events, ["a released", "b admitted"])
+        self.assertEqual(self.queue(), [])
+
+
+    def test_dead_entries(self):
+        # The slot held by an interrupted invocation is given back
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        dead = dict(entry("dead", admitted_at=time.time()), pid=process.pid)
+        with open(self.source_directory / QUEUE_FILE, "w") as queue_file:
+            json.dump([dead], queue_file)
+        with IngestScheduler(self.source_directory, slots=1).slot("a") as waited:
+            self.assertLess(waited, 1)
+            self.assertEqual([other["project"] for other in self.queue()], ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
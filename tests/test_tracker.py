@@ -0,0 +1,172 @@
+import unittest
+
+from unittest import mock
+
+import gzip
+import hashlib
+import json
+import tempfile
+
+from pathlib import Path
+
+import requests
+
+from src.api import APIError
+from src.compression import ENCODING_GZIP, ENCODING_NONE, ENCODING_ZIP
+from src.ingest import JSONChunk
+from src.project import Project
+from src.tracker import JOB_COMPLETE, JOB_FAILED, JOB_PARTIALLY_COMPLETE, IngestTracker, UploadBatch, UploadStats
+from tests.stubs import StubAPI, StubResponse
+
+RUNNING = 1
+
+
+def jobs(*statuses) -> list:
+    """
+    Listing of the upload jobs, the latest first, the tracked job having the id 7
+    """
+    return [{"id": 8, "status": RUNNING}] + [{"id": 7, "status": status} for status in statuses]
+
+
+class GetJobTest(unittest.TestCase):
+    def test_filtered(self):
+        api = StubAPI([StubResponse(200, jobs(RUNNING)[1:])])
+        self.assertEqual(IngestTracker(api, 7, 0).getJob(), {"id": 7, "status": RUNNING})
+        self.assertEqual(api.requests[0][1], "/api/v2/file-upload?id=eq:7")
+
+
+    def test_filter_refused(self):
+        # Servers refusing the filter on the id are asked for the latest jobs instead, from then on
+        api = StubAPI([StubResponse(400), StubResponse(200, jobs(RUNNING)), StubResponse(200, jobs(JOB_COMPLETE))])
+        tracker = IngestTracker(api, 7, 0)
+        self.assertEqual(tracker.getJob(), {"id": 7, "status": RUNNING})
+        self.assertEqual(tracker.getJob(), {"id": 7, "status": JOB_COMPLETE})
+        self.assertEqual([path for _, path, _ in api.requests],
+                         ["/api/v2/file-upload?id=eq:7", "/api/v2/file-upload?sort_by=-id", "/api/v2/file-upload?sort_by=-id"])
+
+
+    def test_rejected(self):
+        api = StubAPI([StubResponse(400), StubResponse(403)])
+        with self.assertRaises(APIError) as context:
+            IngestTracker(api, 7, 0).getJob()
+        self.assertEqual(context.exception.response.status_code, 403)
+
+
+    def test_unavailable(self):
+        self.assertIsNone(IngestTracker(StubAPI([StubResponse(503)]), 7, 0).getJob())
+        self.assertIsNone(IngestTracker(StubAPI([StubResponse(200, [])]), 7, 0).getJob())
+
+
+@mock.patch("src.tracker.time.sleep")
+class WaitTest(unittest.TestCase):
+    def test_terminal_statuses(self, sleep):
+        for status in (JOB_COMPLETE, JOB_FAILED, JOB_PARTIALLY_COMPLETE):
+            api = StubAPI([StubResponse(200, jobs(RUNNING)[1:]), StubResponse(200, jobs(status)[1:])])
+            self.assertEqual(IngestTracker(api, 7, 0).wait(), {"id": 7, "status": status})
+        self.assertEqual(len(api.requests), 2)
+
+
+    def test_transient_errors(self, sleep):
+        api = StubAPI([StubResponse(503), requests.exceptions.ConnectionError("reset"), StubResponse(200, jobs(JOB_COMPLETE)[1:])])
+        self.assertEqual(IngestTracker(api, 7, 0).wait(), {"id": 7, "status": JOB_COMPLETE})
+        # The polling slows down between the attempts
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(delays, sorted(delays))
+        self.assertGreater(delays[-1], delays[0])
+
+
+    def test_rejected(self, sleep):
+        api = StubAPI([StubResponse(401), StubResponse(401)])
+        with self.assertRaises(APIError):
+            IngestTracker(api, 7, 0).wait()
+        sleep.assert_not_called()
+
+
+    def test_timeout(self, sleep):
+        api = StubAPI([StubResponse(200, jobs(RUNNING)[1:]) for _ in range(10)])
+        self.assertIsNone(IngestTracker(api, 7, 1).wait())
+        # The clock is frozen, the last wait would have exceeded the timeout
+        self.assertLessEqual(max(call.args[0] for call in sleep.call_args_list), 1)
+        self.assertLess(len(api.requests), 10)
+
+
+class UploadBatchTest(unittest.TestCase):
+    def test_start(self):
+        api = StubAPI([StubResponse(201, {"id": 7})])
+        batch = UploadBatch(api)
+        self.assertEqual(batch.start(), 7)
+        # Started once, by the first file needing it
+        self.assertEqual(batch.start(), 7)
+        self.assertEqual(len(api.requests), 1)
+        self.assertIsNone(UploadBatch(StubAPI([StubResponse(403)])).start())
+
+
+    def test_default_encoding(self):
+        batch = UploadBatch(StubAPI())
+        batch.reject(ENCODING_NONE)
+        self.assertEqual(batch.encoding(), ENCODING_NONE)
+        self.assertEqual(UploadBatch(StubAPI()).encodings, [ENCODING_NONE])
+
+
+    def test_reject(self):
+        batch = UploadBatch(StubAPI(), [ENCODING_ZIP, ENCODING_GZIP, ENCODING_NONE])
+        self.assertEqual(batch.encoding(), ENCODING_ZIP)
+        batch.reject(ENCODING_ZIP)
+        batch.reject(ENCODING_ZIP)
+        self.assertEqual(batch.encoding(), ENCODING_GZIP)
+        batch.reject(ENCODING_GZIP)
+        # Uncompressed json is never given up
+        batch.reject(ENCODING_NONE)
+        self.assertEqual(batch.encoding(), ENCODING_NONE)
+
+
+    def test_upload_fallback(self):
+        content = json.dumps({"data": [{"a": 1}], "meta": {"type": "users", "count": 1}}).encode()
+        api = StubAPI([StubResponse(201, {"id": 7}), StubResponse(415), StubResponse(202)])
+        batch = UploadBatch(api, [ENCODING_GZIP, ENCODING_NONE])
+        with tempfile.TemporaryDirectory() as directory:
+            project = Project("project", Path(directory), {"bolt": 7687, "neo4j": 7474, "web": 8080}, "password", 10, False)
+            self.assertTrue(project.uploadFile(batch, JSONChunk("users.json", content, 1), UploadStats(), None))
+        (_, _, compressed), (_, _, plain) = api.requests[1:]
+        self.assertEqual(compressed["headers"].get("Content-Encoding"), "gzip")
+        self.assertEqual(gzip.decompress(compressed["data"]), content)
+        # The file is sent again right away, uncompressed, and so are the next ones
+        self.assertNotIn("Content-Encoding", plain["headers"])
+        self.assertEqual(plain["data"], content)
+        self.assertEqual(batch.encoding(), ENCODING_NONE)
+        self.assertEqual(list(batch.uploaded), [hashlib.sha256(content).hexdigest()])
+
+
+class AbandonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        (Path(self.directory.name) / "project").mkdir()
+        self.project = Project("project", Path(self.directory.name), {"bolt": 7687, "neo4j": 7474, "web": 8080}, "password", 10, False)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def upload(self, responses: list, files: list) -> StubAPI:
+        self.project._api = StubAPI(responses, self.project.base_url)
+        with mock.patch("src.project.UPLOAD_RETRIES", 1), self.assertRaises(SystemExit):
+            self.project.uploadFiles(files, workers=1)
+        return self.project._api
+
+
+    def test_failed_upload(self):
+        # The batch is ended instead of being left open on the server when a file fails
+        files = [JSONChunk("users.json", b'{"data":[],"meta":{"count":0}}', 0), JSONChunk("groups.json", b'{"data":[],"meta":{"count":0}}', 0)]
+        api = self.upload([StubResponse(201, {"id": 7}), StubResponse(202), StubResponse(400), StubResponse(200)], files)
+        self.assertEqual(api.requests[-1][1], "/api/v2/file-upload/7/end")
+        self.assertTrue(self.project.holdsData())
+
+
+    def test_nothing_started(self):
+        api = self.upload([StubResponse(403)], [JSONChunk("users.json", b'{"data":[],"meta":{"count":0}}', 0)])
+        self.assertEqual([path for _, path, _ in api.requests], ["/api/v2/file-upload/start"])
+
+
+if __name__ == "__main__":
+    unittest.main()